@@ -0,0 +1,85 @@
+"""Initial schema
+
+Databases created before migrations were introduced already have these tables:
+mark them with `alembic stamp 3f1c2a9b7d10` instead of upgrading.
+
+Revision ID: 3f1c2a9b7d10
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f1c2a9b7d10"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+role_enum = postgresql.ENUM(
+    "user", "admin", "moderator", "guest", name="role_enum", create_type=False
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    role_enum.create(op.get_bind(), checkfirst=True)
+
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(50), nullable=False, unique=True),
+        sa.Column("hashed_password", sa.String(128), nullable=False),
+    )
+    op.create_table(
+        "user_info",
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("full_name", sa.String(100)),
+        sa.Column("email", sa.String(100), unique=True),
+    )
+    op.create_table(
+        "user_roles",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("user_role", role_enum, nullable=False),
+        sa.UniqueConstraint("user_id", "user_role", name="uq_user_role_pair"),
+    )
+    op.create_table(
+        "things_to_do",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String(255), nullable=False),
+        sa.Column("description", sa.String(500), nullable=False),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("completed", sa.Boolean(), nullable=False, server_default=sa.text("false")),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column("completed_at", sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("things_to_do")
+    op.drop_table("user_roles")
+    op.drop_table("user_info")
+    op.drop_table("users")
+    role_enum.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,63 @@
+"""Full-text and trigram search over notes
+
+Revision ID: 8b42e6d1c5a3
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-18 10:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8b42e6d1c5a3"
+down_revision: Union[str, Sequence[str], None] = "3f1c2a9b7d10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same expression as app.database.models.NOTE_SEARCH_VECTOR (frozen for this revision)
+NOTE_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Stored generated column: rewrites the table once, then Postgres keeps it up to date
+    op.add_column(
+        "things_to_do",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(NOTE_SEARCH_VECTOR, persisted=True),
+        ),
+    )
+    # Build the indexes without blocking writes on the big table
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_things_to_do_search_vector",
+            "things_to_do",
+            ["search_vector"],
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_things_to_do_title_trgm",
+            "things_to_do",
+            ["title"],
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_things_to_do_title_trgm", table_name="things_to_do")
+    op.drop_index("ix_things_to_do_search_vector", table_name="things_to_do")
+    op.drop_column("things_to_do", "search_vector")
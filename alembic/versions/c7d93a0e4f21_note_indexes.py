@@ -0,0 +1,63 @@
+"""Indexes for hot note predicates
+
+user_roles.user_id needs no separate index: uq_user_role_pair (user_id, user_role) leads with it.
+
+Revision ID: c7d93a0e4f21
+Revises: 8b42e6d1c5a3
+Create Date: 2026-10-18 10:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c7d93a0e4f21"
+down_revision: Union[str, Sequence[str], None] = "8b42e6d1c5a3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        # Per-user listings ordered by id (my_notes, keyset pages, ownership-scoped exports)
+        op.create_index(
+            "ix_things_to_do_user_id_id",
+            "things_to_do",
+            ["user_id", "id"],
+            postgresql_concurrently=True,
+        )
+        # Per-user date ranges
+        op.create_index(
+            "ix_things_to_do_user_id_created_at",
+            "things_to_do",
+            ["user_id", "created_at"],
+            postgresql_concurrently=True,
+        )
+        # Global date ranges and sort_by=created_at keyset pages
+        op.create_index(
+            "ix_things_to_do_created_at_id",
+            "things_to_do",
+            ["created_at", "id"],
+            postgresql_concurrently=True,
+        )
+        # Completion analytics read only completed notes: index-only scans over this one
+        op.create_index(
+            "ix_things_to_do_completed_at",
+            "things_to_do",
+            ["completed_at"],
+            postgresql_where=sa.text("completed"),
+            postgresql_include=["created_at"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_things_to_do_completed_at", table_name="things_to_do")
+    op.drop_index("ix_things_to_do_created_at_id", table_name="things_to_do")
+    op.drop_index("ix_things_to_do_user_id_created_at", table_name="things_to_do")
+    op.drop_index("ix_things_to_do_user_id_id", table_name="things_to_do")
@@ -0,0 +1,184 @@
+"""Trigger-maintained note rollups for /notes/analytics
+
+Statement-level triggers with transition tables fold every INSERT/UPDATE/DELETE on
+things_to_do into per-user rows and a global row (user_id 0). Creating the triggers
+locks things_to_do against writes until the migration commits, so the backfill sees
+a consistent table.
+
+Revision ID: d4e8b1f2a6c9
+Revises: c7d93a0e4f21
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d4e8b1f2a6c9"
+down_revision: Union[str, Sequence[str], None] = "c7d93a0e4f21"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Applies removed (-1) and added (+1) notes to both rollup tables in one upsert each.
+# Rows are upserted in key order so concurrent statements lock them in the same order.
+APPLY_FUNCTION = """
+CREATE FUNCTION note_rollups_apply(removed things_to_do[], added things_to_do[])
+RETURNS void LANGUAGE sql AS $$
+    INSERT INTO note_rollups AS r (user_id, total, completed, timed_completed, completion_seconds)
+    SELECT
+        scope.user_id,
+        sum(c.sign),
+        coalesce(sum(c.sign) FILTER (WHERE c.completed), 0),
+        coalesce(sum(c.sign) FILTER (WHERE c.completed AND c.completed_at IS NOT NULL), 0),
+        coalesce(
+            sum(c.sign * extract(EPOCH FROM c.completed_at - c.created_at))
+                FILTER (WHERE c.completed AND c.completed_at IS NOT NULL),
+            0
+        )
+    FROM (
+        SELECT n.*, -1 AS sign FROM unnest(removed) AS n
+        UNION ALL
+        SELECT n.*, 1 AS sign FROM unnest(added) AS n
+    ) AS c
+    CROSS JOIN LATERAL (VALUES (c.user_id), (0)) AS scope(user_id)
+    GROUP BY scope.user_id
+    ORDER BY scope.user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        total = r.total + EXCLUDED.total,
+        completed = r.completed + EXCLUDED.completed,
+        timed_completed = r.timed_completed + EXCLUDED.timed_completed,
+        completion_seconds = r.completion_seconds + EXCLUDED.completion_seconds;
+
+    INSERT INTO note_hourly_rollups AS r (user_id, hour_of_week, created)
+    SELECT scope.user_id, c.hour_of_week, sum(c.sign)
+    FROM (
+        SELECT n.user_id, n.created_at, -1 AS sign FROM unnest(removed) AS n
+        UNION ALL
+        SELECT n.user_id, n.created_at, 1 AS sign FROM unnest(added) AS n
+    ) AS changes
+    CROSS JOIN LATERAL (
+        SELECT
+            changes.user_id,
+            changes.sign,
+            (extract(DOW FROM changes.created_at) * 24 + extract(HOUR FROM changes.created_at))::smallint
+                AS hour_of_week
+    ) AS c
+    CROSS JOIN LATERAL (VALUES (c.user_id), (0)) AS scope(user_id)
+    GROUP BY scope.user_id, c.hour_of_week
+    HAVING sum(c.sign) <> 0
+    ORDER BY scope.user_id, c.hour_of_week
+    ON CONFLICT (user_id, hour_of_week) DO UPDATE SET created = r.created + EXCLUDED.created;
+$$
+"""
+
+# Transition table rows are plain records, hence the casts back to things_to_do.
+# Updates only count when a column the rollups depend on changed.
+TRIGGER_FUNCTION = """
+CREATE FUNCTION note_rollups_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM note_rollups_apply(
+            '{}'::things_to_do[], ARRAY(SELECT n::things_to_do FROM new_notes AS n)
+        );
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM note_rollups_apply(
+            ARRAY(SELECT o::things_to_do FROM old_notes AS o), '{}'::things_to_do[]
+        );
+    ELSE
+        PERFORM note_rollups_apply(
+            ARRAY(
+                SELECT o::things_to_do FROM old_notes AS o JOIN new_notes AS n ON n.id = o.id
+                WHERE (o.user_id, o.completed, o.completed_at, o.created_at)
+                    IS DISTINCT FROM (n.user_id, n.completed, n.completed_at, n.created_at)
+            ),
+            ARRAY(
+                SELECT n::things_to_do FROM new_notes AS n JOIN old_notes AS o ON o.id = n.id
+                WHERE (o.user_id, o.completed, o.completed_at, o.created_at)
+                    IS DISTINCT FROM (n.user_id, n.completed, n.completed_at, n.created_at)
+            )
+        );
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+TRIGGERS = {
+    "things_to_do_rollups_insert": ("INSERT", "NEW TABLE AS new_notes"),
+    "things_to_do_rollups_update": ("UPDATE", "OLD TABLE AS old_notes NEW TABLE AS new_notes"),
+    "things_to_do_rollups_delete": ("DELETE", "OLD TABLE AS old_notes"),
+}
+
+BACKFILL_ROLLUPS = """
+INSERT INTO note_rollups (user_id, total, completed, timed_completed, completion_seconds)
+SELECT
+    coalesce(user_id, 0),
+    count(*),
+    count(*) FILTER (WHERE completed),
+    count(*) FILTER (WHERE completed AND completed_at IS NOT NULL),
+    coalesce(
+        sum(extract(EPOCH FROM completed_at - created_at))
+            FILTER (WHERE completed AND completed_at IS NOT NULL),
+        0
+    )
+FROM things_to_do
+GROUP BY GROUPING SETS ((user_id), ())
+"""
+
+BACKFILL_HOURLY_ROLLUPS = """
+INSERT INTO note_hourly_rollups (user_id, hour_of_week, created)
+SELECT coalesce(user_id, 0), hour_of_week, count(*)
+FROM things_to_do
+CROSS JOIN LATERAL (
+    SELECT (extract(DOW FROM created_at) * 24 + extract(HOUR FROM created_at))::smallint
+        AS hour_of_week
+) AS h
+GROUP BY GROUPING SETS ((user_id, hour_of_week), (hour_of_week))
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "note_rollups",
+        sa.Column("user_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("total", sa.BigInteger(), server_default=sa.text("0"), nullable=False),
+        sa.Column("completed", sa.BigInteger(), server_default=sa.text("0"), nullable=False),
+        sa.Column(
+            "timed_completed", sa.BigInteger(), server_default=sa.text("0"), nullable=False
+        ),
+        sa.Column(
+            "completion_seconds", sa.Double(), server_default=sa.text("0"), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.create_table(
+        "note_hourly_rollups",
+        sa.Column("user_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("hour_of_week", sa.SmallInteger(), autoincrement=False, nullable=False),
+        sa.Column("created", sa.BigInteger(), server_default=sa.text("0"), nullable=False),
+        sa.PrimaryKeyConstraint("user_id", "hour_of_week"),
+    )
+    op.execute(APPLY_FUNCTION)
+    op.execute(TRIGGER_FUNCTION)
+    for name, (event, transition_tables) in TRIGGERS.items():
+        op.execute(
+            f"CREATE TRIGGER {name} AFTER {event} ON things_to_do "
+            f"REFERENCING {transition_tables} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION note_rollups_trigger()"
+        )
+    op.execute(BACKFILL_ROLLUPS)
+    op.execute(BACKFILL_HOURLY_ROLLUPS)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER {name} ON things_to_do")
+    op.execute("DROP FUNCTION note_rollups_trigger()")
+    op.execute("DROP FUNCTION note_rollups_apply(things_to_do[], things_to_do[])")
+    op.drop_table("note_hourly_rollups")
+    op.drop_table("note_rollups")
@@ -0,0 +1,53 @@
+"""Indexes for the admin user directory
+
+Trigram indexes serve substring search (ILIKE '%...%') over username, email and
+full name; (user_role, user_id) serves role-filtered pages in id order.
+
+Revision ID: e5f7a9c1b3d8
+Revises: d4e8b1f2a6c9
+Create Date: 2026-10-18 11:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e5f7a9c1b3d8"
+down_revision: Union[str, Sequence[str], None] = "d4e8b1f2a6c9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGRAM_INDEXES = (
+    ("ix_users_username_trgm", "users", "username"),
+    ("ix_user_info_email_trgm", "user_info", "email"),
+    ("ix_user_info_full_name_trgm", "user_info", "full_name"),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        for name, table, column in TRIGRAM_INDEXES:
+            op.create_index(
+                name,
+                table,
+                [column],
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+                postgresql_concurrently=True,
+            )
+        op.create_index(
+            "ix_user_roles_user_role_user_id",
+            "user_roles",
+            ["user_role", "user_id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_user_roles_user_role_user_id", table_name="user_roles")
+    for name, table, _ in reversed(TRIGRAM_INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,155 @@
+"""Shard the global note rollups
+
+Every note write used to update the single global row (user_id 0) of note_rollups and
+the global row of its hour in note_hourly_rollups, so concurrent writes of different
+users queued on those row locks. The global rows are now split into ROLLUP_SHARDS slots,
+picked by the writing transaction's id and summed on read. Per-user rows stay in slot 0.
+
+Revision ID: f2b6d8e4a1c7
+Revises: e5f7a9c1b3d8
+Create Date: 2026-10-18 12:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f2b6d8e4a1c7"
+down_revision: Union[str, Sequence[str], None] = "e5f7a9c1b3d8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ROLLUP_SHARDS = 16
+
+# note_rollups_apply of d4e8b1f2a6c9 with the rollup keys and the scopes (the note's own
+# user and the global row) filled in. Rows are still upserted in key order.
+APPLY_FUNCTION = """
+CREATE OR REPLACE FUNCTION note_rollups_apply(removed things_to_do[], added things_to_do[])
+RETURNS void LANGUAGE sql AS $$
+    INSERT INTO note_rollups AS r ({rollup_key}, total, completed, timed_completed, completion_seconds)
+    SELECT
+        {scope_key},
+        sum(c.sign),
+        coalesce(sum(c.sign) FILTER (WHERE c.completed), 0),
+        coalesce(sum(c.sign) FILTER (WHERE c.completed AND c.completed_at IS NOT NULL), 0),
+        coalesce(
+            sum(c.sign * extract(EPOCH FROM c.completed_at - c.created_at))
+                FILTER (WHERE c.completed AND c.completed_at IS NOT NULL),
+            0
+        )
+    FROM (
+        SELECT n.*, -1 AS sign FROM unnest(removed) AS n
+        UNION ALL
+        SELECT n.*, 1 AS sign FROM unnest(added) AS n
+    ) AS c
+    CROSS JOIN LATERAL (VALUES {scopes}) AS scope({scope_columns})
+    GROUP BY {scope_key}
+    ORDER BY {scope_key}
+    ON CONFLICT ({rollup_key}) DO UPDATE SET
+        total = r.total + EXCLUDED.total,
+        completed = r.completed + EXCLUDED.completed,
+        timed_completed = r.timed_completed + EXCLUDED.timed_completed,
+        completion_seconds = r.completion_seconds + EXCLUDED.completion_seconds;
+
+    INSERT INTO note_hourly_rollups AS r ({hourly_key}, created)
+    SELECT {scope_key}, c.hour_of_week, sum(c.sign)
+    FROM (
+        SELECT n.user_id, n.created_at, -1 AS sign FROM unnest(removed) AS n
+        UNION ALL
+        SELECT n.user_id, n.created_at, 1 AS sign FROM unnest(added) AS n
+    ) AS changes
+    CROSS JOIN LATERAL (
+        SELECT
+            changes.user_id,
+            changes.sign,
+            (extract(DOW FROM changes.created_at) * 24 + extract(HOUR FROM changes.created_at))::smallint
+                AS hour_of_week
+    ) AS c
+    CROSS JOIN LATERAL (VALUES {scopes}) AS scope({scope_columns})
+    GROUP BY {scope_key}, c.hour_of_week
+    HAVING sum(c.sign) <> 0
+    ORDER BY {scope_key}, c.hour_of_week
+    ON CONFLICT ({hourly_key}) DO UPDATE SET created = r.created + EXCLUDED.created;
+$$
+"""
+
+SHARDED_APPLY_FUNCTION = APPLY_FUNCTION.format(
+    rollup_key="user_id, slot",
+    hourly_key="user_id, slot, hour_of_week",
+    scope_key="scope.user_id, scope.slot",
+    scope_columns="user_id, slot",
+    scopes=f"(c.user_id, 0::smallint), (0, (txid_current() % {ROLLUP_SHARDS})::smallint)",
+)
+
+UNSHARDED_APPLY_FUNCTION = APPLY_FUNCTION.format(
+    rollup_key="user_id",
+    hourly_key="user_id, hour_of_week",
+    scope_key="scope.user_id",
+    scope_columns="user_id",
+    scopes="(c.user_id), (0)",
+)
+
+# Fold the global slots back into slot 0 before the column goes away. Slot 0 may not
+# exist yet (the slots were all written after the upgrade), hence the upserts.
+MERGE_SLOTS = """
+WITH merged AS (
+    DELETE FROM note_rollups WHERE slot <> 0
+    RETURNING user_id, total, completed, timed_completed, completion_seconds
+)
+INSERT INTO note_rollups AS r (user_id, slot, total, completed, timed_completed, completion_seconds)
+SELECT user_id, 0, sum(total), sum(completed), sum(timed_completed), sum(completion_seconds)
+FROM merged
+GROUP BY user_id
+ON CONFLICT (user_id, slot) DO UPDATE SET
+    total = r.total + EXCLUDED.total,
+    completed = r.completed + EXCLUDED.completed,
+    timed_completed = r.timed_completed + EXCLUDED.timed_completed,
+    completion_seconds = r.completion_seconds + EXCLUDED.completion_seconds
+"""
+
+MERGE_HOURLY_SLOTS = """
+WITH merged AS (
+    DELETE FROM note_hourly_rollups WHERE slot <> 0
+    RETURNING user_id, hour_of_week, created
+)
+INSERT INTO note_hourly_rollups AS r (user_id, hour_of_week, slot, created)
+SELECT user_id, hour_of_week, 0, sum(created)
+FROM merged
+GROUP BY user_id, hour_of_week
+ON CONFLICT (user_id, hour_of_week, slot) DO UPDATE SET created = r.created + EXCLUDED.created
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows become slot 0, the trigger starts spreading global updates from here
+    for table, key in (
+        ("note_rollups", ["user_id", "slot"]),
+        ("note_hourly_rollups", ["user_id", "hour_of_week", "slot"]),
+    ):
+        op.add_column(
+            table,
+            sa.Column("slot", sa.SmallInteger(), server_default=sa.text("0"), nullable=False),
+        )
+        op.drop_constraint(f"{table}_pkey", table, type_="primary")
+        op.create_primary_key(f"{table}_pkey", table, key)
+    op.execute(SHARDED_APPLY_FUNCTION)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # No note writes (and so no slotted rollup updates) until the migration commits
+    op.execute("LOCK TABLE things_to_do IN SHARE MODE")
+    op.execute(MERGE_SLOTS)
+    op.execute(MERGE_HOURLY_SLOTS)
+    op.execute(UNSHARDED_APPLY_FUNCTION)
+    for table, key in (
+        ("note_rollups", ["user_id"]),
+        ("note_hourly_rollups", ["user_id", "hour_of_week"]),
+    ):
+        op.drop_constraint(f"{table}_pkey", table, type_="primary")
+        op.drop_column(table, "slot")
+        op.create_primary_key(f"{table}_pkey", table, key)
@@ -1,23 +1,84 @@
-import calendar
-from datetime import datetime
-from typing import Optional
+import csv
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from typing import Literal, Optional, Union
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 import asyncpg
-from fastapi import APIRouter, Depends, HTTPException, Query, Request, status, Form
-from fastapi.responses import JSONResponse, RedirectResponse
-
-from app.api.schemas.models import RoleEnum, Todo, TodoReturn, UserRole
-from app.common.templates import templates
-from app.database.database import get_db_connection
-from app.database.repositories.note_repository import NoteRepository
-from app.database.repositories.user_repository import UserRepository
-from app.helpers.db_helpers import check_by_id, get_table_columns
-from app.security.rbac import OwnershipChecker, PermissionChecker
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.api.schemas.models import (
+    CompletionHistogramBucket,
+    CompletionStats,
+    NoteImportResult,
+    NoteTrend,
+    RoleEnum,
+    TodoPage,
+    TodoReturn,
+    TodoSearchResult,
+    TodoUpdate,
+    TrendPoint,
+    UserRole,
+)
+from app.common.response_cache import ResponseCache
+from app.common.templates import (
+    is_fragment_request,
+    render_fragment,
+    templates,
+)
+from app.common.versions import cache_versions, table_version, trend_version, user_version
+from app.database.database import acquire_connection, get_db_connection
+from app.database.loaders import RequestLoaders, get_loaders
+from app.database.redis_client import get_redis
+from app.database.repositories.note_repository import (
+    COMPLETION_HISTOGRAM_EDGES,
+    COMPLETION_PERCENTILES,
+    NOTE_COLUMNS,
+    NoteFilters,
+    NoteRepository,
+)
+from app.helpers.analytics import weekday_distribution
+from app.helpers.db_helpers import KEYSET_NOTE_COLUMNS, SORTABLE_NOTE_COLUMNS
+from app.helpers.export import EXPORT_MEDIA_TYPES, ExportFormat, encode_export
+from app.helpers.note_import import NoteImport
+from app.helpers.pagination import KeysetPage, decode_cursor, encode_cursor
+from app.helpers.trends import (
+    MAX_TREND_BUCKETS,
+    TREND_CACHE_KEY,
+    Granularity,
+    closed_buckets,
+    trend_buckets,
+)
+from app.security.rbac import (
+    OwnershipChecker,
+    PermissionChecker,
+    can_access_any_note,
+    check_note_access,
+)
 from app.security.security import get_current_user_with_roles
 
 todo_router = APIRouter(prefix="/notes", tags=["Notes"])
 
+
+def note_versions(user: UserRole) -> str:
+    """Cache version of the notes a user can read"""
+    if can_access_any_note(user):
+        return table_version("things_to_do")
+    return user_version("things_to_do", user.user_id)
+
+
 @todo_router.get("/create_note", status_code=status.HTTP_201_CREATED)
 @PermissionChecker([RoleEnum.ADMIN, RoleEnum.USER])
 async def create_note(
@@ -39,6 +100,7 @@ async def create_note(
 @todo_router.post("/create_note", status_code=status.HTTP_201_CREATED)
 @PermissionChecker([RoleEnum.ADMIN, RoleEnum.USER])
 async def create_note(
+    request: Request,
     title: str = Form(...),
     description: str = Form(...),
     current_user: UserRole = Depends(get_current_user_with_roles),
@@ -46,6 +108,10 @@ async def create_note(
 ):
     repo = NoteRepository(db)
     row = await repo.create_note(title, description, current_user.user_id)
+    if is_fragment_request(request):
+        # htmx puts the new row into the table itself, no need to reload the list
+        total = await repo.get_note_total(current_user.user_id)
+        return render_fragment("NoteRow.html", {"todo": row, "oob_total": total})
     return RedirectResponse("/notes/my_notes", status_code=status.HTTP_302_FOUND)
 
 
@@ -53,28 +119,47 @@ async def create_note(
 @PermissionChecker([RoleEnum.ADMIN, RoleEnum.USER])
 async def get_user_notes(
     request: Request,
+    before: Optional[int] = Query(None, ge=1, description="Show notes older than this note id"),
+    limit: int = Query(100, ge=1, le=500),
     current_user: UserRole = Depends(get_current_user_with_roles),
+    loaders: RequestLoaders = Depends(get_loaders),
     db: asyncpg.Connection = Depends(get_db_connection),
 ):
-    user_repo = UserRepository(db)
-    user_info = await user_repo.get_user_full_info(current_user.user_id)
+    """Newest notes first, one keyset page at a time"""
+    user_id = current_user.user_id
+    user_info = await loaders.user_profiles.load(user_id)
     repo = NoteRepository(db)
-    rows = await repo.get_user_notes(current_user.user_id)
+    total = await repo.get_note_total(user_id)
+    rows = await repo.get_user_notes_page(user_id, limit + 1, before)
+    await db.release()  # Not needed while the page is rendered and sent
+
     return templates.TemplateResponse(
+        request,
         "MyNotes.html",
         {
-            "request": request,
             "user": current_user,
             "user_profile": user_info,
-            "todos": rows,
+            "total": total,
+            "page": KeysetPage(rows, limit),
+            "before": before,
+            "limit": limit,
         },
     )
 
 
-@todo_router.get("/get_notes", response_model=list[TodoReturn])
+@todo_router.get("/get_notes", response_model=Union[list[TodoReturn], TodoPage])
+@ResponseCache(
+    versions=lambda kwargs: [
+        table_version("things_to_do")
+        if kwargs["user_id"] is None
+        else user_version("things_to_do", kwargs["user_id"])
+    ]
+)
 async def get_note(
     limit: int = Query(10, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    pagination: Literal["offset", "cursor"] = Query("offset"),
+    cursor: Optional[str] = Query(None),
     sort_by: str = "id",
     completed: Optional[bool] = Query(None),
     user_id: Optional[int] = Query(None),
@@ -85,44 +170,49 @@ async def get_note(
 ):
     repo = NoteRepository(db)
     column = sort_by.lstrip("-")
-    order = "DESC" if sort_by.startswith("-") else "ASC"
-
-    allowed = await get_table_columns("thingstodo", db)
-    if column not in allowed:
+    if column not in SORTABLE_NOTE_COLUMNS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sort field"
         )
 
-    params = [limit, offset]
-    clauses = ["TRUE"]
-
-    if completed is not None:
-        clauses.append(f"completed = ${len(params) + 1}")
-        params.append(completed)
-    if user_id is not None:
-        if not await check_by_id(user_id, "users", db):
+    filters = NoteFilters(
+        completed=completed,
+        user_id=user_id,
+        created_before=created_before,
+        created_after=created_after,
+        title_contains=title_contains,
+    )
+    descending = sort_by.startswith("-")
+
+    if pagination == "cursor" or cursor is not None:
+        # Keyset mode: flat latency at any depth, answers with next_cursor
+        if column not in KEYSET_NOTE_COLUMNS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor pagination needs a non-nullable sort field",
+            )
+        after = (
+            decode_cursor(cursor, sort_by, KEYSET_NOTE_COLUMNS[column])
+            if cursor
+            else None
+        )
+        user_exists, res = await repo.get_filtered_notes(
+            filters, column, descending, limit + 1, after=after
+        )
+        if not user_exists:
             raise HTTPException(status_code=400, detail="User not found")
-        clauses.append(f"user_id = ${len(params) + 1}")
-        params.append(user_id)
-    if created_before:
-        clauses.append(f"created_at <= ${len(params) + 1}")
-        params.append(created_before)
-    if created_after:
-        clauses.append(f"created_at >= ${len(params) + 1}")
-        params.append(created_after)
-    if title_contains:
-        clauses.append(f"title ILIKE ${len(params) + 1}")
-        params.append(f"%{title_contains}%")
-
-    query = f"""
-        SELECT * FROM ThingsToDo
-        WHERE {' AND '.join(clauses)}
-        ORDER BY {column} {order}
-        LIMIT $1
-        OFFSET $2
-    """
-
-    res = await repo.get_filtered_notes(query, params)
+        items = [TodoReturn(**row) for row in res[:limit]]
+        next_cursor = None
+        if len(res) > limit:
+            last = res[limit - 1]
+            next_cursor = encode_cursor(sort_by, last[column], last["id"])
+        return TodoPage(items=items, next_cursor=next_cursor)
+
+    user_exists, res = await repo.get_filtered_notes(
+        filters, column, descending, limit, offset
+    )
+    if not user_exists:
+        raise HTTPException(status_code=400, detail="User not found")
     if not res:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -131,19 +221,131 @@ async def get_note(
     return [TodoReturn(**row) for row in res]
 
 
+@todo_router.get("/export", response_class=StreamingResponse)
+@PermissionChecker([RoleEnum.ADMIN, RoleEnum.USER])
+async def export_notes(
+    request: Request,
+    export_format: ExportFormat = Query("ndjson", alias="format"),
+    gzip: bool = Query(False),
+    completed: Optional[bool] = Query(None),
+    user_id: Optional[int] = Query(None),
+    created_before: Optional[datetime] = Query(None),
+    created_after: Optional[datetime] = Query(None),
+    title_contains: Optional[str] = Query(None),
+    current_user: UserRole = Depends(get_current_user_with_roles),
+):
+    """
+    All notes matching the filters of /notes/get_notes, streamed from a database
+    cursor. Users export their own notes, admins anyone's (all notes if user_id is omitted).
+    """
+    if not can_access_any_note(current_user):
+        user_id = current_user.user_id
+    filters = NoteFilters(
+        completed=completed,
+        user_id=user_id,
+        created_before=created_before,
+        created_after=created_after,
+        title_contains=title_contains,
+    )
+
+    # The cursor needs its connection until the last row is sent, so it doesn't use the
+    # request-scoped one. It's taken before the response starts: a busy pool is a 503,
+    # not a body cut short after the headers.
+    conn = await acquire_connection(request)
+
+    async def rows():
+        try:
+            async for row in NoteRepository(await conn.acquire()).iter_notes(filters):
+                yield row
+        finally:
+            await conn.release()
+
+    filename = f"notes.{export_format}"
+    media_type = EXPORT_MEDIA_TYPES[export_format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        encode_export(rows(), NOTE_COLUMNS, export_format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        background=BackgroundTask(conn.release),  # In case the body is never sent
+    )
+
+
+@todo_router.post("/import", response_model=NoteImportResult)
+@PermissionChecker([RoleEnum.ADMIN, RoleEnum.USER])
+async def import_notes(
+    file: UploadFile = File(...),
+    import_format: Optional[ExportFormat] = Query(
+        None, alias="format", description="Defaults to csv for .csv files, ndjson otherwise"
+    ),
+    user_id: Optional[int] = Query(None, description="Admins only: owner of the imported notes"),
+    current_user: UserRole = Depends(get_current_user_with_roles),
+    db: asyncpg.Connection = Depends(get_db_connection),
+):
+    """
+    Imports a NDJSON or CSV file of notes (e.g. from /notes/export) with COPY.
+    Rows failing validation are skipped and reported; the rest are imported together.
+    """
+    if user_id is None or not can_access_any_note(current_user):
+        user_id = current_user.user_id
+    if import_format is None:
+        import_format = "csv" if (file.filename or "").lower().endswith(".csv") else "ndjson"
+
+    note_import = NoteImport(file.file, import_format)
+
+    async def batches():
+        # Parsing and validation run in a thread, off the event loop
+        while batch := await run_in_threadpool(note_import.next_batch):
+            yield batch
+
+    repo = NoteRepository(db)
+    try:
+        imported = await repo.import_notes(batches(), user_id)
+    except asyncpg.ForeignKeyViolationError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User not found")
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="File must be UTF-8 encoded"
+        )
+    except csv.Error as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Malformed CSV: {e}")
+    return NoteImportResult(
+        imported=imported, rejected=note_import.rejected, errors=note_import.errors
+    )
+
+
+@todo_router.get("/search", response_model=list[TodoSearchResult])
+@PermissionChecker([RoleEnum.ADMIN, RoleEnum.USER])
+async def search_notes(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    user_id: Optional[int] = Query(None),
+    current_user: UserRole = Depends(get_current_user_with_roles),
+    db: asyncpg.Connection = Depends(get_db_connection),
+):
+    # Users search their own notes, admins anyone's (all notes if user_id is omitted)
+    if not can_access_any_note(current_user):
+        user_id = current_user.user_id
+    repo = NoteRepository(db)
+    rows = await repo.search_notes(q, user_id, limit)
+    return [TodoSearchResult(**row) for row in rows]
+
+
 @todo_router.get("/get_note/{note_id}", response_model=TodoReturn)
 @OwnershipChecker()
+@ResponseCache(versions=lambda kwargs: [note_versions(kwargs["current_user"])])
 async def get_note_by_id(
     note_id: int,
     current_user: UserRole = Depends(get_current_user_with_roles),
     db: asyncpg.Connection = Depends(get_db_connection),
 ):
     repo = NoteRepository(db)
-    row = await repo.get_note_by_id(note_id)
-    if not row:
-        return JSONResponse(
-            status_code=status.HTTP_404_NOT_FOUND, content={"message": "Item not found"}
-        )
+    row = await repo.get_note_for_user(
+        note_id, current_user.user_id, can_access_any_note(current_user)
+    )
+    check_note_access(row)
     return TodoReturn(**dict(row))
 
 
@@ -152,16 +354,22 @@ async def get_note_by_id(
 @PermissionChecker([RoleEnum.ADMIN, RoleEnum.USER])
 @OwnershipChecker()
 async def delete_note(
+    request: Request,
     note_id: int,
     current_user: UserRole = Depends(get_current_user_with_roles),
     db: asyncpg.Connection = Depends(get_db_connection),
 ):
     repo = NoteRepository(db)
-    result = await repo.delete_note(note_id)
-    if result == "DELETE 0":
-        return JSONResponse(
-            status_code=status.HTTP_404_NOT_FOUND, content={"message": "Item not found"}
-        )
+    row = await repo.delete_note_for_user(
+        note_id, current_user.user_id, can_access_any_note(current_user)
+    )
+    check_note_access(row)
+    if is_fragment_request(request):
+        # An empty swap removes the row; the count on the page is the user's own
+        context = {}
+        if row["owner_id"] == current_user.user_id:
+            context["oob_total"] = await repo.get_note_total(current_user.user_id)
+        return render_fragment("NoteRow.html", context)
     return RedirectResponse("/notes/my_notes", status_code=status.HTTP_302_FOUND)
 
 
@@ -169,34 +377,41 @@ async def delete_note(
 @OwnershipChecker()
 async def update_note(
     note_id: int,
-    note: Todo,
+    note: TodoUpdate,
     current_user: UserRole = Depends(get_current_user_with_roles),
     db: asyncpg.Connection = Depends(get_db_connection),
 ):
     repo = NoteRepository(db)
-    result = await repo.update_note(
-        note_id, note.title, note.description, note.completed
-    )
-    if result == "UPDATE 1":
-        return {"message": "Item successfully updated!"}
-    return JSONResponse(
-        status_code=status.HTTP_404_NOT_FOUND, content={"message": "Item not found."}
+    row = await repo.update_note_for_user(
+        note_id,
+        current_user.user_id,
+        can_access_any_note(current_user),
+        note.title,
+        note.description,
+        note.completed,
     )
+    check_note_access(row)
+    return {"message": "Item successfully updated!"}
+
 
 @todo_router.post("/complete/{note_id}")
 @OwnershipChecker()
 async def complete_note(
+    request: Request,
     note_id: int,
     current_user: UserRole = Depends(get_current_user_with_roles),
     db: asyncpg.Connection = Depends(get_db_connection),
 ):
     repo = NoteRepository(db)
-    result = await repo.complete_note(note_id)
-
+    row = await repo.complete_note_for_user(
+        note_id, current_user.user_id, can_access_any_note(current_user)
+    )
+    check_note_access(row)
+    if is_fragment_request(request):
+        return render_fragment("NoteRow.html", {"todo": row})
     return RedirectResponse("/notes/my_notes", status_code=status.HTTP_302_FOUND)
 
 
-
 @todo_router.patch("/complete_notes")
 async def complete_notes(
     note_id: list[int] = Query(...),
@@ -204,35 +419,172 @@ async def complete_notes(
     db: asyncpg.Connection = Depends(get_db_connection),
 ):
     repo = NoteRepository(db)
-    result = await repo.bulk_complete(note_id, completed)
-    num = result.split()[1]
-    return {"updated_count": int(num)}
+    updated_count = await repo.bulk_complete(note_id, completed)
+    return {"updated_count": updated_count}
 
 
 @todo_router.get("/analytics")
+@ResponseCache(versions=lambda kwargs: [table_version("things_to_do")])
 async def get_todos_analytics(
     timezone: str = Query("Europe/Moscow"),
     db: asyncpg.Connection = Depends(get_db_connection),
 ):
     try:
-        ZoneInfo(timezone)
+        tz = ZoneInfo(timezone)
     except ZoneInfoNotFoundError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid timezone")
 
     repo = NoteRepository(db)
-    total, status_counts, avg_time, weekday_raw = await repo.get_analytics(timezone)
+    totals, hourly = await repo.get_analytics()
+    total = totals["total"] if totals else 0
+    completed = totals["completed"] if totals else 0
 
     completed_stats = {
-        str(row["completed"]).lower(): row["count"] for row in status_counts
-    }
-    weekday_distribution = {row["weekday"].strip(): row["count"] for row in weekday_raw}
-    full_weekday_distribution = {
-        day: weekday_distribution.get(day, 0) for day in calendar.day_name
+        key: count
+        for key, count in (("true", completed), ("false", total - completed))
+        if count
     }
+    avg_time = (
+        totals["completion_seconds"] / totals["timed_completed"] / 3600
+        if totals and totals["timed_completed"]
+        else 0.0
+    )
 
     return {
         "total": total,
         "completed_stats": completed_stats,
-        "avg_completion_time_hours": round(avg_time, 2) if avg_time else 0.0,
-        "weekday_distribution": full_weekday_distribution,
+        "avg_completion_time_hours": round(avg_time, 2),
+        "weekday_distribution": weekday_distribution(
+            ((row["hour_of_week"], row["created"]) for row in hourly), tz
+        ),
     }
+
+
+def check_analytics_access(user_id: Optional[int], current_user: UserRole):
+    """Overall stats are public like /notes/analytics; per-user ones are for the owner or admins"""
+    if (
+        user_id is not None
+        and user_id != current_user.user_id
+        and not can_access_any_note(current_user)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permissions to access this resource",
+        )
+
+
+@todo_router.get("/analytics/completion", response_model=CompletionStats)
+@ResponseCache(
+    versions=lambda kwargs: [
+        table_version("things_to_do")
+        if kwargs["user_id"] is None
+        else user_version("things_to_do", kwargs["user_id"])
+    ]
+)
+async def get_completion_analytics(
+    user_id: Optional[int] = Query(None),
+    current_user: UserRole = Depends(get_current_user_with_roles),
+    db: asyncpg.Connection = Depends(get_db_connection),
+):
+    check_analytics_access(user_id, current_user)
+    repo = NoteRepository(db)
+    row = await repo.get_completion_stats(user_id)
+    percentiles = row["percentiles"] or [None] * len(COMPLETION_PERCENTILES)
+    p50, p90, p99 = (None if value is None else round(value, 2) for value in percentiles)
+    edges = (0.0, *COMPLETION_HISTOGRAM_EDGES, None)
+
+    return CompletionStats(
+        count=row["count"],
+        p50_hours=p50,
+        p90_hours=p90,
+        p99_hours=p99,
+        histogram=[
+            CompletionHistogramBucket(
+                min_hours=edges[bucket],
+                max_hours=edges[bucket + 1],
+                count=row[f"bucket_{bucket}"],
+            )
+            for bucket in range(len(edges) - 1)
+        ],
+    )
+
+
+@todo_router.get("/analytics/trend", response_model=NoteTrend)
+async def get_trend_analytics(
+    request: Request,
+    granularity: Granularity = Query("day"),
+    start: Optional[date] = Query(None, description="First local day, defaults to 89 days before end"),
+    end: Optional[date] = Query(None, description="Last local day, defaults to today"),
+    timezone: str = Query("Europe/Moscow"),
+    user_id: Optional[int] = Query(None),
+    current_user: UserRole = Depends(get_current_user_with_roles),
+    db: asyncpg.Connection = Depends(get_db_connection),
+):
+    """
+    Notes created vs completed per local day or week. Buckets that are over come
+    from closed_buckets; only the open bucket and never-seen ones hit the database.
+    """
+    try:
+        tz = ZoneInfo(timezone)
+    except ZoneInfoNotFoundError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid timezone")
+    check_analytics_access(user_id, current_user)
+
+    now = datetime.now(dt_timezone.utc).replace(tzinfo=None)
+    end = end or datetime.now(tz).date()
+    start = start or end - timedelta(days=89)
+    if start > end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="start must not be after end"
+        )
+    buckets = trend_buckets(start, end, granularity, tz)
+    if len(buckets) > MAX_TREND_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range spans more than {MAX_TREND_BUCKETS} buckets",
+        )
+
+    redis = get_redis(request)
+    # Read before the buckets are counted, so counts racing a delete land in the old series
+    versions = await cache_versions.get([trend_version(user_id)])
+    series = None
+    counts = {}
+    if versions is not None:
+        series = TREND_CACHE_KEY.format(
+            scope="all" if user_id is None else user_id,
+            version=versions[0],
+            granularity=granularity,
+            timezone=timezone,
+        )
+        closed = [bucket.start for bucket in buckets if bucket.is_closed(now)]
+        counts = await closed_buckets.get_many(redis, series, closed)
+
+    pending = [bucket for bucket in buckets if bucket.start not in counts]
+    if pending:
+        repo = NoteRepository(db)
+        rows = await repo.get_trend_counts(
+            [(bucket.utc_start, bucket.utc_end) for bucket in pending], user_id
+        )
+        fresh = {
+            pending[row["bucket"] - 1].start: (row["created"], row["completed"]) for row in rows
+        }
+        counts.update(fresh)
+        if series is not None:
+            await closed_buckets.set_many(
+                redis,
+                series,
+                {bucket.start: fresh[bucket.start] for bucket in pending if bucket.is_closed(now)},
+            )
+
+    return NoteTrend(
+        granularity=granularity,
+        timezone=timezone,
+        buckets=[
+            TrendPoint(
+                start=bucket.start,
+                created=counts[bucket.start][0],
+                completed=counts[bucket.start][1],
+            )
+            for bucket in buckets
+        ],
+    )
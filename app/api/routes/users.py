@@ -1,5 +1,6 @@
 # app/api/routes/users.py
 
+from typing import Optional
 from urllib.parse import urlencode
 
 import asyncpg
@@ -13,15 +14,32 @@ from app.api.schemas.models import (
     UserRegistration,
     UserRole, PasswordValidator,
 )
+from app.common.response_cache import ResponseCache
 from app.common.templates import templates
-from app.database.database import get_db_connection
-from app.database.repositories.user_repository import UserRepository
+from app.common.versions import user_version
+from app.database.database import get_db_connection, run_concurrently
+from app.database.loaders import RequestLoaders, get_loaders
+from app.database.redis_client import get_redis
+from app.database.repositories.user_repository import MIN_SEARCH_LENGTH, UserRepository
+from app.security.client_ip import get_client_ip
+from app.security.login_throttle import (
+    claim_login_attempt,
+    reset_login_failures,
+)
 from app.security.rbac import PermissionChecker, role_based_rate_limit
+from app.security.refresh_tokens import (
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    issue_refresh_token,
+    revoke_refresh_token,
+    revoke_user_refresh_tokens,
+)
+from app.security.role_epochs import bump_role_epoch, get_role_epoch
 from app.security.security import (
     create_jwt_token,
     get_current_user_with_roles,
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    set_auth_cookies,
+    verify_password_async,
 )
 
 users_router = APIRouter(prefix="/users", tags=["Users"])
@@ -60,7 +78,7 @@ async def register_user(
         raise e
     user_repo = UserRepository(db)
     user_id = await user_repo.create_user(
-        user.username, get_password_hash(user.password)
+        user.username, await get_password_hash_async(user.password)
     )
     if user_id == -1:
         return templates.TemplateResponse(
@@ -118,7 +136,7 @@ async def change_user_password(
     if (
             not row
             or not row["hashed_password"]
-            or not verify_password(old_password, row["hashed_password"])
+            or not await verify_password_async(old_password, row["hashed_password"])
     ):
         return templates.TemplateResponse(
             "ChangePasswordPage.html",
@@ -144,7 +162,24 @@ async def change_user_password(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         )
 
-    await user_repo.change_password(current_user.user_id, get_password_hash(new_password))
+    await user_repo.change_password(
+        current_user.user_id, await get_password_hash_async(new_password)
+    )
+    # Log out other sessions, keep the current one
+    redis = get_redis(request)
+    await revoke_user_refresh_tokens(redis, current_user.user_id)
+    refresh_token = await issue_refresh_token(redis, current_user.user_id)
+    if refresh_token is not None:
+        # Epoch before roles (see log_in): current_user.roles may predate a role change
+        # whose epoch this token would otherwise carry
+        epoch = await get_role_epoch(redis, current_user.user_id)
+        user_role = await user_repo.get_user_roles_by_id(current_user.user_id)
+        access_token = create_jwt_token(
+            {"sub": str(current_user.user_id)},
+            roles=user_role.roles if user_role else [],
+            epoch=epoch,
+        )
+        set_auth_cookies(request, access_token, refresh_token)
     query = urlencode({"updated": "true"})
 
     response = RedirectResponse(url=f"/users/profile?{query}", status_code=status.HTTP_302_FOUND)
@@ -159,6 +194,20 @@ async def log_in(
     password: str = Form(...),
     db: asyncpg.Connection = Depends(get_db_connection),
 ):
+    redis = get_redis(request)
+    client_ip = get_client_ip(request)
+    retry_after = await claim_login_attempt(redis, username, client_ip)
+    if retry_after is not None:
+        return templates.TemplateResponse(
+            "AuthorizationPage.html",
+            {
+                "request": request,
+                "error": "Too many failed attempts, try again later",
+            },
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(retry_after)},
+        )
+
     user_repo = UserRepository(db)
 
     row = await user_repo.get_user_by_username(username)
@@ -166,7 +215,7 @@ async def log_in(
     if (
         not row
         or not row["hashed_password"]
-        or not verify_password(password, row["hashed_password"])
+        or not await verify_password_async(password, row["hashed_password"])
     ):
         return templates.TemplateResponse(
             "AuthorizationPage.html",
@@ -177,11 +226,38 @@ async def log_in(
             status_code=status.HTTP_401_UNAUTHORIZED,
         )
 
+    await reset_login_failures(redis, username, client_ip)
     user_id = row["id"]
-    token = create_jwt_token({"sub": str(user_id), "username": username})
+    # Epoch before roles: a role change landing in between bumps the epoch, so this
+    # token is born stale and its roles get re-read instead of trusted
+    epoch = await get_role_epoch(redis, user_id)
+    user_role = await user_repo.get_user_roles_by_id(user_id)
+    roles = user_role.roles if user_role else []
+    token = create_jwt_token(
+        {"sub": str(user_id), "username": username}, roles=roles, epoch=epoch
+    )
 
     response = RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
     response.set_cookie(key="access_token", value=token, httponly=True)
+    refresh_token = await issue_refresh_token(redis, user_id)
+    if refresh_token is not None:
+        response.set_cookie(
+            key="refresh_token",
+            value=refresh_token,
+            httponly=True,
+            max_age=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60,
+        )
+    return response
+
+
+@users_router.get("/log_out")
+async def log_out(request: Request):
+    refresh_token = request.cookies.get("refresh_token")
+    if refresh_token:
+        await revoke_refresh_token(get_redis(request), refresh_token)
+    response = RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
+    response.delete_cookie("access_token")
+    response.delete_cookie("refresh_token")
     return response
 
 
@@ -190,21 +266,49 @@ async def log_in(
 async def get_users(
     request: Request,
     message: str = Query(default=None),
+    q: str = Query("", max_length=100, description="Part of username, email or full name"),
+    role: Optional[RoleEnum] = Query(None),
+    after: Optional[int] = Query(None, ge=0, description="Last user id of the previous page"),
+    limit: int = Query(50, ge=1, le=200),
     current_user: UserRole = Depends(get_current_user_with_roles),
+    loaders: RequestLoaders = Depends(get_loaders),
     db: asyncpg.Connection = Depends(get_db_connection),
 ):
-    user_repo = UserRepository(db)
-    user_info = await user_repo.get_user_full_info(current_user.user_id)
-    res = await user_repo.get_all_users_full_info()
+    q = q.strip()
+    error = None
+    if 0 < len(q) < MIN_SEARCH_LENGTH:
+        error = f"Search needs at least {MIN_SEARCH_LENGTH} characters"
+        user_info, res = await loaders.user_profiles.load(current_user.user_id), []
+    else:
+        user_info, res = await run_concurrently(
+            db,
+            lambda _: loaders.user_profiles.load(current_user.user_id),
+            lambda conn: UserRepository(conn).get_users_page(limit + 1, after, q or None, role),
+        )
+
+    def directory_url(**changes) -> str:
+        params = {"q": q, "role": role and role.value, "limit": limit, **changes}
+        return f"/users/all_users?{urlencode({k: v for k, v in params.items() if v})}"
+
     return templates.TemplateResponse(
         "AllUsers.html",
         {
             "request": request,
             "user": current_user,
             "user_profile": user_info,
-            "users": res or [],
+            "users": res[:limit],
             "message": message,
+            "error": error,
+            "q": q,
+            "role": role,
+            "roles": [r.value for r in RoleEnum],
+            "directory_url": directory_url,
+            "first_page_url": directory_url() if after else None,
+            "next_page_url": (
+                directory_url(after=res[limit - 1]["user_id"]) if len(res) > limit else None
+            ),
         },
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY if error else status.HTTP_200_OK,
     )
 
 
@@ -222,6 +326,8 @@ async def delete_user(
     if not success:
         query = urlencode({"message": "User not found"})
     else:
+        await bump_role_epoch(get_redis(request), user_id)
+        await revoke_user_refresh_tokens(get_redis(request), user_id)
         query = urlencode({"message": "User and his todos are successfully deleted!"})
     return RedirectResponse(
         url=f"/users/all_users?{query}", status_code=status.HTTP_302_FOUND
@@ -232,10 +338,9 @@ async def delete_user(
 async def get_profile(
     request: Request,
     current_user: UserRole = Depends(get_current_user_with_roles),
-    db: asyncpg.Connection = Depends(get_db_connection),
+    loaders: RequestLoaders = Depends(get_loaders),
 ):
-    user_repo = UserRepository(db)
-    user_info = await user_repo.get_user_full_info(current_user.user_id)
+    user_info = await loaders.user_profiles.load(current_user.user_id)
 
     updated = request.query_params.get("updated") == "true"
     error = request.query_params.get("error") or ""
@@ -276,13 +381,13 @@ async def update_user(
 
 
 @users_router.get("/{user_id}", dependencies=[Depends(role_based_rate_limit)])
+@ResponseCache(versions=lambda kwargs: [user_version("users", kwargs["user_id"])])
 async def get_user(
     request: Request,
     user_id: int,
-    db: asyncpg.Connection = Depends(get_db_connection),
+    loaders: RequestLoaders = Depends(get_loaders),
 ):
-    user_repo = UserRepository(db)
-    res = await user_repo.get_user_full_info(user_id)
+    res = await loaders.user_profiles.load(user_id)
     if not res:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND, content={"message": "User not found"}
@@ -302,6 +407,7 @@ async def add_user_role(
     user_repo = UserRepository(db)
     res = await user_repo.add_user_role(user_id, role)
     if res:
+        await bump_role_epoch(get_redis(request), user_id)
         query = urlencode({"message": "Role was added"})
     else:
         query = urlencode({"message": "Error: couldn't add role"})
@@ -322,6 +428,7 @@ async def remove_user_role(
     user_repo = UserRepository(db)
     res = await user_repo.remove_user_role(user_id, role)
     if res:
+        await bump_role_epoch(get_redis(request), user_id)
         query = urlencode({"message": "Role was removed"})
     else:
         query = urlencode({"message": "Error: couldn't remove role"})
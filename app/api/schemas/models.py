@@ -1,5 +1,5 @@
 import re
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 from typing import Optional
 
@@ -123,8 +123,13 @@ class UserRole(BaseModel):
 
 
 class Todo(BaseModel):
-    title: str = ""
-    description: str = ""
+    # Lengths of the things_to_do columns
+    title: str = Field("", max_length=255)
+    description: str = Field("", max_length=500)
+
+
+class TodoUpdate(Todo):
+    completed: bool = False
 
 
 class TodoReturn(Todo):
@@ -135,6 +140,55 @@ class TodoReturn(Todo):
     completed_at: datetime | None = None
 
 
+class TodoSearchResult(TodoReturn):
+    rank: float
+    snippet: str
+
+
+class NoteImportError(BaseModel):
+    line: int
+    error: str
+
+
+class NoteImportResult(BaseModel):
+    imported: int
+    rejected: int
+    errors: list[NoteImportError]  # The first rejected rows
+
+
+class TodoPage(BaseModel):
+    items: list[TodoReturn]
+    next_cursor: Optional[str] = None
+
+
+class CompletionHistogramBucket(BaseModel):
+    min_hours: float
+    max_hours: Optional[float] = None  # None for the open-ended last bucket
+    count: int
+
+
+class CompletionStats(BaseModel):
+    """Completion time distribution of completed notes"""
+
+    count: int
+    p50_hours: Optional[float] = None
+    p90_hours: Optional[float] = None
+    p99_hours: Optional[float] = None
+    histogram: list[CompletionHistogramBucket]
+
+
+class TrendPoint(BaseModel):
+    start: date  # First local day of the bucket
+    created: int
+    completed: int
+
+
+class NoteTrend(BaseModel):
+    granularity: str
+    timezone: str
+    buckets: list[TrendPoint]
+
+
 class CustomExceptionModel(BaseModel):
     status_code: int
     er_message: str
@@ -0,0 +1,29 @@
+from typing import Iterable, Optional
+
+from app.common.read_cache import read_cache
+from app.common.versions import cache_versions, table_version, trend_version, user_version
+
+
+async def invalidate_table(table: str, user_ids: Iterable[Optional[int]] = ()):
+    """
+    Called by repository writes: drops cached reads of the table, overall and for
+    the given row owners, from both the response cache (by bumping its versions)
+    and the repository read cache (by tag).
+    """
+    names = [
+        table_version(table),
+        *(user_version(table, user_id) for user_id in set(user_ids) if user_id is not None),
+    ]
+    await cache_versions.bump(*names)
+    await read_cache.invalidate(*names)
+
+
+async def invalidate_closed_trends(user_ids: Iterable[int]):
+    """
+    Called by note writes that can change buckets which are already over: deletes,
+    un-completing and re-completing. Orphans the cached trend series overall and of
+    the note owners. Creates only ever land in the open bucket and don't need it.
+    """
+    await cache_versions.bump(
+        trend_version(None), *(trend_version(user_id) for user_id in set(user_ids))
+    )
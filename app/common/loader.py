@@ -0,0 +1,86 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, Iterable, Mapping, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class DataLoader(Generic[K, V]):
+    """
+    Batches and memoizes lookups by key; meant to live for one request.
+
+    Keys requested within the same event-loop tick are fetched with one call of
+    batch_load, and every key is fetched at most once (failed loads aren't kept,
+    so they can be retried). Keys batch_load doesn't return resolve to None.
+
+    :param batch_load: fetches several keys at once, returns {key: value}
+    :param lock: shared by loaders that query through the same connection, since
+                 asyncpg can't run two statements on one connection concurrently
+    """
+
+    def __init__(
+        self,
+        batch_load: Callable[[list[K]], Awaitable[Mapping[K, V]]],
+        lock: Optional[asyncio.Lock] = None,
+    ):
+        self._batch_load = batch_load
+        self._lock = lock or asyncio.Lock()
+        self._futures: dict[K, asyncio.Future] = {}
+        self._queue: list[K] = []
+        self._batches: set[asyncio.Task] = set()
+        self.batch_count = 0
+
+    def load(self, key: K) -> Awaitable[Optional[V]]:
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            self._queue.append(key)
+            if len(self._queue) == 1:
+                # Two hops, so tasks created in this tick (e.g. by gather) get to
+                # queue their keys before the batch goes out
+                loop.call_soon(loop.call_soon, self._dispatch)
+        # A cancelled caller mustn't cancel the result other callers are waiting for
+        return asyncio.shield(future)
+
+    async def load_many(self, keys: Iterable[K]) -> list[Optional[V]]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: K, value: V):
+        """Remembers a value fetched some other way (e.g. returned by a write)"""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        self._futures[key] = future
+
+    def clear(self, key: K):
+        """Forgets a key whose value was changed by this request"""
+        self._futures.pop(key, None)
+
+    def _dispatch(self):
+        keys, self._queue = self._queue, []
+        batch = asyncio.create_task(self._run(keys))
+        self._batches.add(batch)
+        batch.add_done_callback(self._batches.discard)
+
+    async def _run(self, keys: list[K]):
+        futures = [self._futures[key] for key in keys]
+        try:
+            async with self._lock:
+                self.batch_count += 1
+                values = await self._batch_load(keys)
+        except BaseException as e:
+            for key, future in zip(keys, futures, strict=True):
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+                if future.done():
+                    continue
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                else:
+                    future.cancel()
+            if not isinstance(e, Exception):
+                raise
+            return
+        for future, key in zip(futures, keys, strict=True):
+            if not future.done():
+                future.set_result(values.get(key))
@@ -0,0 +1,257 @@
+import asyncio
+import inspect
+import json
+import logging
+import time
+from collections import defaultdict
+from functools import wraps
+from typing import Any, Callable, Iterable, Optional
+
+import asyncpg
+from fastapi import HTTPException, status
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.common.lru import TTLCache
+from app.database.database import LazyConnection, acquire_spare_connection
+
+logger = logging.getLogger(__name__)
+
+READ_CACHE_KEY = "read_cache:{key}"
+READ_CACHE_TAG_KEY = "read_cache:tag:{tag}"
+INVALIDATION_CHANNEL = "read_cache:invalidate"
+REDIS_TIMEOUT = 0.05  # An L2 that answers slower than Postgres isn't worth waiting for
+LISTENER_RETRY_DELAY = 1.0
+
+# Errors meaning "the database is unreachable", as opposed to bad queries
+DB_UNAVAILABLE_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+)
+
+
+def _is_db_unavailable(error: Exception) -> bool:
+    if isinstance(error, HTTPException):  # LazyConnection's pool timeout
+        return error.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    return isinstance(error, DB_UNAVAILABLE_ERRORS)
+
+
+def _to_cacheable(value: Any) -> Any:
+    """asyncpg records become dicts (templates and models read them the same way)"""
+    if isinstance(value, asyncpg.Record):
+        return dict(value)
+    if isinstance(value, list):
+        return [_to_cacheable(item) for item in value]
+    return value
+
+
+class TwoTierCache:
+    """
+    Cache for repository reads: a per-process LRU (L1) in front of Redis (L2).
+
+    Entries are tagged; invalidate(tag) drops them from Redis and, through pub/sub,
+    from the L1 of every worker. Concurrent misses of one key share a single load.
+    Entries stay around for stale_ttl after they expire, so with serve_stale a read
+    can still be answered while Postgres is unreachable.
+    Values must be JSON-serializable once records are turned into dicts.
+    """
+
+    def __init__(self, maxsize: int = 10_000):
+        self._l1 = TTLCache(maxsize)
+        self._redis: Optional[Redis] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._tag_keys: defaultdict[str, set[str]] = defaultdict(set)
+        self._tag_generations: defaultdict[str, int] = defaultdict(int)
+
+    def start(self, redis: Optional[Redis]):
+        """Binds the L2 and listens for invalidations from other workers (app lifespan)"""
+        self._redis = redis
+        if redis is not None:
+            self._listener = asyncio.create_task(self._listen(redis))
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        self._redis = None
+
+    async def _listen(self, redis: Redis):
+        while True:
+            try:
+                async with redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    async for message in pubsub.listen():
+                        self._drop_local(json.loads(message["data"]))
+            except RedisError as e:
+                # Invalidations may have been missed while disconnected
+                logger.error("Read cache invalidation listener disconnected: %s", e)
+                self._l1.clear()
+                self._tag_keys.clear()
+            await asyncio.sleep(LISTENER_RETRY_DELAY)
+
+    def _drop_local(self, tags: Iterable[str]):
+        for tag in tags:
+            self._tag_generations[tag] += 1
+            for key in self._tag_keys.pop(tag, ()):
+                self._l1.pop(key)
+
+    async def invalidate(self, *tags: str):
+        self._drop_local(tags)
+        if self._redis is None or not tags:
+            return
+        tag_keys = [READ_CACHE_TAG_KEY.format(tag=tag) for tag in tags]
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for tag_key in tag_keys:
+                    pipe.smembers(tag_key)
+                keys = set().union(*await pipe.execute())
+            async with self._redis.pipeline(transaction=False) as pipe:
+                if keys:
+                    pipe.delete(*(READ_CACHE_KEY.format(key=key) for key in keys))
+                pipe.delete(*tag_keys)
+                pipe.publish(INVALIDATION_CHANNEL, json.dumps(list(tags)))
+                await pipe.execute()
+        except RedisError as e:
+            logger.error("Couldn't invalidate read cache tags %s: %s", tags, e)
+
+    def cached(
+        self,
+        tags: Callable[..., Iterable[str]],
+        ttl: float = 60,
+        stale_ttl: float = 3600,
+        serve_stale: bool = False,
+    ):
+        """
+        Decorator for repository read methods
+        :param tags: maps the method's arguments (without self) to invalidation tags
+        :param stale_ttl: how long an expired entry is kept for serve_stale
+        """
+
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            @wraps(func)
+            async def wrapper(repo, *args, **kwargs):
+                call = signature.bind(repo, *args, **kwargs)
+                call.apply_defaults()
+                args, kwargs = call.args[1:], call.kwargs
+                key = f"{func.__qualname__}:{json.dumps([args, kwargs], default=str)}"
+                entry = self._l1.get(key)
+                if entry is not None and entry[1] > time.time():
+                    return entry[0]
+
+                # Single flight: concurrent misses await one shared load, which a
+                # cancelled caller doesn't cancel for the others
+                task = self._inflight.get(key)
+                if task is None:
+                    tag_list = list(tags(*args, **kwargs))
+                    generations = [self._tag_generations[tag] for tag in tag_list]
+
+                    async def load():
+                        db = repo.db
+                        if not isinstance(db, LazyConnection):
+                            # A plain connection or a test double, not a request-scoped one
+                            return await func(repo, *args, **kwargs)
+                        # The load can outlive the request that started it, so it runs
+                        # on a connection of its own rather than re-acquiring through that
+                        # request's handle. A request already holding db doesn't wait on
+                        # the pool for a second one (see run_concurrently): with none to
+                        # spare the load reads on db.
+                        if not db.acquired:
+                            conn = db.sibling()
+                        else:
+                            conn = await acquire_spare_connection(db)
+                            if conn is None:
+                                return await func(repo, *args, **kwargs)
+                        try:
+                            return await func(type(repo)(conn), *args, **kwargs)
+                        finally:
+                            db.query_count += conn.query_count
+                            await conn.release()
+
+                    task = asyncio.create_task(
+                        self._load(
+                            key, tag_list, generations, ttl, stale_ttl, serve_stale, entry, load
+                        )
+                    )
+                    self._inflight[key] = task
+                    task.add_done_callback(lambda _: self._inflight.pop(key, None))
+                return await asyncio.shield(task)
+
+            return wrapper
+
+        return decorator
+
+    async def _load(self, key, tags, generations, ttl, stale_ttl, serve_stale, stale_entry, load):
+        entry = await self._get_l2(key)
+        if entry is not None and entry[1] > time.time():
+            self._set_l1(key, entry, tags, stale_ttl)
+            return entry[0]
+        stale_entry = stale_entry or entry
+
+        try:
+            value = _to_cacheable(await load())
+        except Exception as e:
+            if serve_stale and stale_entry is not None and _is_db_unavailable(e):
+                logger.warning("Serving stale %s, database unavailable: %r", key, e)
+                return stale_entry[0]
+            raise
+
+        if generations != [self._tag_generations[tag] for tag in tags]:
+            return value  # Invalidated while loading: don't cache what may be stale
+        entry = (value, time.time() + ttl)
+        self._set_l1(key, entry, tags, stale_ttl)
+        await self._set_l2(key, entry, tags, stale_ttl)
+        return value
+
+    def _set_l1(self, key, entry, tags, stale_ttl):
+        self._l1.set(key, entry, ttl=stale_ttl)
+        for tag in tags:
+            self._tag_keys[tag].add(key)
+        if len(self._tag_keys) > 2 * self._l1.maxsize:
+            # Forget keys the LRU has already evicted
+            for tag, keys in list(self._tag_keys.items()):
+                live = {k for k in keys if k in self._l1}
+                if live:
+                    self._tag_keys[tag] = live
+                else:
+                    del self._tag_keys[tag]
+
+    async def _get_l2(self, key):
+        if self._redis is None:
+            return None
+        try:
+            raw = await asyncio.wait_for(
+                self._redis.get(READ_CACHE_KEY.format(key=key)), REDIS_TIMEOUT
+            )
+        except (RedisError, asyncio.TimeoutError) as e:
+            logger.warning("Couldn't read %s from Redis: %r", key, e)
+            return None
+        return tuple(json.loads(raw)) if raw is not None else None
+
+    async def _set_l2(self, key, entry, tags, stale_ttl):
+        if self._redis is None:
+            return
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.set(READ_CACHE_KEY.format(key=key), json.dumps(entry), ex=int(stale_ttl))
+                for tag in tags:
+                    tag_key = READ_CACHE_TAG_KEY.format(tag=tag)
+                    pipe.sadd(tag_key, key)
+                    pipe.expire(tag_key, int(stale_ttl))
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning("Couldn't store %s in Redis: %s", key, e)
+
+    def stats(self) -> dict:
+        return self._l1.stats()
+
+
+read_cache = TwoTierCache()
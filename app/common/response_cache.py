@@ -0,0 +1,139 @@
+import hashlib
+import inspect
+import json
+import logging
+from functools import wraps
+from typing import Callable, Iterable, Literal
+from urllib.parse import urlencode
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from redis.exceptions import RedisError
+
+from app.common.lru import TTLCache
+from app.common.versions import cache_versions
+from app.database.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_KEY = "response_cache:{digest}"
+
+
+def _principal(kwargs: dict) -> str:
+    user = kwargs.get("current_user")
+    if user is None:
+        return "-"
+    return f"{user.user_id}:{','.join(sorted(role.value for role in user.roles))}"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class ResponseCache:
+    """
+    Decorator for read-only JSON routes. Entries are keyed on path, query, principal
+    (current_user, if the route takes one) and the current tokens of the cache
+    versions the route depends on, so repository writes invalidate them by bumping
+    those versions. The strong ETag is derived from the same key, so If-None-Match
+    is answered with 304 before the entry or the database is touched.
+    Responses the route builds itself (404s, redirects) pass through uncached.
+
+    :param versions: maps the route's keyword arguments to version names
+                     (app.common.versions.table_version / user_version)
+    :param backend: "local" - per-process LRU, "redis" - shared between workers
+    """
+
+    def __init__(
+        self,
+        versions: Callable[[dict], Iterable[str]],
+        ttl: float = 300,
+        backend: Literal["local", "redis"] = "local",
+        maxsize: int = 1000,
+    ):
+        self.versions = versions
+        self.ttl = ttl
+        self.backend = backend
+        self._local = TTLCache(maxsize, ttl=ttl)
+
+    def __call__(self, func):
+        signature = inspect.signature(func)
+        request_param = next(
+            (name for name, param in signature.parameters.items() if param.annotation is Request),
+            None,
+        )
+        takes_request = request_param is not None
+        request_param = request_param or "request"
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            request = kwargs[request_param] if takes_request else kwargs.pop(request_param)
+            names = sorted(self.versions(kwargs))
+            tokens = await cache_versions.get(names)
+            if tokens is None:
+                return await func(*args, **kwargs)
+
+            key = json.dumps(
+                [
+                    request.url.path,
+                    urlencode(sorted(request.query_params.multi_items())),
+                    _principal(kwargs),
+                    names,
+                    tokens,
+                ]
+            )
+            digest = hashlib.sha256(key.encode()).hexdigest()
+            headers = {"ETag": f'"{digest[:32]}"', "Cache-Control": "private, no-cache"}
+
+            if_none_match = request.headers.get("if-none-match")
+            if if_none_match and _etag_matches(if_none_match, headers["ETag"]):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+            body = await self._get(request, digest)
+            if body is None:
+                result = await func(*args, **kwargs)
+                if isinstance(result, Response):
+                    return result
+                body = JSONResponse(jsonable_encoder(result)).body
+                await self._set(request, digest, body)
+            return Response(content=body, media_type="application/json", headers=headers)
+
+        if not takes_request:
+            # Ask FastAPI for the Request without changing the route's own signature
+            wrapper.__signature__ = signature.replace(
+                parameters=[
+                    *signature.parameters.values(),
+                    inspect.Parameter(
+                        request_param, inspect.Parameter.KEYWORD_ONLY, annotation=Request
+                    ),
+                ]
+            )
+        return wrapper
+
+    async def _get(self, request: Request, digest: str):
+        if self.backend == "local":
+            return self._local.get(digest)
+        redis = get_redis(request)
+        if redis is None:
+            return None
+        try:
+            body = await redis.get(RESPONSE_CACHE_KEY.format(digest=digest))
+        except RedisError as e:
+            logger.warning("Couldn't read cached response: %s", e)
+            return None
+        return body.encode() if isinstance(body, str) else body
+
+    async def _set(self, request: Request, digest: str, body: bytes):
+        if self.backend == "local":
+            self._local.set(digest, body)
+            return
+        redis = get_redis(request)
+        if redis is None:
+            return
+        try:
+            await redis.set(RESPONSE_CACHE_KEY.format(digest=digest), body, ex=int(self.ttl))
+        except RedisError as e:
+            logger.warning("Couldn't store cached response: %s", e)
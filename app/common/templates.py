@@ -1,5 +1,8 @@
 from pathlib import Path
+from typing import Any
 
+from fastapi import Request
+from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -7,3 +10,17 @@ FRONTEND_DIR = BASE_DIR.parent / "front"
 TEMPLATES_DIR = FRONTEND_DIR / "templates"
 
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
+
+
+def is_fragment_request(request: Request) -> bool:
+    """Whether the request came from htmx, which swaps the answer into the page itself"""
+    return request.headers.get("HX-Request") == "true"
+
+
+def render_fragment(name: str, context: dict[str, Any]) -> HTMLResponse:
+    """
+    Renders a partial template for is_fragment_request callers. Varies on HX-Request,
+    since the same URL answers others with a full page or a redirect.
+    """
+    html = templates.get_template(name).render(context)
+    return HTMLResponse(html, headers={"Vary": "HX-Request"})
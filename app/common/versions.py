@@ -0,0 +1,91 @@
+import logging
+import secrets
+from typing import Iterable, Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION_KEY = "cache_version:{name}"
+TABLE_VERSION = "table:{table}"
+USER_VERSION = "{table}:user:{user_id}"
+TREND_VERSION = "note_trend:{scope}"
+
+
+def table_version(table: str) -> str:
+    """Changes on any write to the table"""
+    return TABLE_VERSION.format(table=table)
+
+
+def user_version(table: str, user_id: int) -> str:
+    """Changes on writes to the rows of the table that belong to one user"""
+    return USER_VERSION.format(table=table, user_id=user_id)
+
+
+def trend_version(user_id: Optional[int]) -> str:
+    """
+    Changes when notes of trend buckets that are already over change (of the user,
+    or of anyone for None)
+    """
+    return TREND_VERSION.format(scope="all" if user_id is None else user_id)
+
+
+def _new_version() -> str:
+    return secrets.token_hex(8)
+
+
+class CacheVersions:
+    """
+    Version tokens that cached data is keyed on; bumping one orphans every entry
+    built under the old token. Tokens are random rather than counters, so a flushed
+    Redis can't bring an old token back. Without Redis (single-process dev setups)
+    they live in process memory.
+    """
+
+    def __init__(self):
+        self._redis: Optional[Redis] = None
+        self._local: dict[str, str] = {}
+
+    def bind(self, redis: Optional[Redis]):
+        self._redis = redis
+
+    async def get(self, names: Iterable[str]) -> Optional[tuple[str, ...]]:
+        """
+        :return: current tokens in the order of names, None if they can't be read
+                 (callers must bypass their cache)
+        """
+        names = list(names)
+        if self._redis is None:
+            return tuple(self._local.setdefault(name, _new_version()) for name in names)
+        keys = [CACHE_VERSION_KEY.format(name=name) for name in names]
+        try:
+            tokens = await self._redis.mget(keys)
+            missing = [key for key, token in zip(keys, tokens, strict=True) if token is None]
+            if missing:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    for key in missing:
+                        pipe.set(key, _new_version(), nx=True)
+                    pipe.mget(keys)
+                    tokens = (await pipe.execute())[-1]
+            return tuple(tokens)
+        except RedisError as e:
+            logger.warning("Couldn't read cache versions %s: %s", names, e)
+            return None
+
+    async def bump(self, *names: str):
+        if self._redis is None:
+            for name in names:
+                self._local[name] = _new_version()
+            return
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for name in names:
+                    pipe.set(CACHE_VERSION_KEY.format(name=name), _new_version())
+                await pipe.execute()
+        except RedisError as e:
+            logger.error("Couldn't bump cache versions %s: %s", names, e)
+
+
+cache_versions = CacheVersions()
+
@@ -14,11 +14,28 @@ class Mode(str, Enum):
 class DatabaseConfig:
     database_url: str
     sqlalchemy_url: str
+    pool_min_size: int = 5
+    pool_max_size: int = 20
+    pool_max_inactive_lifetime: float = 300.0  # seconds before an idle connection is closed
+    pool_acquire_timeout: float = 5.0  # seconds to wait for a free connection
+
+
+@dataclass
+class RedisConfig:
+    url: str = "redis://localhost:6379/0"
+
+
+@dataclass
+class HashingConfig:
+    max_workers: int = 4  # threads running bcrypt concurrently
+    max_pending: int = 16  # calls allowed to wait for a free thread before answering 503
 
 
 @dataclass
 class Config:
     db: DatabaseConfig
+    redis: RedisConfig
+    hashing: HashingConfig
     secret_key: str
     debug: bool
     mode: Mode
@@ -32,6 +49,15 @@ def load_config(path: str = None) -> Config:
         db=DatabaseConfig(
             database_url=env("DATABASE_URL"),
             sqlalchemy_url=env("ASYNC_SQLALCHEMY_DATABASE_URL"),
+            pool_min_size=env.int("DB_POOL_MIN_SIZE", default=5),
+            pool_max_size=env.int("DB_POOL_MAX_SIZE", default=20),
+            pool_max_inactive_lifetime=env.float("DB_POOL_MAX_INACTIVE_LIFETIME", default=300.0),
+            pool_acquire_timeout=env.float("DB_POOL_ACQUIRE_TIMEOUT", default=5.0),
+        ),
+        redis=RedisConfig(url=env("REDIS_URL", default="redis://localhost:6379/0")),
+        hashing=HashingConfig(
+            max_workers=env.int("HASHING_MAX_WORKERS", default=4),
+            max_pending=env.int("HASHING_MAX_PENDING", default=16),
         ),
         secret_key=env("SECRET_KEY"),
         debug=env.bool("DEBUG", default=False),
@@ -2,6 +2,9 @@ from urllib.parse import urlencode
 
 from fastapi import Request, status
 from fastapi.encoders import jsonable_encoder
+from fastapi.exception_handlers import (
+    http_exception_handler,
+)
 from fastapi.exception_handlers import (
     request_validation_exception_handler as fastapi_exception_handler,
 )
@@ -132,7 +135,8 @@ async def not_found_handler(request: Request, exc: HTTPException):
         return templates.TemplateResponse(
             "Error404.html", {"request": request}, status_code=404
         )
-    raise exc
+    # Other HTTP errors (403, 429, 503, ...) keep their status instead of becoming a 500 page
+    return await http_exception_handler(request, exc)
 
 
 async def internal_server_error_handler(request: Request, exc: Exception):
@@ -1,16 +1,237 @@
+import asyncio
+import re
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Optional
+
 import asyncpg
+from fastapi import HTTPException, Request, status
+from starlette.datastructures import MutableHeaders
 
 from app.core.config import load_config
 
 config = load_config()
 DATABASE_URL = config.db.database_url
 
-VALID_TABLES = {"users", "things_to_do", "user_info", "user_roles"}
+DB_CONNECTIONS_STATE = "db_connections"
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+
+
+async def create_db_pool() -> asyncpg.Pool:
+    """Creates the application-wide connection pool (called from the app lifespan)"""
+    return await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=config.db.pool_min_size,
+        max_size=config.db.pool_max_size,
+        max_inactive_connection_lifetime=config.db.pool_max_inactive_lifetime,
+    )
+
+
+class LazyConnection:
+    """
+    Connection handle that checks a connection out of the pool on the first query.
+    Exposes the subset of asyncpg.Connection used by the repositories, so requests
+    that never run a query (guests, cache hits) never touch Postgres.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, timeout: Optional[float] = None):
+        self._pool = pool
+        self._timeout = timeout
+        self._conn: Optional[asyncpg.Connection] = None
+        self.query_count = 0
+
+    @property
+    def acquired(self) -> bool:
+        return self._conn is not None
+
+    def sibling(self) -> "LazyConnection":
+        """A new handle on the same pool, for work that mustn't depend on this one being held"""
+        return LazyConnection(self._pool, self._timeout)
+
+    async def acquire(self) -> asyncpg.Connection:
+        if self._conn is None:
+            try:
+                self._conn = await self._pool.acquire(timeout=self._timeout)
+            except asyncio.TimeoutError:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Database is busy, try again later",
+                )
+        return self._conn
+
+    async def release(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await self._pool.release(conn)
+
+    async def _for_statement(self) -> asyncpg.Connection:
+        self.query_count += 1
+        return await self.acquire()
+
+    async def fetch(self, query: str, *args, **kwargs):
+        conn = await self._for_statement()
+        return await conn.fetch(query, *args, **kwargs)
+
+    async def fetchrow(self, query: str, *args, **kwargs):
+        conn = await self._for_statement()
+        return await conn.fetchrow(query, *args, **kwargs)
+
+    async def fetchval(self, query: str, *args, **kwargs):
+        conn = await self._for_statement()
+        return await conn.fetchval(query, *args, **kwargs)
+
+    async def execute(self, query: str, *args, **kwargs):
+        conn = await self._for_statement()
+        return await conn.execute(query, *args, **kwargs)
+
+    async def executemany(self, query: str, args, **kwargs):
+        conn = await self._for_statement()
+        return await conn.executemany(query, args, **kwargs)
+
+    async def copy_records_to_table(self, table_name: str, **kwargs):
+        conn = await self._for_statement()
+        return await conn.copy_records_to_table(table_name, **kwargs)
+
+    @asynccontextmanager
+    async def transaction(self, **kwargs):
+        conn = await self.acquire()
+        async with conn.transaction(**kwargs):
+            yield conn
+
+
+# pg_export_snapshot() ids look like 00000003-0000001B-1
+_SNAPSHOT_ID = re.compile(r"[0-9A-F]+(-[0-9A-F]+)+")
 
+FANOUT_ACQUIRE_TIMEOUT = 0.05  # Longest a read waits for a spare connection while db is held
+_NO_SPARE_CONNECTION = object()
 
-async def get_db_connection():
-    conn = await asyncpg.connect(DATABASE_URL)
+
+def _has_spare_connection(pool: asyncpg.Pool) -> bool:
+    """An idle connection, or room to open one, that no other request has to release first"""
+    return pool.get_idle_size() > 0 or pool.get_size() < pool.get_max_size()
+
+
+async def acquire_spare_connection(db: LazyConnection) -> Optional[LazyConnection]:
+    """
+    A connection of its own next to db, taken only if db's pool has one to spare right
+    away, so a request holding db never waits for other requests to give theirs back.
+    The caller releases it and adds its query_count to db's.
+    :return: acquired connection, None if there is none to spare
+    """
+    if not _has_spare_connection(db._pool):
+        return None
+    conn = LazyConnection(db._pool, FANOUT_ACQUIRE_TIMEOUT)
+    try:
+        await conn.acquire()
+    except HTTPException:  # Lost the spare connection to another request
+        return None
+    return conn
+
+
+async def run_concurrently(
+    db: LazyConnection,
+    *reads: Callable[[LazyConnection], Awaitable[Any]],
+    snapshot: bool = False,
+) -> list:
+    """
+    Runs independent reads at the same time, so they take as long as the slowest one:
+    the first on db, each of the others on a connection of its own from db's pool
+    (released as soon as that read is done).
+    Extra connections are only taken if the pool has one to spare right away; reads
+    that get none run on db after the first one. A request holding db never waits for
+    other requests to give connections back, which at a full pool would leave every
+    request holding one connection and waiting for a second.
+    With snapshot=True all of them read one REPEATABLE READ snapshot, exported from
+    db's transaction, at the cost of a few extra round trips per connection.
+    A failing read cancels the rest. Anything but a LazyConnection (a plain
+    connection, a test double) runs the reads one after another.
+
+    :param reads: callables taking the connection to query, e.g.
+                  lambda conn: UserRepository(conn).get_users_page(limit)
+    :return: results in the order of reads
+    """
+    if not isinstance(db, LazyConnection) or len(reads) < 2:
+        return [await read(db) for read in reads]
+
+    async def on_own_connection(read, snapshot_id: Optional[str]):
+        conn = await acquire_spare_connection(db)
+        if conn is None:
+            return _NO_SPARE_CONNECTION
+        try:
+            if snapshot_id is None:
+                return await read(conn)
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                await conn.execute(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'")
+                return await read(conn)
+        finally:
+            db.query_count += conn.query_count
+            await conn.release()
+
+    async def fan_out(snapshot_id: Optional[str] = None):
+        tasks = [asyncio.ensure_future(read(db)) for read in reads[:1]] + [
+            asyncio.ensure_future(on_own_connection(read, snapshot_id)) for read in reads[1:]
+        ]
+        try:
+            results = list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            # Let the cancelled reads give their connections back before returning
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        for i, result in enumerate(results):
+            if result is _NO_SPARE_CONNECTION:
+                results[i] = await reads[i](db)  # Same snapshot: db's transaction exported it
+        return results
+
+    if not snapshot:
+        return await fan_out()
+    async with db.transaction(isolation="repeatable_read", readonly=True):
+        snapshot_id = await db.fetchval("SELECT pg_export_snapshot()")
+        if not _SNAPSHOT_ID.fullmatch(snapshot_id):  # It's inlined into SQL below
+            raise ValueError(f"Unexpected snapshot id {snapshot_id!r}")
+        return await fan_out(snapshot_id)
+
+
+async def acquire_connection(request: Request) -> LazyConnection:
+    """
+    A pool connection of its own, for work that outlives the request-scoped one
+    (streamed responses). It's checked out right away, so an exhausted pool answers 503
+    before any response is started; the caller releases it (releasing twice is harmless).
+    """
+    conn = LazyConnection(request.app.state.db_pool, config.db.pool_acquire_timeout)
+    await conn.acquire()
+    return conn
+
+
+async def get_db_connection(request: Request):
+    db = LazyConnection(request.app.state.db_pool, config.db.pool_acquire_timeout)
+    request.scope.setdefault("state", {}).setdefault(DB_CONNECTIONS_STATE, []).append(db)
     try:
-        yield conn
+        yield db
     finally:
-        await conn.close()
+        await db.release()
+
+
+class QueryCountMiddleware:
+    """
+    Adds the number of statements the request ran through get_db_connection as
+    X-DB-Query-Count (for checking batching and caching; enabled in DEV mode).
+    Statements of streamed bodies run after the headers and aren't counted.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                connections = scope.get("state", {}).get(DB_CONNECTIONS_STATE, ())
+                headers = MutableHeaders(scope=message)
+                headers[QUERY_COUNT_HEADER] = str(sum(db.query_count for db in connections))
+            await send(message)
+
+        await self.app(scope, receive, send_with_count)
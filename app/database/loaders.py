@@ -0,0 +1,37 @@
+import asyncio
+
+import asyncpg
+from fastapi import Depends
+
+from app.common.loader import DataLoader
+from app.database.database import get_db_connection
+from app.database.repositories.user_repository import UserRepository
+
+
+class RequestLoaders:
+    """
+    Repository lookups memoized for one request and batched per event-loop tick.
+    A single key goes through the single-row query (and the read cache where it
+    has one); several keys are fetched together with = ANY($1).
+    """
+
+    def __init__(self, db: asyncpg.Connection):
+        self._users = UserRepository(db)
+        lock = asyncio.Lock()  # The loaders share the request's connection
+        self.user_roles = DataLoader(self._load_user_roles, lock)
+        self.user_profiles = DataLoader(self._load_user_profiles, lock)
+
+    async def _load_user_roles(self, user_ids: list[int]):
+        if len(user_ids) == 1:
+            return {user_ids[0]: await self._users.get_user_roles_by_id(user_ids[0])}
+        return await self._users.get_user_roles_by_ids(user_ids)
+
+    async def _load_user_profiles(self, user_ids: list[int]):
+        if len(user_ids) == 1:
+            return {user_ids[0]: await self._users.get_user_full_info(user_ids[0])}
+        return await self._users.get_users_full_info(user_ids)
+
+
+async def get_loaders(db: asyncpg.Connection = Depends(get_db_connection)) -> RequestLoaders:
+    """FastAPI caches dependencies per request, so everything in a request shares these"""
+    return RequestLoaders(db)
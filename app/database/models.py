@@ -3,12 +3,17 @@ from enum import Enum as PyEnum
 from typing import Optional
 
 from sqlalchemy import (
+    BigInteger,
+    Computed,
+    Double,
     Enum,
     ForeignKey,
+    Index,
+    SmallInteger,
     String,
     UniqueConstraint, Boolean, text, func
 )
-from sqlalchemy.dialects.postgresql import ENUM
+from sqlalchemy.dialects.postgresql import ENUM, TSVECTOR
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -25,6 +30,14 @@ class RoleEnum(str, PyEnum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index(
+            "ix_users_username_trgm",
+            "username",
+            postgresql_using="gin",
+            postgresql_ops={"username": "gin_trgm_ops"},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     username: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
@@ -41,6 +54,20 @@ class User(Base):
 
 class UserInfo(Base):
     __tablename__ = "user_info"
+    __table_args__ = (
+        Index(
+            "ix_user_info_email_trgm",
+            "email",
+            postgresql_using="gin",
+            postgresql_ops={"email": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_user_info_full_name_trgm",
+            "full_name",
+            postgresql_using="gin",
+            postgresql_ops={"full_name": "gin_trgm_ops"},
+        ),
+    )
 
     user_id: Mapped[int] = mapped_column(
         ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
@@ -55,6 +82,7 @@ class UserRole(Base):
     __tablename__ = "user_roles"
     __table_args__ = (
         UniqueConstraint("user_id", "user_role", name="uq_user_role_pair"),
+        Index("ix_user_roles_user_role_user_id", "user_role", "user_id"),
     )
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -66,8 +94,32 @@ class UserRole(Base):
     user = relationship("User", back_populates="roles")
 
 
+NOTE_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+)
+
+
 class Todo(Base):
     __tablename__ = "things_to_do"
+    __table_args__ = (
+        Index("ix_things_to_do_user_id_id", "user_id", "id"),
+        Index("ix_things_to_do_user_id_created_at", "user_id", "created_at"),
+        Index("ix_things_to_do_created_at_id", "created_at", "id"),
+        Index(
+            "ix_things_to_do_completed_at",
+            "completed_at",
+            postgresql_where=text("completed"),
+            postgresql_include=["created_at"],
+        ),
+        Index("ix_things_to_do_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_things_to_do_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(String(255))
@@ -87,4 +139,46 @@ class Todo(Base):
     )
     completed_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
 
+    # Maintained by Postgres, used by /notes/search
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR, Computed(NOTE_SEARCH_VECTOR, persisted=True)
+    )
+
     user = relationship("User", back_populates="todos")
+
+
+# Rollups of things_to_do kept current by statement-level triggers (see the
+# note_rollups and note_rollup_shards migrations). user_id 0 holds the totals over all
+# users, spread over slots by writing transaction so writers don't queue on one row;
+# readers sum the slots. Per-user rows only use slot 0.
+GLOBAL_ROLLUP_USER_ID = 0
+
+
+class NoteRollup(Base):
+    __tablename__ = "note_rollups"
+
+    user_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    slot: Mapped[int] = mapped_column(
+        SmallInteger, primary_key=True, autoincrement=False, server_default=text("0")
+    )
+    total: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default=text("0"))
+    completed: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default=text("0"))
+    # Completed notes that have completed_at, i.e. the ones completion_seconds sums over
+    timed_completed: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, server_default=text("0")
+    )
+    completion_seconds: Mapped[float] = mapped_column(
+        Double, nullable=False, server_default=text("0")
+    )
+
+
+class NoteHourlyRollup(Base):
+    __tablename__ = "note_hourly_rollups"
+
+    user_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    # 24 * day of week (0 = Sunday) + hour, of created_at as stored (UTC)
+    hour_of_week: Mapped[int] = mapped_column(SmallInteger, primary_key=True, autoincrement=False)
+    slot: Mapped[int] = mapped_column(
+        SmallInteger, primary_key=True, autoincrement=False, server_default=text("0")
+    )
+    created: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default=text("0"))
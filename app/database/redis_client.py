@@ -0,0 +1,9 @@
+from typing import Optional
+
+from fastapi import Request
+from redis.asyncio import Redis
+
+
+def get_redis(request: Request) -> Optional[Redis]:
+    """Shared Redis client created in the app lifespan, None when the app runs without it"""
+    return getattr(request.app.state, "redis", None)
@@ -1,113 +1,493 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterable, Optional
+
 import asyncpg
 
+from app.common.invalidation import invalidate_closed_trends, invalidate_table
+from app.database.models import GLOBAL_ROLLUP_USER_ID
+
+NOTE_COLUMNS = (
+    "id",
+    "title",
+    "description",
+    "user_id",
+    "completed",
+    "created_at",
+    "completed_at",
+)
+
+EXPORT_PREFETCH = 1000  # Rows per round trip of the export cursor
+
+# description with the characters HTML gives meaning to replaced by entities (& first),
+# so the <mark> tags of ts_headline are the only markup in search snippets
+_HTML_ESCAPED_DESCRIPTION = (
+    "replace(replace(replace(replace(replace(description, '&', '&amp;'), '<', '&lt;'), "
+    """'>', '&gt;'), '"', '&quot;'), '''', '&#39;')"""
+)
+
+COMPLETION_PERCENTILES = (0.5, 0.9, 0.99)
+# Histogram bucket edges in hours; buckets are [0, 1), [1, 4), ..., [168, inf)
+COMPLETION_HISTOGRAM_EDGES = (1.0, 4.0, 12.0, 24.0, 72.0, 168.0)
+_COMPLETION_BUCKET_COUNTS = ",\n".join(
+    f"count(*) FILTER (WHERE bucket = {bucket}) AS bucket_{bucket}"
+    for bucket in range(len(COMPLETION_HISTOGRAM_EDGES) + 1)
+)
+
+
+@dataclass(frozen=True)
+class NoteFilters:
+    """Filters of /notes/get_notes"""
+
+    completed: Optional[bool] = None
+    user_id: Optional[int] = None
+    created_before: Optional[datetime] = None
+    created_after: Optional[datetime] = None
+    title_contains: Optional[str] = None
+
+    def to_sql(self, params: list) -> list[str]:
+        """Builds WHERE clauses, appending their values to params"""
+        clauses = ["TRUE"]
+        if self.completed is not None:
+            params.append(self.completed)
+            clauses.append(f"completed = ${len(params)}")
+        if self.user_id is not None:
+            params.append(self.user_id)
+            clauses.append(f"user_id = ${len(params)}")
+        if self.created_before:
+            params.append(self.created_before)
+            clauses.append(f"created_at <= ${len(params)}")
+        if self.created_after:
+            params.append(self.created_after)
+            clauses.append(f"created_at >= ${len(params)}")
+        if self.title_contains:
+            params.append(f"%{self.title_contains}%")
+            clauses.append(f"title ILIKE ${len(params)}")
+        return clauses
+
 
 class NoteRepository:
     def __init__(self, db: asyncpg.Connection):
         self.db = db
 
     async def create_note(self, title: str, description: str, user_id: int):
-        return await self.db.fetchrow(
-            """
+        row = await self.db.fetchrow(
+            f"""
             INSERT INTO things_to_do(title, description, user_id)
             VALUES ($1, $2, $3)
-            RETURNING *
+            RETURNING {", ".join(NOTE_COLUMNS)}
             """,
             title,
             description,
             user_id,
         )
+        await invalidate_table("things_to_do", [user_id])
+        return row
 
-    async def get_user_notes(self, user_id: int):
+    async def import_notes(
+        self, batches: AsyncIterable[list[tuple[str, str]]], user_id: int
+    ) -> int:
+        """
+        COPYs batches of (title, description) into the user's notes in one transaction,
+        so a failed batch leaves none of the file imported
+        :return: number of imported notes
+        """
+        imported = 0
+        async with self.db.transaction():
+            async for batch in batches:
+                await self.db.copy_records_to_table(
+                    "things_to_do",
+                    records=[(title, description, user_id) for title, description in batch],
+                    columns=["title", "description", "user_id"],
+                )
+                imported += len(batch)
+        if imported:
+            await invalidate_table("things_to_do", [user_id])
+        return imported
+
+    async def get_user_notes_page(self, user_id: int, limit: int, before: Optional[int] = None):
+        """
+        A page of the user's notes, newest first, below note id `before` (keyset; an index
+        range of ix_things_to_do_user_id_id)
+        """
+        params = [user_id, limit]
+        before_clause = ""
+        if before is not None:
+            params.append(before)
+            before_clause = f"AND id < ${len(params)}"
         return await self.db.fetch(
-            """
-            SELECT * 
+            f"""
+            SELECT {", ".join(NOTE_COLUMNS)}
             FROM things_to_do
-            WHERE user_id = $1
+            WHERE user_id = $1 {before_clause}
+            ORDER BY id DESC
+            LIMIT $2
             """,
-            user_id,
+            *params,
         )
 
-    async def get_filtered_notes(self, query: str, params: list):
-        return await self.db.fetch(query, *params)
+    async def get_note_total(self, user_id: int) -> int:
+        """Number of the user's notes, from the rollups rather than counting them"""
+        total = await self.db.fetchval(
+            "SELECT total FROM note_rollups WHERE user_id = $1 AND slot = 0", user_id
+        )
+        return total or 0
 
-    async def get_note_by_id(self, note_id: int):
-        return await self.db.fetchrow(
-            "SELECT * FROM things_to_do WHERE id = $1", note_id
+    async def get_filtered_notes(
+        self,
+        filters: NoteFilters,
+        sort_column: str,
+        descending: bool,
+        limit: int,
+        offset: int = 0,
+        after: Optional[tuple] = None,
+    ) -> tuple[bool, list]:
+        """
+        Page of notes. sort_column must be whitelisted by the caller.
+        after=(sort value, id) of the last seen row switches to keyset pagination,
+        which reads an index range instead of skipping `offset` rows.
+        When filtering by user, the user existence check runs in the same query.
+        :return: (whether filters.user_id exists, rows)
+        """
+        params = [limit, offset]
+        clauses = filters.to_sql(params)
+        order = "DESC" if descending else "ASC"
+        if after is not None:
+            params.extend(after)
+            clauses.append(
+                f"({sort_column}, id) {'<' if descending else '>'} (${len(params) - 1}, ${len(params)})"
+            )
+        page_query = f"""
+            SELECT {", ".join(NOTE_COLUMNS)}
+            FROM things_to_do
+            WHERE {" AND ".join(clauses)}
+            ORDER BY {sort_column} {order}, id {order}
+            LIMIT $1
+            OFFSET $2
+        """
+        if filters.user_id is None:
+            return True, await self.db.fetch(page_query, *params)
+
+        params.append(filters.user_id)
+        rows = await self.db.fetch(
+            f"""
+            SELECT
+                EXISTS (SELECT 1 FROM users WHERE id = ${len(params)}) AS user_exists,
+                page.*
+            FROM (SELECT 1) AS one
+            LEFT JOIN LATERAL ({page_query}) AS page ON TRUE
+            ORDER BY page.{sort_column} {order}, page.id {order}
+            """,
+            *params,
         )
+        user_exists = bool(rows) and rows[0]["user_exists"]
+        return user_exists, [row for row in rows if row["id"] is not None]
 
-    async def delete_note(self, note_id: int):
-        return await self.db.execute("DELETE FROM things_to_do WHERE id = $1", note_id)
+    async def iter_notes(self, filters: NoteFilters, prefetch: int = EXPORT_PREFETCH):
+        """
+        Every note matching filters in id order, read through a server-side cursor
+        prefetch rows at a time, so memory doesn't grow with the number of notes.
+        Rows come from one REPEATABLE READ snapshot. self.db must be a plain
+        asyncpg connection held for the whole iteration (see database.acquire_connection).
+        """
+        params = []
+        clauses = filters.to_sql(params)
+        async with self.db.transaction(isolation="repeatable_read", readonly=True):
+            async for row in self.db.cursor(
+                f"""
+                SELECT {", ".join(NOTE_COLUMNS)}
+                FROM things_to_do
+                WHERE {" AND ".join(clauses)}
+                ORDER BY id
+                """,
+                *params,
+                prefetch=prefetch,
+            ):
+                yield row
 
-    async def complete_note(
-        self, note_id: int,
-    ):
-        return await self.db.execute(
-            """
-            UPDATE things_to_do
-            SET completed=true, completed_at=CURRENT_TIMESTAMP
+    async def search_notes(self, text: str, user_id: Optional[int], limit: int):
+        """
+        Ranked search: full-text match on title and description (GIN over search_vector)
+        or fuzzy title match (pg_trgm), optionally scoped to a user, best
+        ts_rank_cd + similarity first. Snippets are produced only for the returned page;
+        they are HTML with the description escaped, <mark> being the only markup.
+        """
+        params = [text, limit]
+        user_clause = ""
+        if user_id is not None:
+            params.append(user_id)
+            user_clause = f"AND user_id = ${len(params)}"
+        return await self.db.fetch(
+            f"""
+            WITH matches AS (
+                SELECT
+                    {", ".join(NOTE_COLUMNS)},
+                    ts_rank_cd(search_vector, query) + similarity(title, $1) AS rank,
+                    query
+                FROM things_to_do, websearch_to_tsquery('simple', $1) AS query
+                WHERE (search_vector @@ query OR title % $1) {user_clause}
+                ORDER BY rank DESC, id DESC
+                LIMIT $2
+            )
+            SELECT
+                {", ".join(NOTE_COLUMNS)},
+                rank,
+                ts_headline(
+                    'simple', {_HTML_ESCAPED_DESCRIPTION}, query,
+                    'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5'
+                ) AS snippet
+            FROM matches
+            ORDER BY rank DESC, id DESC
+            """,
+            *params,
+        )
+
+    async def get_note_for_user(self, note_id: int, user_id: int, any_owner: bool):
+        """
+        Owner-scoped lookup
+        :return: note row with `allowed` flag (owner or any_owner), None if the note doesn't exist
+        """
+        return await self.db.fetchrow(
+            f"""
+            SELECT (user_id = $2 OR $3) AS allowed, {", ".join(NOTE_COLUMNS)}
+            FROM things_to_do
             WHERE id = $1
             """,
             note_id,
+            user_id,
+            any_owner,
         )
 
-    async def update_note(
-        self, note_id: int, title: str, description: str, completed: bool
+    async def delete_note_for_user(self, note_id: int, user_id: int, any_owner: bool):
+        """
+        Deletes the note if the user owns it (or any_owner) in a single statement
+        :return: row with `allowed` flag, None if the note doesn't exist
+        """
+        row = await self.db.fetchrow(
+            """
+            WITH target AS (
+                SELECT id, user_id AS owner_id, (user_id = $2 OR $3) AS allowed
+                FROM things_to_do
+                WHERE id = $1
+            ), deleted AS (
+                DELETE FROM things_to_do
+                USING target
+                WHERE things_to_do.id = target.id AND target.allowed
+            )
+            SELECT allowed, owner_id FROM target
+            """,
+            note_id,
+            user_id,
+            any_owner,
+        )
+        await self._bump_if_allowed(row, closed_trends=True)
+        return row
+
+    async def complete_note_for_user(self, note_id: int, user_id: int, any_owner: bool):
+        """
+        Marks the note completed if the user owns it (or any_owner) in a single statement
+        :return: updated row with `allowed` flag, None if the note doesn't exist
+        """
+        row = await self.db.fetchrow(
+            f"""
+            WITH target AS (
+                SELECT id, user_id AS owner_id, (user_id = $2 OR $3) AS allowed, completed
+                FROM things_to_do
+                WHERE id = $1
+            ), updated AS (
+                UPDATE things_to_do
+                SET completed = true, completed_at = CURRENT_TIMESTAMP
+                FROM target
+                WHERE things_to_do.id = target.id AND target.allowed
+                RETURNING {", ".join(f"things_to_do.{c}" for c in NOTE_COLUMNS)}
+            )
+            SELECT
+                target.allowed,
+                target.owner_id,
+                target.completed AS was_completed,
+                {", ".join(f"updated.{c}" for c in NOTE_COLUMNS)}
+            FROM target
+            LEFT JOIN updated ON TRUE
+            """,
+            note_id,
+            user_id,
+            any_owner,
+        )
+        # Completing it again moves completed_at out of the bucket it was counted in
+        await self._bump_if_allowed(row, closed_trends=row is not None and row["was_completed"])
+        return row
+
+    async def update_note_for_user(
+        self,
+        note_id: int,
+        user_id: int,
+        any_owner: bool,
+        title: str,
+        description: str,
+        completed: bool,
     ):
-        return await self.db.execute(
+        """
+        Updates the note if the user owns it (or any_owner) in a single statement
+        :return: row with `allowed` flag, None if the note doesn't exist
+        """
+        row = await self.db.fetchrow(
             """
-            UPDATE things_to_do
-            SET title = $1, description = $2, completed=$3
-            WHERE id = $4
+            WITH target AS (
+                SELECT id, user_id AS owner_id, (user_id = $2 OR $3) AS allowed, completed
+                FROM things_to_do
+                WHERE id = $1
+            ), updated AS (
+                UPDATE things_to_do
+                SET title = $4, description = $5, completed = $6
+                FROM target
+                WHERE things_to_do.id = target.id AND target.allowed
+            )
+            SELECT allowed, owner_id, completed <> $6 AS completion_changed FROM target
             """,
+            note_id,
+            user_id,
+            any_owner,
             title,
             description,
             completed,
-            note_id,
         )
+        # The note leaves (or re-enters) the bucket of its completed_at
+        await self._bump_if_allowed(
+            row, closed_trends=row is not None and row["completion_changed"]
+        )
+        return row
 
-    async def bulk_complete(self, note_ids: list[int], completed: bool):
-        return await self.db.execute(
+    async def bulk_complete(self, note_ids: list[int], completed: bool) -> int:
+        """:return: number of updated notes"""
+        row = await self.db.fetchrow(
             """
-            UPDATE things_to_do
-            SET completed = $1,
-                completed_at = CASE WHEN $1 THEN CURRENT_TIMESTAMP ELSE NULL END
-            WHERE id = ANY($2::int[])
+            WITH updated AS (
+                UPDATE things_to_do AS t
+                SET completed = $1,
+                    completed_at = CASE WHEN $1 THEN CURRENT_TIMESTAMP ELSE NULL END
+                FROM things_to_do AS old
+                WHERE t.id = ANY($2::int[]) AND old.id = t.id
+                RETURNING t.user_id, old.completed AS was_completed
+            )
+            SELECT
+                count(*) AS updated_count,
+                array_agg(DISTINCT user_id) AS owner_ids,
+                array_agg(DISTINCT user_id) FILTER (WHERE was_completed) AS history_owner_ids
+            FROM updated
             """,
             completed,
             note_ids,
         )
+        if row["updated_count"]:
+            await invalidate_table("things_to_do", row["owner_ids"])
+        # Notes that were completed leave the bucket of their old completed_at
+        if row["history_owner_ids"]:
+            await invalidate_closed_trends(row["history_owner_ids"])
+        return row["updated_count"]
 
-    async def get_analytics(self, timezone: str):
-        total = await self.db.fetchval("SELECT COUNT(*) FROM things_to_do")
-        status_counts = await self.db.fetch(
-            "SELECT completed, COUNT(*) as count FROM things_to_do GROUP BY completed"
-        )
-        avg_time = await self.db.fetchval(
-            """
-            SELECT AVG(EXTRACT(EPOCH FROM (completed_at - created_at)) / 3600) 
-            FROM things_to_do
-            WHERE completed = true
+    @staticmethod
+    async def _bump_if_allowed(row, closed_trends: bool = False):
+        if row is not None and row["allowed"]:
+            await invalidate_table("things_to_do", [row["owner_id"]])
+            if closed_trends:
+                await invalidate_closed_trends([row["owner_id"]])
+
+    async def get_analytics(self, user_id: Optional[int] = None):
+        """
+        Reads the trigger-maintained rollups of one user, or of all notes
+        :return: rollup totals row (None if no notes were ever counted) and
+                 (hour_of_week, created) rows bucketed by UTC hour of week
+        """
+        rollup_user_id = GLOBAL_ROLLUP_USER_ID if user_id is None else user_id
+        # The global rows are spread over slots (per-user rows have just one)
+        totals = await self.db.fetchrow(
             """
+            SELECT
+                sum(total)::bigint AS total,
+                sum(completed)::bigint AS completed,
+                sum(timed_completed)::bigint AS timed_completed,
+                sum(completion_seconds) AS completion_seconds
+            FROM note_rollups
+            WHERE user_id = $1
+            HAVING count(*) > 0
+            """,
+            rollup_user_id,
         )
-        weekday_raw = await self.db.fetch(
+        hourly = await self.db.fetch(
             """
+            SELECT hour_of_week, sum(created)::bigint AS created
+            FROM note_hourly_rollups
+            WHERE user_id = $1
+            GROUP BY hour_of_week
+            HAVING sum(created) > 0
+            """,
+            rollup_user_id,
+        )
+        return totals, hourly
+
+    async def get_trend_counts(
+        self, bounds: list[tuple[datetime, datetime]], user_id: Optional[int] = None
+    ):
+        """
+        Notes created and completed within each [start, end) range, one index range
+        scan per bucket and column
+        :return: rows of (bucket: 1-based position in bounds, created, completed)
+        """
+        params = [[start for start, _ in bounds], [end for _, end in bounds]]
+        user_clause = ""
+        if user_id is not None:
+            params.append(user_id)
+            user_clause = f"AND user_id = ${len(params)}"
+        return await self.db.fetch(
+            f"""
             SELECT
-                to_char(created_at AT TIME ZONE $1, 'Day') as weekday,
-                EXTRACT(DOW FROM created_at AT TIME ZONE $1) as dow,
-                COUNT(*) as count
-            FROM things_to_do
-            GROUP BY weekday, dow
-            ORDER BY dow
+                b.bucket,
+                (
+                    SELECT count(*) FROM things_to_do
+                    WHERE created_at >= b.utc_start AND created_at < b.utc_end {user_clause}
+                ) AS created,
+                (
+                    SELECT count(*) FROM things_to_do
+                    WHERE completed
+                        AND completed_at >= b.utc_start AND completed_at < b.utc_end
+                        {user_clause}
+                ) AS completed
+            FROM unnest($1::timestamp[], $2::timestamp[])
+                WITH ORDINALITY AS b(utc_start, utc_end, bucket)
             """,
-            timezone,
+            *params,
         )
-        return total, status_counts, avg_time, weekday_raw
 
-    async def get_note_owner(self, note_id: int) -> int:
-        row = await self.db.fetchrow(
-            "SELECT user_id FROM things_to_do WHERE id = $1",
-            note_id,
+    async def get_completion_stats(self, user_id: Optional[int] = None):
+        """
+        Percentiles and histogram of completion times in one pass over completed notes
+        (an index-only scan of ix_things_to_do_completed_at when not filtered by user).
+        OFFSET 0 keeps Postgres from flattening the subqueries, which would recompute
+        the duration and bucket inside every FILTER aggregate.
+        :return: row with count, percentiles (hours, in COMPLETION_PERCENTILES order)
+                 and bucket_0..bucket_N counts over COMPLETION_HISTOGRAM_EDGES
+        """
+        params = [list(COMPLETION_PERCENTILES), list(COMPLETION_HISTOGRAM_EDGES)]
+        user_clause = ""
+        if user_id is not None:
+            params.append(user_id)
+            user_clause = f"AND user_id = ${len(params)}"
+        return await self.db.fetchrow(
+            f"""
+            SELECT
+                count(*) AS count,
+                percentile_cont($1::float8[]) WITHIN GROUP (ORDER BY hours) AS percentiles,
+                {_COMPLETION_BUCKET_COUNTS}
+            FROM (
+                SELECT hours, width_bucket(hours, $2::float8[]) AS bucket
+                FROM (
+                    SELECT extract(EPOCH FROM completed_at - created_at)::float8 / 3600 AS hours
+                    FROM things_to_do
+                    WHERE completed AND completed_at IS NOT NULL {user_clause}
+                    OFFSET 0
+                ) AS durations
+                OFFSET 0
+            ) AS bucketed
+            """,
+            *params,
         )
-        if row is None:
-            return -1
-        return row["user_id"]
@@ -5,9 +5,23 @@ import asyncpg
 from asyncpg import UniqueViolationError
 
 from app.api.schemas.models import RoleEnum, UserRole
+from app.common.invalidation import invalidate_closed_trends, invalidate_table
+from app.common.read_cache import read_cache
+from app.common.versions import user_version
+
+# Shorter terms have no trigram to look up, so the trigram indexes can't narrow them
+# down and the leading-% ILIKE would read every user
+MIN_SEARCH_LENGTH = 3
+
+
+def _escape_like(text: str) -> str:
+    """Makes LIKE wildcards in user input match literally"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
 class UserRepository:
+    """Writes invalidate the "users" caches, which cover users, user_info and user_roles"""
+
     def __init__(self, db: asyncpg.Connection):
         self.db = db
 
@@ -22,9 +36,10 @@ class UserRepository:
                 username,
                 hashed_password,
             )
-            return uid
         except UniqueViolationError:
             return -1
+        await invalidate_table("users", [uid])
+        return uid
 
     async def create_user_info(self, user_id: int, full_name: str, email: str):
         await self.db.execute(
@@ -36,6 +51,7 @@ class UserRepository:
             full_name,
             email,
         )
+        await invalidate_table("users", [user_id])
 
     async def assign_default_role(self, user_id: int):
         await self.db.execute(
@@ -46,6 +62,7 @@ class UserRepository:
             user_id,
             RoleEnum.USER.value,
         )
+        await invalidate_table("users", [user_id])
 
     async def get_user_by_username(self, username: str):
         return await self.db.fetchrow(
@@ -82,33 +99,111 @@ class UserRepository:
         roles = [RoleEnum(role) for role in row["roles"]]
         return UserRole(user_id=row["user_id"], roles=roles)
 
+    async def get_user_roles_by_ids(self, user_ids: list[int]) -> dict[int, UserRole]:
+        """:return: roles by user id, users without roles are left out"""
+        rows = await self.db.fetch(
+            """
+            SELECT user_id, array_agg(user_role) AS roles
+            FROM user_roles
+            WHERE user_id = ANY($1::int[])
+            GROUP BY user_id
+            """,
+            user_ids,
+        )
+        return {
+            row["user_id"]: UserRole(
+                user_id=row["user_id"], roles=[RoleEnum(role) for role in row["roles"]]
+            )
+            for row in rows
+        }
+
+    @read_cache.cached(
+        tags=lambda user_id: [user_version("users", user_id)], serve_stale=True
+    )
     async def get_user_full_info(self, user_id: int):
+        """Profile shown on most HTML pages, cached (and kept out of hashed_password)"""
         return await self.db.fetchrow(
             """
-            SELECT *, username 
+            SELECT user_info.user_id, users.username, user_info.full_name, user_info.email
             FROM user_info
             JOIN users ON users.id = user_info.user_id
-            WHERE user_id = $1
+            WHERE user_info.user_id = $1
             """,
             user_id,
         )
 
-    async def get_all_users_full_info(self):
-        return await self.db.fetch(
+    async def get_users_full_info(self, user_ids: list[int]) -> dict[int, asyncpg.Record]:
+        """
+        Profiles of several users in one query (not cached, unlike get_user_full_info)
+        :return: profiles by user id
+        """
+        rows = await self.db.fetch(
             """
-            WITH user_roles_agg AS (
-                SELECT user_id, ARRAY_AGG(user_role) AS roles
-                FROM user_roles
-                GROUP BY user_id
+            SELECT user_info.user_id, users.username, user_info.full_name, user_info.email
+            FROM user_info
+            JOIN users ON users.id = user_info.user_id
+            WHERE user_info.user_id = ANY($1::int[])
+            """,
+            user_ids,
+        )
+        return {row["user_id"]: row for row in rows}
+
+    async def get_users_page(
+        self,
+        limit: int,
+        after: Optional[int] = None,
+        search: Optional[str] = None,
+        role: Optional[RoleEnum] = None,
+    ):
+        """
+        Admin directory page in id order, starting after the user id `after` (keyset).
+        search is a case-insensitive substring of username, email or full name, found
+        through the trigram indexes, so it needs MIN_SEARCH_LENGTH characters; role keeps
+        users having that role, read in id order from ix_user_roles_user_role_user_id.
+        Roles are aggregated for the page only.
+        """
+        if search and len(search) < MIN_SEARCH_LENGTH:
+            raise ValueError(f"search needs at least {MIN_SEARCH_LENGTH} characters")
+        params = [limit, after or 0]
+        clauses = ["users.id > $2"]
+        if search:
+            params.append(f"%{_escape_like(search)}%")
+            clauses.append(
+                f"""users.id IN (
+                    SELECT id FROM users WHERE username ILIKE ${len(params)}
+                    UNION
+                    SELECT user_id FROM user_info
+                    WHERE email ILIKE ${len(params)} OR full_name ILIKE ${len(params)}
+                )"""
             )
-            SELECT 
+        if role is not None:
+            params.append(role.value)
+            clauses.append(
+                f"""users.id IN (
+                    SELECT user_id FROM user_roles
+                    WHERE user_role = ${len(params)}::role_enum AND user_id > $2
+                )"""
+            )
+        return await self.db.fetch(
+            f"""
+            SELECT
+                users.id AS user_id,
                 users.username,
-                user_info.*,
-                COALESCE(user_roles_agg.roles, ARRAY[]::role_enum[]) AS roles
+                user_info.full_name,
+                user_info.email,
+                COALESCE(roles.roles, ARRAY[]::role_enum[]) AS roles
             FROM users
             JOIN user_info ON user_info.user_id = users.id
-            LEFT JOIN user_roles_agg ON user_roles_agg.user_id = users.id
-            """
+            LEFT JOIN LATERAL (
+                SELECT ARRAY_AGG(user_role ORDER BY user_role) AS roles
+                FROM user_roles
+                WHERE user_roles.user_id = users.id
+            ) AS roles ON TRUE
+            WHERE {" AND ".join(clauses)}
+            ORDER BY users.id
+            LIMIT $1
+            """,
+            *params,
         )
 
     async def delete_user_by_id(self, user_id: int) -> bool:
@@ -118,7 +213,13 @@ class UserRepository:
             """,
             user_id,
         )
-        return result != "DELETE 0"
+        if result == "DELETE 0":
+            return False
+        # Notes go with the user (ON DELETE CASCADE)
+        await invalidate_table("users", [user_id])
+        await invalidate_table("things_to_do", [user_id])
+        await invalidate_closed_trends([user_id])
+        return True
 
     async def update_user_info(self, user_id: int, full_name: str, email: str) -> bool:
         row = await self.db.fetchrow(
@@ -132,7 +233,10 @@ class UserRepository:
             full_name,
             email,
         )
-        return row is not None
+        if row is None:
+            return False
+        await invalidate_table("users", [user_id])
+        return True
 
     async def add_user_role(self, user_id: int, role: str):
         try:
@@ -147,6 +251,7 @@ class UserRepository:
             )
         except UniqueViolationError:
             return False  # Role has already been assigned
+        await invalidate_table("users", [user_id])
         return result is not None
 
     async def remove_user_role(self, user_id: int, role: str):
@@ -158,7 +263,10 @@ class UserRepository:
             user_id,
             role,
         )
-        return result != "DELETE 0"
+        if result == "DELETE 0":
+            return False
+        await invalidate_table("users", [user_id])
+        return True
 
 
     async def change_password(self, user_id: int, new_password: str):
@@ -171,6 +279,7 @@ class UserRepository:
             user_id,
             new_password,
         )
+        await invalidate_table("users", [user_id])
         return result
     
 
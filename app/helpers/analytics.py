@@ -0,0 +1,33 @@
+import calendar
+import math
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from typing import Iterable, Optional
+from zoneinfo import ZoneInfo
+
+HOURS_PER_WEEK = 7 * 24
+
+
+def utc_hour_shift(tz: ZoneInfo, at: Optional[datetime] = None) -> int:
+    """
+    Whole hours to add to a UTC hour bucket to land in tz, using the offset in effect at `at`
+    (now by default). Offsets like +05:30 round half up, i.e. each bucket goes to the
+    local hour holding its midpoint.
+    """
+    offset = tz.utcoffset(at or datetime.now(dt_timezone.utc))
+    return math.floor(offset.total_seconds() / 3600 + 0.5)
+
+
+def weekday_distribution(
+    hourly: Iterable[tuple[int, int]], tz: ZoneInfo, at: Optional[datetime] = None
+) -> dict[str, int]:
+    """
+    Folds (UTC hour of week, count) buckets into per-weekday counts in tz.
+    Hour of week is 24 * day of week + hour, with Sunday as day 0 like Postgres DOW.
+    """
+    shift = utc_hour_shift(tz, at)
+    counts = dict.fromkeys(calendar.day_name, 0)
+    for hour_of_week, count in hourly:
+        dow = (hour_of_week + shift) % HOURS_PER_WEEK // 24
+        counts[calendar.day_name[(dow - 1) % 7]] += count
+    return counts
@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Literal, Mapping, Sequence
+
+ExportFormat = Literal["ndjson", "csv"]
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# Rows are encoded and sent in chunks rather than one tiny write per row
+EXPORT_CHUNK_ROWS = 500
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_rows(
+    rows: Iterable[Mapping], columns: Sequence[str], export_format: ExportFormat
+) -> str:
+    """Rows as NDJSON lines or CSV records (without the header)"""
+    if export_format == "ndjson":
+        return "".join(
+            json.dumps({column: row[column] for column in columns}, default=_json_default) + "\n"
+            for row in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows([_csv_value(row[column]) for column in columns] for row in rows)
+    return buffer.getvalue()
+
+
+async def encode_export(
+    rows: AsyncIterator[Mapping],
+    columns: Sequence[str],
+    export_format: ExportFormat,
+    gzip: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    Streams rows in export_format, optionally as one gzip member, holding at most
+    EXPORT_CHUNK_ROWS encoded rows in memory
+    """
+    compressor = zlib.compressobj(wbits=31) if gzip else None  # 31: gzip header and trailer
+
+    def emit(text: str) -> bytes:
+        data = text.encode()
+        return compressor.compress(data) if compressor else data
+
+    chunk = emit(",".join(columns) + "\n") if export_format == "csv" else b""
+    pending = []
+    async for row in rows:
+        pending.append(row)
+        if len(pending) >= EXPORT_CHUNK_ROWS:
+            chunk += emit(encode_rows(pending, columns, export_format))
+            pending = []
+            if chunk:  # The compressor may still be buffering
+                yield chunk
+                chunk = b""
+    chunk += emit(encode_rows(pending, columns, export_format))
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+from typing import BinaryIO, Iterator, Optional
+
+from pydantic import ValidationError
+
+from app.api.schemas.models import NoteImportError, Todo
+from app.helpers.export import ExportFormat
+
+IMPORT_BATCH_SIZE = 5000  # Rows per COPY
+MAX_IMPORT_ERRORS = 100  # Rejected rows reported back; the rest are only counted
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'row'}: {e['msg']}"
+        for e in error.errors()
+    )
+
+
+class NoteImport:
+    """
+    Reads an uploaded NDJSON or CSV file (as written by /notes/export, only title and
+    description are taken) and validates every row with the Todo schema.
+    Valid rows come out in batches of (title, description); rejected ones are counted
+    and the first MAX_IMPORT_ERRORS are kept with their line numbers.
+    """
+
+    def __init__(self, file: BinaryIO, import_format: ExportFormat):
+        # utf-8-sig: spreadsheet CSVs often start with a BOM
+        self._text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        self._rows = self._csv_rows() if import_format == "csv" else self._ndjson_rows()
+        self.rejected = 0
+        self.errors: list[NoteImportError] = []
+
+    def _ndjson_rows(self) -> Iterator[tuple[int, object]]:
+        for line_number, line in enumerate(self._text, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, f"invalid JSON: {e.msg}"
+
+    def _csv_rows(self) -> Iterator[tuple[int, object]]:
+        reader = csv.DictReader(self._text)
+        for row in reader:
+            yield reader.line_num, row
+
+    def _reject(self, line: int, error: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append(NoteImportError(line=line, error=error))
+
+    def next_batch(self, size: int = IMPORT_BATCH_SIZE) -> Optional[list[tuple[str, str]]]:
+        """:return: up to size valid rows, None once the file is exhausted"""
+        batch = []
+        for line, row in self._rows:
+            if isinstance(row, str):
+                self._reject(line, row)
+                continue
+            if not isinstance(row, dict):
+                self._reject(line, "expected a JSON object")
+                continue
+            try:
+                todo = Todo.model_validate(row)
+            except ValidationError as e:
+                self._reject(line, _describe(e))
+                continue
+            batch.append((todo.title, todo.description))
+            if len(batch) >= size:
+                return batch
+        return batch or None
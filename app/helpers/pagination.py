@@ -0,0 +1,55 @@
+from datetime import datetime
+from typing import Any, Mapping, Optional, Sequence
+
+from fastapi import HTTPException, status
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from app.core.config import load_config
+
+config = load_config()
+
+# Signed, so clients can't craft arbitrary keyset values
+_cursor_serializer = URLSafeSerializer(config.secret_key, salt="keyset-cursor")
+
+
+def encode_cursor(sort_by: str, value: Any, row_id: int) -> str:
+    """Opaque cursor pointing right after the row with the given sort value and id"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return _cursor_serializer.dumps([sort_by, value, row_id])
+
+
+def decode_cursor(cursor: str, sort_by: str, value_type: type) -> tuple[Any, int]:
+    """
+    :return: (sort value, id) of the last row of the previous page
+    Raises 400 if the cursor is forged or was issued for another sort order.
+    """
+    try:
+        cursor_sort_by, value, row_id = _cursor_serializer.loads(cursor)
+    except (BadSignature, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    if cursor_sort_by != sort_by:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor was issued for another sort order",
+        )
+    if value_type is datetime:
+        value = datetime.fromisoformat(value)
+    return value, row_id
+
+
+class KeysetPage:
+    """
+    Rows of one keyset page, fetched with limit + 1: the extra row only tells there
+    is a next page
+    """
+
+    def __init__(self, rows: Sequence[Mapping], limit: int):
+        self.rows = rows[:limit]
+        self.has_next = len(rows) > limit
+        self.last_id: Optional[int] = self.rows[-1]["id"] if self.rows else None
+
+    def __iter__(self):
+        return iter(self.rows)
@@ -0,0 +1,126 @@
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from typing import Literal, Optional
+from zoneinfo import ZoneInfo
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.common.lru import TTLCache
+
+logger = logging.getLogger(__name__)
+
+Granularity = Literal["day", "week"]
+
+MAX_TREND_BUCKETS = 366
+# Redis hash per series: field = bucket start date, value = "created:completed".
+# version is the series' trend_version, bumped by writes that change past buckets.
+TREND_CACHE_KEY = "note_trend:{scope}:{version}:{granularity}:{timezone}"
+TREND_CACHE_IDLE_TTL = 30 * 24 * 3600  # Series nobody asks for expire, hot ones never do
+TREND_LOCAL_CACHE_SIZE = 50_000
+
+
+@dataclass(frozen=True)
+class TrendBucket:
+    """Local day or week, with its bounds as naive UTC timestamps (like created_at)"""
+
+    start: date
+    utc_start: datetime
+    utc_end: datetime
+
+    def is_closed(self, now: datetime) -> bool:
+        return self.utc_end <= now
+
+
+def _local_midnight_utc(day: date, tz: ZoneInfo) -> datetime:
+    return (
+        datetime.combine(day, time(), tzinfo=tz)
+        .astimezone(dt_timezone.utc)
+        .replace(tzinfo=None)
+    )
+
+
+def trend_buckets(
+    start: date, end: date, granularity: Granularity, tz: ZoneInfo
+) -> list[TrendBucket]:
+    """
+    Buckets covering start..end (inclusive) in tz. Weeks start on Monday, so the
+    first week bucket may begin before start.
+    """
+    step = timedelta(days=1 if granularity == "day" else 7)
+    if granularity == "week":
+        start -= timedelta(days=start.weekday())
+    buckets = []
+    day = start
+    while day <= end:
+        buckets.append(
+            TrendBucket(day, _local_midnight_utc(day, tz), _local_midnight_utc(day + step, tz))
+        )
+        day += step
+    return buckets
+
+
+class ClosedBucketCache:
+    """
+    Counts of trend buckets that are over, kept in process memory and in Redis
+    (shared between workers). Series are keyed on their trend_version: deleting,
+    un-completing or re-completing a note bumps it, and the series built before
+    are left to expire.
+    """
+
+    def __init__(self, maxsize: int):
+        self._local = TTLCache(maxsize)
+
+    async def get_many(
+        self, redis: Optional[Redis], series: str, days: list[date]
+    ) -> dict[date, tuple[int, int]]:
+        found = {}
+        for day in days:
+            counts = self._local.get((series, day))
+            if counts is not None:
+                found[day] = counts
+        missing = [day for day in days if day not in found]
+        if redis is None or not missing:
+            return found
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hmget(series, [day.isoformat() for day in missing])
+                pipe.expire(series, TREND_CACHE_IDLE_TTL)
+                values, _ = await pipe.execute()
+        except RedisError as e:
+            logger.warning("Couldn't read trend buckets of %s: %s", series, e)
+            return found
+        for day, value in zip(missing, values, strict=True):
+            if value is not None:
+                created, completed = map(int, value.split(":"))
+                found[day] = (created, completed)
+                self._local.set((series, day), found[day])
+        return found
+
+    async def set_many(
+        self, redis: Optional[Redis], series: str, counts: dict[date, tuple[int, int]]
+    ):
+        if not counts:
+            return
+        for day, value in counts.items():
+            self._local.set((series, day), value)
+        if redis is None:
+            return
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hset(
+                    series,
+                    mapping={
+                        day.isoformat(): f"{created}:{completed}"
+                        for day, (created, completed) in counts.items()
+                    },
+                )
+                pipe.expire(series, TREND_CACHE_IDLE_TTL)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning("Couldn't store trend buckets of %s: %s", series, e)
+
+
+closed_buckets = ClosedBucketCache(TREND_LOCAL_CACHE_SIZE)
@@ -3,7 +3,6 @@ import os
 from contextlib import asynccontextmanager
 from pathlib import Path
 
-import asyncpg
 import starlette
 import uvicorn
 from fastapi import Depends, FastAPI, Request
@@ -11,7 +10,6 @@ from fastapi.exceptions import HTTPException, RequestValidationError
 from fastapi.responses import HTMLResponse
 from fastapi.security import HTTPBasic
 from fastapi.staticfiles import StaticFiles
-from fastapi_limiter import FastAPILimiter
 from pydantic import ValidationError
 from redis.asyncio import Redis
 
@@ -22,19 +20,24 @@ from app.api.schemas.models import (
     RoleEnum,
     UserRole,
 )
+from app.common.read_cache import read_cache
 from app.common.templates import templates
-from app.core.config import load_config
+from app.common.versions import cache_versions
+from app.core.config import Mode, load_config
 from app.core.exception_handlers import (
     custom_request_validation_exception_handler,
     internal_server_error_handler,
     not_found_handler,
     validation_exception_handler,
 )
-from app.database.database import get_db_connection
-from app.database.repositories.user_repository import UserRepository
+from app.database.database import QueryCountMiddleware, create_db_pool
+from app.database.loaders import RequestLoaders, get_loaders
+from app.security.app_cookies import AuthCookieMiddleware
+from app.security.rate_limiter import rate_limiter
 from app.security.rbac import PermissionChecker, role_based_rate_limit
 from app.security.security import (
     get_current_user_with_roles,
+    token_cache,
 )
 
 # import enable_translation
@@ -53,11 +56,19 @@ logging.basicConfig(level=logging.INFO)
 
 
 @asynccontextmanager
-async def lifespan(_: FastAPI):
-    redis = Redis(host="localhost", port=6379, decode_responses=True)
-    await FastAPILimiter.init(redis)
+async def lifespan(app: FastAPI):
+    app.state.db_pool = await create_db_pool()
+    redis = Redis.from_url(config.redis.url, decode_responses=True)
+    app.state.redis = redis
+    rate_limiter.bind(redis)
+    cache_versions.bind(redis)
+    read_cache.start(redis)
     yield
-    await FastAPILimiter.close()
+    await read_cache.stop()
+    cache_versions.bind(None)
+    rate_limiter.bind(None)
+    await redis.aclose()
+    await app.state.db_pool.close()
 
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -66,6 +77,10 @@ TEMPLATES_DIR = FRONTEND_DIR / "templates"
 
 app = FastAPI(lifespan=lifespan)
 
+app.add_middleware(AuthCookieMiddleware)
+if config.mode == Mode.DEV:
+    app.add_middleware(QueryCountMiddleware)
+
 app.mount("/static", StaticFiles(directory=FRONTEND_DIR / "static"), name="static")
 
 
@@ -99,10 +114,9 @@ async def get_login_page(request: Request):
 async def dashboard(
     request: Request,
     current_user: UserRole = Depends(get_current_user_with_roles),
-    db: asyncpg.Connection = Depends(get_db_connection),
+    loaders: RequestLoaders = Depends(get_loaders),
 ):
-    user_repo = UserRepository(db)
-    user_info = await user_repo.get_user_full_info(current_user.user_id)
+    user_info = await loaders.user_profiles.load(current_user.user_id)
     return templates.TemplateResponse(
         "Dashboard.html",
         {"request": request, "user": current_user, "user_profile": user_info},
@@ -120,6 +134,12 @@ async def admin_info(current_user: UserRole = Depends(get_current_user_with_role
     return {"message": f"Hello, user {current_user.user_id}!"}
 
 
+@app.get("/admin/stats")
+@PermissionChecker([RoleEnum.ADMIN])
+async def admin_stats(current_user: UserRole = Depends(get_current_user_with_roles)):
+    return {"token_cache": token_cache.stats(), "read_cache": read_cache.stats()}
+
+
 @app.get("/public", dependencies=[Depends(role_based_rate_limit)])
 async def public_endpoint(
     current_user: UserRole = Depends(get_current_user_with_roles),
@@ -1,11 +1,15 @@
+from typing import Optional
 from uuid import uuid4
 
-from fastapi import Response
+from fastapi import Request, Response
 from itsdangerous import TimestampSigner
+from starlette.datastructures import MutableHeaders
 
 sessions = dict()
 signer = TimestampSigner(secret_key="very-secret-key")
 
+AUTH_COOKIES_STATE = "auth_cookies"
+
 
 def generate_cookie(username: str, response: Response):
     user_id = str(uuid4())
@@ -14,3 +18,45 @@ def generate_cookie(username: str, response: Response):
         key="session_token", value=signed, httponly=True, max_age=300, secure=False
     )
     sessions[username] = signed
+
+
+def queue_auth_cookie(
+    request: Request, key: str, value: Optional[str], max_age: Optional[int] = None
+):
+    """
+    Schedules a Set-Cookie header for the current response (value=None deletes the cookie).
+    Dependencies can't modify responses that handlers return directly,
+    so AuthCookieMiddleware applies the queued cookies.
+    """
+    response = Response()
+    if value is None:
+        response.delete_cookie(key)
+    else:
+        response.set_cookie(key=key, value=value, max_age=max_age, httponly=True)
+    cookies = request.scope.setdefault("state", {}).setdefault(AUTH_COOKIES_STATE, [])
+    cookies.extend(
+        header_value for name, header_value in response.raw_headers if name == b"set-cookie"
+    )
+
+
+class AuthCookieMiddleware:
+    """Adds cookies queued with queue_auth_cookie to the response"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookies(message):
+            if message["type"] == "http.response.start":
+                cookies = scope.get("state", {}).get(AUTH_COOKIES_STATE)
+                if cookies:
+                    headers = MutableHeaders(scope=message)
+                    for cookie in cookies:
+                        headers.append("set-cookie", cookie.decode("latin-1"))
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookies)
@@ -0,0 +1,11 @@
+from fastapi import Request
+
+
+def get_client_ip(request: Request) -> str:
+    """
+    Address of the client, for per-IP limits.
+    X-Forwarded-For is never read here: anyone can send it, which would let a client
+    pick a fresh IP per request. Behind a reverse proxy run uvicorn with --proxy-headers
+    and --forwarded-allow-ips set to the proxy, so request.client is the real client.
+    """
+    return request.client.host if request.client else "unknown"
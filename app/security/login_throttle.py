@@ -0,0 +1,76 @@
+import logging
+from typing import Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+LOGIN_FAILURE_WINDOW_SECONDS = 15 * 60  # Fixed window, starts with the first attempt
+MAX_FAILURES_PER_USERNAME = 5
+MAX_FAILURES_PER_IP = 20
+
+USERNAME_FAILURES_KEY = "login_failures:user:{username}"
+IP_FAILURES_KEY = "login_failures:ip:{ip}"
+
+
+def _keys(username: str, ip: str) -> list[tuple[str, int]]:
+    return [
+        (USERNAME_FAILURES_KEY.format(username=username), MAX_FAILURES_PER_USERNAME),
+        (IP_FAILURES_KEY.format(ip=ip), MAX_FAILURES_PER_IP),
+    ]
+
+
+async def _add(redis: Redis, keys: list[str], amount: int) -> list:
+    """
+    Adds amount to each counter in one MULTI/EXEC, starting its window if it has none.
+    :return: [new value, seconds left in the window] per key
+    """
+    async with redis.pipeline(transaction=True) as pipe:
+        for key in keys:
+            pipe.set(key, 0, ex=LOGIN_FAILURE_WINDOW_SECONDS, nx=True)
+            pipe.incrby(key, amount)
+            pipe.ttl(key)
+        results = await pipe.execute()
+    return [results[3 * i + 1 : 3 * i + 3] for i in range(len(keys))]
+
+
+async def claim_login_attempt(
+    redis: Optional[Redis], username: str, ip: str
+) -> Optional[int]:
+    """
+    Counts the attempt against the username and the client IP before any DB query or
+    password hash. Counting and checking is one atomic increment, so concurrent
+    attempts can't all slip in under the limit. Fails open if Redis is unavailable.
+    An attempt stays counted as a failure until reset_login_failures takes it back.
+    :return: seconds until the next attempt is allowed, None if login isn't throttled
+    """
+    if redis is None:
+        return None
+    keys = _keys(username, ip)
+    try:
+        counters = await _add(redis, [key for key, _ in keys], 1)
+    except RedisError as e:
+        logger.warning("Login throttle is unavailable: %s", e)
+        return None
+
+    retry_after = None
+    for (_, limit), (count, ttl) in zip(keys, counters, strict=True):
+        if count > limit:
+            wait = ttl if ttl > 0 else LOGIN_FAILURE_WINDOW_SECONDS
+            retry_after = max(retry_after or 0, wait)
+    return retry_after
+
+
+async def reset_login_failures(redis: Optional[Redis], username: str, ip: str):
+    """
+    After a successful login: forgets the failures of the username and takes the
+    attempt back from the IP counter (its earlier failures are kept)
+    """
+    if redis is None:
+        return
+    try:
+        await redis.delete(USERNAME_FAILURES_KEY.format(username=username))
+        await _add(redis, [IP_FAILURES_KEY.format(ip=ip)], -1)
+    except RedisError as e:
+        logger.warning("Couldn't reset failed logins: %s", e)
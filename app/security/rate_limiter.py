@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import Request
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.api.schemas.models import RoleEnum, UserRole
+from app.common.lru import TTLCache
+from app.security.client_ip import get_client_ip
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    times: int
+    seconds: int
+
+
+# Checked in order, the first role the user has wins
+ROLE_RATE_LIMITS: list[tuple[RoleEnum, RateLimit]] = [
+    (RoleEnum.ADMIN, RateLimit(times=10, seconds=60)),
+    (RoleEnum.USER, RateLimit(times=5, seconds=60)),
+]
+DEFAULT_RATE_LIMIT = RateLimit(times=1, seconds=60)
+
+LEASE_FRACTION = 0.1  # Share of a limit a worker takes from Redis at once
+REDIS_TIMEOUT_SECONDS = 0.05  # Slower Redis is treated as unavailable
+MAX_TRACKED_KEYS = 100_000
+
+RATE_LIMIT_KEY = "rate_limit:{key}"
+
+# Atomically takes up to ARGV[2] requests out of the fixed window of KEYS[1].
+# Returns {granted, window ms left}
+LEASE_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local wanted = tonumber(ARGV[2])
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local granted = math.min(wanted, limit - used)
+if granted <= 0 then
+    return {0, redis.call('PTTL', KEYS[1])}
+end
+if redis.call('INCRBY', KEYS[1], granted) == granted then
+    redis.call('PEXPIRE', KEYS[1], ARGV[3])
+end
+return {granted, redis.call('PTTL', KEYS[1])}
+"""
+
+
+@dataclass
+class _Lease:
+    remaining: int
+    expires_at: float  # time.time() when the global window closes
+    exhausted: bool = False  # The global limit is used up until expires_at
+
+
+@dataclass
+class _Bucket:
+    tokens: float
+    updated_at: float
+
+
+class HybridRateLimiter:
+    """
+    Global rate limiter that rarely leaves the process.
+    Each worker leases batches of requests from a Redis counter (one Lua call per batch)
+    and spends them locally; a denied window is also remembered locally until it closes.
+    If Redis is slow or down it fails open to a per-process token bucket.
+    """
+
+    def __init__(self, lease_fraction: float = LEASE_FRACTION):
+        self.lease_fraction = lease_fraction
+        self._redis: Optional[Redis] = None
+        self._script = None
+        self._leases = TTLCache(maxsize=MAX_TRACKED_KEYS)
+        self._buckets = TTLCache(maxsize=MAX_TRACKED_KEYS)
+
+    def bind(self, redis: Optional[Redis]):
+        self._redis = redis
+        self._script = redis.register_script(LEASE_SCRIPT) if redis is not None else None
+
+    async def hit(self, key: str, limit: RateLimit) -> Optional[int]:
+        """
+        Counts one request against the limit
+        :return: None if the request is allowed, otherwise seconds to wait
+        """
+        now = time.time()
+        lease: Optional[_Lease] = self._leases.get(key)
+        if lease is not None:
+            if lease.exhausted:
+                return max(1, math.ceil(lease.expires_at - now))
+            if lease.remaining > 0:
+                lease.remaining -= 1
+                return None
+
+        if self._script is None:
+            return self._local_hit(key, limit, now)
+
+        wanted = max(1, math.ceil(limit.times * self.lease_fraction))
+        try:
+            granted, ttl_ms = await asyncio.wait_for(
+                self._script(
+                    keys=[RATE_LIMIT_KEY.format(key=key)],
+                    args=[limit.times, wanted, limit.seconds * 1000],
+                ),
+                timeout=REDIS_TIMEOUT_SECONDS,
+            )
+        except (RedisError, asyncio.TimeoutError) as e:
+            logger.warning("Rate limiter falls back to local buckets: %s", e)
+            return self._local_hit(key, limit, now)
+
+        window_left = ttl_ms / 1000 if ttl_ms > 0 else limit.seconds
+        expires_at = now + window_left
+        lease = _Lease(
+            remaining=max(granted - 1, 0), expires_at=expires_at, exhausted=granted == 0
+        )
+        self._leases.set(key, lease, expires_at=expires_at)
+        if granted == 0:
+            return max(1, math.ceil(window_left))
+        return None
+
+    def _local_hit(self, key: str, limit: RateLimit, now: float) -> Optional[int]:
+        """Per-process token bucket used while Redis is unavailable"""
+        rate = limit.times / limit.seconds
+        bucket: Optional[_Bucket] = self._buckets.get(key)
+        if bucket is None:
+            bucket = _Bucket(tokens=limit.times, updated_at=now)
+        else:
+            bucket.tokens = min(limit.times, bucket.tokens + (now - bucket.updated_at) * rate)
+            bucket.updated_at = now
+        self._buckets.set(key, bucket, ttl=limit.seconds)
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return None
+        return max(1, math.ceil((1 - bucket.tokens) / rate))
+
+
+rate_limiter = HybridRateLimiter()
+
+
+def get_rate_limit(user: UserRole) -> RateLimit:
+    for role, limit in ROLE_RATE_LIMITS:
+        if role in user.roles:
+            return limit
+    return DEFAULT_RATE_LIMIT
+
+
+def get_rate_limit_key(request: Request, user: UserRole) -> str:
+    """Authenticated users are limited by id, guests by client IP; per route template"""
+    if user.user_id:
+        identity = f"user:{user.user_id}"
+    else:
+        identity = f"ip:{get_client_ip(request)}"
+    route = request.scope.get("route")
+    path = route.path if route is not None else request.url.path
+    return f"{identity}:{path}"
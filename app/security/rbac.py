@@ -1,26 +1,26 @@
 import inspect
 from functools import wraps
 
-from fastapi import Depends, HTTPException, Request, Response, status
-from fastapi_limiter.depends import RateLimiter
+from fastapi import Depends, HTTPException, Request, status
 
 from app.api.schemas.models import RoleEnum, UserRole
-from app.database.repositories.note_repository import NoteRepository
+from app.security.rate_limiter import get_rate_limit, get_rate_limit_key, rate_limiter
 from app.security.security import get_current_user_with_roles
 
 
 async def role_based_rate_limit(
     request: Request,
-    response: Response,
     current_user: UserRole = Depends(get_current_user_with_roles),
-) -> RateLimiter:
-    if RoleEnum.ADMIN in current_user.roles:
-        limiter = RateLimiter(times=10, minutes=1)
-    elif RoleEnum.USER in current_user.roles:
-        limiter = RateLimiter(times=5, minutes=1)
-    else:
-        limiter = RateLimiter(times=1, minutes=1)
-    await limiter(request=request, response=response)
+):
+    retry_after = await rate_limiter.hit(
+        get_rate_limit_key(request, current_user), get_rate_limit(current_user)
+    )
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too Many Requests",
+            headers={"Retry-After": str(retry_after)},
+        )
 
 
 class PermissionChecker:
@@ -55,39 +55,43 @@ class PermissionChecker:
 
 
 class OwnershipChecker:
+    """
+    Decorator for note routes. The ownership check itself is fused into the note query
+    (NoteRepository.*_for_user); the handler passes the result to check_note_access.
+    """
+
     def __call__(self, func):
+        params = inspect.signature(func).parameters
+        if "current_user" not in params or "note_id" not in params:
+            raise TypeError(
+                f"{func.__name__} must accept current_user and note_id to check ownership"
+            )
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            sig = inspect.signature(func)
-            bound = sig.bind_partial(*args, **kwargs)
-            bound.apply_defaults()
-            arguments = bound.arguments
-
-            user: UserRole = arguments.get("current_user")
-            note_id = arguments.get("note_id")
-            db = arguments.get("db")
-            if not user:
+            if not kwargs.get("current_user"):
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="Authentication Required",
                 )
+            return await func(*args, **kwargs)
 
-            if RoleEnum.ADMIN in user.roles:
-                return await func(*args, **kwargs)
+        return wrapper
 
-            note_repo = NoteRepository(db)
-            owner = await note_repo.get_note_owner(note_id)
-            if owner == -1:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Note not found",
-                )
-            if owner != user.user_id:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="You don't have permissions to access this resource",
-                )
 
-            return await func(*args, **kwargs)
+def can_access_any_note(user: UserRole) -> bool:
+    return RoleEnum.ADMIN in user.roles
 
-        return wrapper
+
+def check_note_access(row):
+    """Raises 404/403 for the result of an owner-scoped NoteRepository call"""
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Note not found",
+        )
+    if not row["allowed"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permissions to access this resource",
+        )
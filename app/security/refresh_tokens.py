@@ -0,0 +1,174 @@
+import base64
+import hashlib
+import logging
+import secrets
+from typing import Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+REFRESH_TOKEN_EXPIRE_DAYS = 7  # Время жизни refresh-токена
+REFRESH_TOKEN_GRACE_SECONDS = 10  # Concurrent requests may still present the rotated token
+
+REFRESH_TOKEN_KEY = "refresh_token:{digest}"
+ROTATED_REFRESH_TOKEN_KEY = "refresh_token:rotated:{digest}"
+USER_REFRESH_TOKENS_KEY = "refresh_tokens:user:{user_id}"
+USER_ROTATED_REFRESH_TOKENS_KEY = "refresh_tokens:rotated:user:{user_id}"
+
+# Atomically consumes the token KEYS[1] and stores its replacement KEYS[3], leaving the
+# sealed replacement under KEYS[2] for the grace period. A token that was rotated
+# already returns {0, "user_id:sealed replacement"}; unknown ones return nil.
+# ARGV: digest, new digest, token ttl, grace seconds, sealed replacement,
+# and the user keys without the user id (users are only known inside the script)
+ROTATE_SCRIPT = """
+local user_id = redis.call('GET', KEYS[1])
+if not user_id then
+    local rotated = redis.call('GET', KEYS[2])
+    if not rotated then
+        return nil
+    end
+    return {0, rotated}
+end
+local user_key = ARGV[6] .. user_id
+local rotated_user_key = ARGV[7] .. user_id
+redis.call('DEL', KEYS[1])
+redis.call('SREM', user_key, ARGV[1])
+redis.call('SET', KEYS[3], user_id, 'EX', ARGV[3])
+redis.call('SADD', user_key, ARGV[2])
+redis.call('EXPIRE', user_key, ARGV[3])
+redis.call('SET', KEYS[2], user_id .. ':' .. ARGV[5], 'EX', ARGV[4])
+redis.call('SADD', rotated_user_key, ARGV[1])
+redis.call('EXPIRE', rotated_user_key, ARGV[4])
+return {1, user_id}
+"""
+
+# Deletes the live tokens of KEYS[1] and the grace keys of KEYS[2] together with both
+# sets, so a rotation can't slip a new token in between. ARGV: key prefixes of both
+REVOKE_USER_SCRIPT = """
+for _, digest in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    redis.call('DEL', ARGV[1] .. digest)
+end
+for _, digest in ipairs(redis.call('SMEMBERS', KEYS[2])) do
+    redis.call('DEL', ARGV[2] .. digest)
+end
+return redis.call('DEL', KEYS[1], KEYS[2])
+"""
+
+
+def _digest(token: str) -> str:
+    # Only digests are stored, so a Redis dump doesn't leak usable tokens
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _grace_pad(token: str) -> bytes:
+    return hashlib.sha256(f"grace:{token}".encode()).digest()
+
+
+def _seal(token: str, new_token: str) -> str:
+    """
+    Encrypts the replacement with a one-time pad derived from the token it replaces,
+    so only requests presenting that token can read it back from the grace key
+    """
+    raw = base64.urlsafe_b64decode(new_token + "=")
+    return bytes(a ^ b for a, b in zip(raw, _grace_pad(token), strict=True)).hex()
+
+
+def _unseal(token: str, sealed: str) -> str:
+    raw = bytes(a ^ b for a, b in zip(bytes.fromhex(sealed), _grace_pad(token), strict=True))
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+async def issue_refresh_token(redis: Optional[Redis], user_id: int) -> Optional[str]:
+    """
+    Creates a new refresh token for the user
+    :return: token, None if refresh tokens are unavailable (no Redis)
+    """
+    if redis is None:
+        return None
+    token = secrets.token_urlsafe(32)
+    digest = _digest(token)
+    ttl = REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
+    user_key = USER_REFRESH_TOKENS_KEY.format(user_id=user_id)
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.set(REFRESH_TOKEN_KEY.format(digest=digest), user_id, ex=ttl)
+            pipe.sadd(user_key, digest)
+            pipe.expire(user_key, ttl)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning("Couldn't issue refresh token for user %s: %s", user_id, e)
+        return None
+    return token
+
+
+async def rotate_refresh_token(
+    redis: Optional[Redis], token: str
+) -> Optional[tuple[int, str]]:
+    """
+    Consumes a refresh token and issues its replacement (each token is single-use).
+    Requests racing with the rotation get the same replacement for REFRESH_TOKEN_GRACE_SECONDS.
+    :return: (user_id, new refresh token), None if the token is unknown, expired or revoked
+    """
+    if redis is None:
+        return None
+    digest = _digest(token)
+    new_token = secrets.token_urlsafe(32)
+    new_digest = _digest(new_token)
+    try:
+        result = await redis.register_script(ROTATE_SCRIPT)(
+            keys=[
+                REFRESH_TOKEN_KEY.format(digest=digest),
+                ROTATED_REFRESH_TOKEN_KEY.format(digest=digest),
+                REFRESH_TOKEN_KEY.format(digest=new_digest),
+            ],
+            args=[
+                digest,
+                new_digest,
+                REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60,
+                REFRESH_TOKEN_GRACE_SECONDS,
+                _seal(token, new_token),
+                USER_REFRESH_TOKENS_KEY.format(user_id=""),
+                USER_ROTATED_REFRESH_TOKENS_KEY.format(user_id=""),
+            ],
+        )
+    except RedisError as e:
+        logger.warning("Couldn't rotate refresh token: %s", e)
+        return None
+    if result is None:
+        return None
+    rotated_now, value = result
+    if int(rotated_now):
+        return int(value), new_token
+    # Lost the race against a parallel request that has just rotated this token
+    user_id, sealed = value.split(":", 1)
+    return int(user_id), _unseal(token, sealed)
+
+
+async def revoke_refresh_token(redis: Optional[Redis], token: str):
+    if redis is None:
+        return
+    digest = _digest(token)
+    try:
+        user_id = await redis.getdel(REFRESH_TOKEN_KEY.format(digest=digest))
+        if user_id is not None:
+            await redis.srem(USER_REFRESH_TOKENS_KEY.format(user_id=user_id), digest)
+    except RedisError as e:
+        logger.error("Couldn't revoke refresh token: %s", e)
+
+
+async def revoke_user_refresh_tokens(redis: Optional[Redis], user_id: int):
+    """Logs the user out of every session, including tokens still in their grace period"""
+    if redis is None:
+        return
+    try:
+        await redis.register_script(REVOKE_USER_SCRIPT)(
+            keys=[
+                USER_REFRESH_TOKENS_KEY.format(user_id=user_id),
+                USER_ROTATED_REFRESH_TOKENS_KEY.format(user_id=user_id),
+            ],
+            args=[REFRESH_TOKEN_KEY.format(digest=""), ROTATED_REFRESH_TOKEN_KEY.format(digest="")],
+        )
+    except RedisError as e:
+        logger.error("Couldn't revoke refresh tokens of user %s: %s", user_id, e)
@@ -0,0 +1,54 @@
+import logging
+import secrets
+from typing import Optional
+
+from fastapi import HTTPException, status
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+ROLE_EPOCH_KEY = "role_epoch:{user_id}"
+
+
+def _new_epoch() -> str:
+    return secrets.token_hex(8)
+
+
+async def get_role_epoch(redis: Optional[Redis], user_id: int) -> Optional[str]:
+    """
+    Returns the current role epoch of a user. Tokens carry the epoch they were issued
+    with, so any role change invalidates the roles embedded in them.
+    :return: epoch string, None if it can't be read (callers must fall back to the DB)
+    """
+    if redis is None:
+        return None
+    key = ROLE_EPOCH_KEY.format(user_id=user_id)
+    try:
+        epoch = await redis.get(key)
+        if epoch is None:
+            # Unknown (new user or flushed Redis): start a fresh epoch that no old token carries
+            await redis.set(key, _new_epoch(), nx=True)
+            epoch = await redis.get(key)
+        return epoch
+    except RedisError as e:
+        logger.warning("Couldn't read role epoch of user %s: %s", user_id, e)
+        return None
+
+
+async def bump_role_epoch(redis: Optional[Redis], user_id: int):
+    """
+    Invalidates roles embedded in all tokens of a user.
+    Raises 503 if Redis fails, so a revocation is never dropped silently: tokens
+    would keep their old roles until they expire.
+    """
+    if redis is None:
+        return
+    try:
+        await redis.set(ROLE_EPOCH_KEY.format(user_id=user_id), _new_epoch())
+    except RedisError as e:
+        logger.error("Couldn't bump role epoch of user %s: %s", user_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Couldn't revoke the user's sessions, try again",
+        )
@@ -1,15 +1,25 @@
+import asyncio
 import datetime
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
-import asyncpg
 import jwt
-from fastapi import Depends, HTTPException, Request, Response
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 
 from app.api.schemas.models import RoleEnum, UserRole
-from app.database.database import config, get_db_connection
-from app.database.repositories.user_repository import UserRepository
+from app.common.lru import TTLCache
+from app.database.database import config
+from app.database.loaders import RequestLoaders, get_loaders
+from app.database.redis_client import get_redis
+from app.security.app_cookies import queue_auth_cookie
+from app.security.refresh_tokens import (
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    rotate_refresh_token,
+)
+from app.security.role_epochs import get_role_epoch
 
 # Определяем схему аутентификации (OAuth2 с паролем)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -18,13 +28,31 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 SECRET_KEY = config.secret_key  # Генерируем через `openssl rand -hex 32`
 ALGORITHM = "HS256"  # Используем HMAC SHA-256 для подписи
 ACCESS_TOKEN_EXPIRE_MINUTES = 15  # Время жизни токена (15 минут)
+TOKEN_CACHE_SIZE = 10_000  # Decoded tokens kept in memory per worker
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Validated payloads by token digest, each entry expires together with its token
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE)
 
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def create_jwt_token(data: dict):
-    """Создаём JWT-токен с указанием времени истечения"""
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+_hashing_executor = ThreadPoolExecutor(
+    max_workers=config.hashing.max_workers, thread_name_prefix="bcrypt"
+)
+_hashing_in_flight = 0
+
+
+def create_jwt_token(
+    data: dict, roles: Optional[list[RoleEnum]] = None, epoch: Optional[str] = None
+):
+    """
+    Создаём JWT-токен с указанием времени истечения.
+    Roles are embedded together with the user's role epoch, so requests can trust them
+    without querying the DB while the epoch is current.
+    """
     to_encode = data.copy()
+    if roles is not None and epoch is not None:
+        to_encode.update({"roles": [role.value for role in roles], "epoch": epoch})
     expire = datetime.datetime.now(datetime.UTC) + datetime.timedelta(
         minutes=ACCESS_TOKEN_EXPIRE_MINUTES
     )
@@ -32,6 +60,24 @@ def create_jwt_token(data: dict):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def decode_jwt_token(token: str) -> dict:
+    """
+    jwt.decode with a cache of already validated payloads.
+    A hit means the exact same (signed) token was verified before and hasn't expired yet.
+    Raises the same jwt exceptions as jwt.decode.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
+
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    exp = payload.get("exp")
+    if exp is not None:  # Tokens without expiry are not cached
+        token_cache.set(key, payload, expires_at=exp)
+    return payload
+
+
 async def get_user_from_token(token: str = Depends(oauth2_scheme)):
     """Получаем информацию о пользователе из токена"""
     try:
@@ -72,34 +118,90 @@ async def get_current_user(token: str = Depends(get_token_from_header_or_cookie)
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
+async def refresh_session(request: Request, loaders: RequestLoaders) -> Optional[UserRole]:
+    """
+    Re-issues the access token from the refresh-token cookie (rotating the refresh token),
+    so expired sessions continue without a password check.
+    :return: user with roles, None if there is no valid refresh token
+    """
+    refresh_token = request.cookies.get("refresh_token")
+    if refresh_token is None:
+        return None
+
+    redis = get_redis(request)
+    rotated = await rotate_refresh_token(redis, refresh_token)
+    if rotated is None:
+        queue_auth_cookie(request, "refresh_token", None)
+        return None
+    user_id, new_refresh_token = rotated
+
+    # Epoch before roles, as in log_in: a role change landing in between makes the new
+    # token stale instead of trusted with the old roles
+    epoch = await get_role_epoch(redis, user_id)
+    user_roles = await loaders.user_roles.load(user_id)
+    if user_roles is None:  # User was deleted
+        queue_auth_cookie(request, "refresh_token", None)
+        return None
+
+    access_token = create_jwt_token(
+        {"sub": str(user_id)}, roles=user_roles.roles, epoch=epoch
+    )
+    set_auth_cookies(request, access_token, new_refresh_token)
+    return user_roles
+
+
+def set_auth_cookies(
+    request: Request, access_token: str, refresh_token: Optional[str] = None
+):
+    queue_auth_cookie(request, "access_token", access_token)
+    if refresh_token is not None:
+        queue_auth_cookie(
+            request,
+            "refresh_token",
+            refresh_token,
+            max_age=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60,
+        )
+
+
 async def get_current_user_with_roles(
     request: Request,
-    response: Response,
-    db: asyncpg.Connection = Depends(get_db_connection),
+    loaders: RequestLoaders = Depends(get_loaders),
 ) -> UserRole:
     token: Optional[str] = await get_token_from_header_or_cookie(request)
 
     if token is None:
-        return UserRole(user_id=0, roles=[RoleEnum.GUEST])
+        return await refresh_session(request, loaders) or UserRole(
+            user_id=0, roles=[RoleEnum.GUEST]
+        )
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_jwt_token(token)
         user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
+        user_id = int(user_id)
+
+        claimed_roles = payload.get("roles")
+        claimed_epoch = payload.get("epoch")
+        if claimed_roles is not None and claimed_epoch is not None:
+            epoch = await get_role_epoch(get_redis(request), user_id)
+            if epoch == claimed_epoch:
+                return UserRole(
+                    user_id=user_id, roles=[RoleEnum(role) for role in claimed_roles]
+                )
 
-        user_repo = UserRepository(db)
-        user_roles = await user_repo.get_user_roles_by_id(int(user_id))
+        # Roles changed since the token was issued (or the epoch is unavailable)
+        user_roles = await loaders.user_roles.load(user_id)
 
         if user_roles is None:
             return UserRole(user_id=user_id, roles=[RoleEnum.GUEST])
         return user_roles
 
-    except jwt.ExpiredSignatureError:
-        response.delete_cookie("access_token")
-        return UserRole(user_id=0, roles=[RoleEnum.GUEST])
-    except jwt.DecodeError:
-        response.delete_cookie("access_token")
+    except (jwt.ExpiredSignatureError, jwt.DecodeError):
+        user_roles = await refresh_session(request, loaders)
+        if user_roles is not None:
+            return user_roles
+        queue_auth_cookie(request, "access_token", None)
         return UserRole(user_id=0, roles=[RoleEnum.GUEST])
 
 
@@ -109,3 +211,41 @@ def get_password_hash(password):
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
+
+
+def _release_hashing_slot():
+    global _hashing_in_flight
+    _hashing_in_flight -= 1
+
+
+async def _run_hashing(func, *args):
+    """
+    Runs a bcrypt call in the hashing pool, rejecting it with 503 when the pool is saturated.
+    The slot is held until the pool is done with the call: a cancelled caller (client
+    disconnect) frees it right away only if the call hadn't started yet.
+    """
+    global _hashing_in_flight
+    if _hashing_in_flight >= config.hashing.max_workers + config.hashing.max_pending:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, try again later",
+            headers={"Retry-After": "1"},
+        )
+    loop = asyncio.get_running_loop()
+    _hashing_in_flight += 1
+    try:
+        job = _hashing_executor.submit(func, *args)
+    except BaseException:
+        _release_hashing_slot()
+        raise
+    # Runs in the worker thread (or here, if cancelled before starting)
+    job.add_done_callback(lambda _: loop.call_soon_threadsafe(_release_hashing_slot))
+    return await asyncio.wrap_future(job)
+
+
+async def get_password_hash_async(password):
+    return await _run_hashing(get_password_hash, password)
+
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_hashing(verify_password, plain_password, hashed_password)
@@ -0,0 +1,79 @@
+"""
+Times NoteRepository.get_completion_stats on synthetic tables of 1M and 10M notes.
+
+Usage: python -m benchmarks.completion_stats [--rows 1000000 10000000] [--runs 5]
+
+Each size is generated into a TEMP things_to_do (same columns and indexes, no
+triggers or foreign keys) that shadows the real table for this session only, so
+the application data is never touched. Needs DATABASE_URL like the app.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import asyncpg
+
+from app.database.database import DATABASE_URL
+from app.database.repositories.note_repository import NoteRepository
+
+# 40% of notes completed, completion times log-uniform between ~2h and ~16h
+SEED_SQL = """
+INSERT INTO things_to_do (title, description, user_id, completed, created_at, completed_at)
+SELECT
+    'note ' || i,
+    '',
+    1 + i % 10000,
+    done,
+    created_at,
+    CASE WHEN done THEN created_at + exp(ln(6) + random() * 2 - 1) * interval '1 hour' END
+FROM (
+    SELECT i, random() < 0.4 AS done, now() - random() * interval '365 days' AS created_at
+    FROM generate_series(1, $1::int) AS i
+) AS seed
+"""
+
+
+async def bench(conn: asyncpg.Connection, rows: int, runs: int) -> None:
+    await conn.execute("DROP TABLE IF EXISTS pg_temp.things_to_do")
+    # pg_temp comes first in the search path, so the repository queries hit this copy
+    await conn.execute(
+        "CREATE TEMP TABLE things_to_do (LIKE public.things_to_do INCLUDING ALL)"
+    )
+    started = time.perf_counter()
+    await conn.execute(SEED_SQL, rows)
+    await conn.execute("VACUUM ANALYZE pg_temp.things_to_do")
+    print(f"{rows:>11,} rows seeded in {time.perf_counter() - started:.1f}s")
+
+    repo = NoteRepository(conn)
+    for label, user_id in (("overall", None), ("one user", 42)):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            row = await repo.get_completion_stats(user_id)
+            timings.append(time.perf_counter() - started)
+        print(
+            f"{'':>11} {label:<9} {row['count']:>10,} completed  "
+            f"median {statistics.median(timings) * 1000:8.1f} ms  "
+            f"min {min(timings) * 1000:8.1f} ms  p50/p90/p99 "
+            + "/".join(f"{value:.1f}h" for value in row["percentiles"])
+        )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        for rows in args.rows:
+            await bench(conn, rows, args.runs)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""
+Times the /notes/import path (NoteImport parsing and validation, then
+NoteRepository.import_notes) on generated NDJSON and CSV files.
+
+Usage: python -m benchmarks.note_import [--rows 100000] [--runs 3]
+
+Rows are copied into a TEMP things_to_do (same columns and indexes, no triggers or
+foreign keys) that shadows the real table for this session only, so the application
+data is never touched. Needs DATABASE_URL like the app.
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import statistics
+import time
+
+import asyncpg
+
+from app.database.database import DATABASE_URL
+from app.database.repositories.note_repository import NoteRepository
+from app.helpers.note_import import NoteImport
+
+
+def make_file(rows: int, import_format: str) -> bytes:
+    notes = [
+        {"title": f"imported note {i}", "description": f"description of note {i} " * 4}
+        for i in range(rows)
+    ]
+    if import_format == "ndjson":
+        return "".join(json.dumps(note) + "\n" for note in notes).encode()
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, ["title", "description"])
+    writer.writeheader()
+    writer.writerows(notes)
+    return buffer.getvalue().encode()
+
+
+async def bench(conn: asyncpg.Connection, rows: int, runs: int) -> None:
+    await conn.execute("DROP TABLE IF EXISTS pg_temp.things_to_do")
+    # pg_temp comes first in the search path, so COPY hits this copy
+    await conn.execute(
+        "CREATE TEMP TABLE things_to_do (LIKE public.things_to_do INCLUDING ALL)"
+    )
+    repo = NoteRepository(conn)
+    for import_format in ("ndjson", "csv"):
+        data = make_file(rows, import_format)
+        timings = []
+        for _ in range(runs):
+            await conn.execute("TRUNCATE pg_temp.things_to_do")
+            note_import = NoteImport(io.BytesIO(data), import_format)
+
+            async def batches(note_import: NoteImport):
+                while batch := note_import.next_batch():
+                    yield batch
+
+            started = time.perf_counter()
+            imported = await repo.import_notes(batches(note_import), user_id=1)
+            timings.append(time.perf_counter() - started)
+        median = statistics.median(timings)
+        print(
+            f"{import_format:<6} {imported:>9,} rows  median {median:6.2f} s  "
+            f"{imported / median:>9,.0f} rows/s"
+        )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        await bench(conn, args.rows, args.runs)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
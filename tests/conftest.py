@@ -4,6 +4,123 @@ from fastapi.testclient import TestClient
 from app.main import app  # Предполагается, что объект app объявлен в app/main.py
 
 
+class FakeRedis:
+    """
+    In-memory stand-in for the subset of redis.asyncio.Redis the app uses.
+    Every key lives in `data`: strings as str, sets as set, hashes as dict and sorted
+    sets as {member: score}. Expiry is ignored. Lua scripts aren't run: tests register
+    a Python mimic of the script in `scripts` (keyed by its source) before it's used.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.published = []
+        self.scripts = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def getdel(self, key):
+        return self.data.pop(key, None)
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        return True
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def expire(self, key, seconds):
+        return key in self.data
+
+    async def incrby(self, key, amount=1):
+        value = int(self.data.get(key, 0)) + amount
+        self.data[key] = str(value)
+        return value
+
+    async def ttl(self, key):
+        return -1 if key in self.data else -2
+
+    async def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(str(member) for member in members)
+
+    async def srem(self, key, *members):
+        self.data.get(key, set()).difference_update(members)
+
+    async def smembers(self, key):
+        return set(self.data.get(key, ()))
+
+    async def hmget(self, key, fields):
+        return [self.data.get(key, {}).get(field) for field in fields]
+
+    async def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({field: str(value) for field, value in mapping.items()})
+
+    async def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    async def zremrangebyscore(self, key, low, high):
+        zset = self.data.get(key, {})
+        for member in [member for member, score in zset.items() if low <= score <= high]:
+            del zset[member]
+
+    async def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    async def zrange(self, key, start, end, withscores=False):
+        items = sorted(self.data.get(key, {}).items(), key=lambda item: item[1])[start : end + 1]
+        return items if withscores else [member for member, _ in items]
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def register_script(self, script):
+        async def run(keys=(), args=()):
+            return await self.scripts[script](self, list(keys), list(args))
+
+        return run
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Queues commands and runs them against the FakeRedis on execute()"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+
+        def queue(*args, **kwargs):
+            self.calls.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        calls, self.calls = self.calls, []
+        return [await command(*args, **kwargs) for command, args, kwargs in calls]
+
+
 @pytest.fixture
 def client():
     return TestClient(app)
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
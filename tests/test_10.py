@@ -0,0 +1,52 @@
+import asyncio
+
+from redis.exceptions import ConnectionError
+
+from app.security.rate_limiter import HybridRateLimiter, RateLimit
+
+
+class FakeLeaseScript:
+    """Mimics LEASE_SCRIPT over a single in-memory counter"""
+
+    def __init__(self):
+        self.used = 0
+        self.calls = 0
+
+    async def __call__(self, keys, args):
+        self.calls += 1
+        limit, wanted, window_ms = args
+        granted = max(0, min(wanted, limit - self.used))
+        self.used += granted
+        return [granted, window_ms]
+
+
+def hits(limiter, times, limit):
+    async def run():
+        return [await limiter.hit("user:1:/public", limit) for _ in range(times)]
+
+    return asyncio.run(run())
+
+
+def test_requests_are_served_from_leases():
+    limiter = HybridRateLimiter(lease_fraction=0.5)
+    limiter._script = script = FakeLeaseScript()
+
+    results = hits(limiter, 12, RateLimit(times=10, seconds=60))
+
+    assert results[:10] == [None] * 10
+    assert all(retry_after > 0 for retry_after in results[10:])
+    # 2 leases of 5 requests, then one denial remembered until the window closes
+    assert script.calls == 3
+
+
+def test_falls_back_to_local_bucket_when_redis_fails():
+    async def broken_script(keys, args):
+        raise ConnectionError("down")
+
+    limiter = HybridRateLimiter()
+    limiter._script = broken_script
+
+    results = hits(limiter, 3, RateLimit(times=2, seconds=60))
+
+    assert results[:2] == [None, None]
+    assert results[2] > 0
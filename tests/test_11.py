@@ -0,0 +1,65 @@
+import asyncio
+
+from app.database.repositories.note_repository import NoteFilters, NoteRepository
+from app.helpers.db_helpers import SORTABLE_NOTE_COLUMNS
+
+
+class RecordingConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def fetch(self, query, *args):
+        self.queries.append((query, args))
+        return self.rows
+
+
+def test_sort_whitelist_comes_from_models():
+    assert {"id", "title", "created_at", "completed_at"} <= SORTABLE_NOTE_COLUMNS
+    assert "hashed_password" not in SORTABLE_NOTE_COLUMNS
+
+
+def test_user_filter_checks_existence_in_the_same_query():
+    db = RecordingConnection([{"user_exists": False, "id": None}])
+    repo = NoteRepository(db)
+
+    user_exists, rows = asyncio.run(
+        repo.get_filtered_notes(NoteFilters(user_id=42), "id", False, 10, 0)
+    )
+
+    assert (user_exists, rows) == (False, [])
+    assert len(db.queries) == 1
+    query, args = db.queries[0]
+    assert "FROM users" in query
+    assert args == (10, 0, 42, 42)
+
+
+def test_cursor_roundtrip_and_forgery():
+    from datetime import datetime
+
+    import pytest
+    from fastapi import HTTPException
+
+    from app.helpers.pagination import decode_cursor, encode_cursor
+
+    created_at = datetime(2025, 1, 2, 3, 4, 5)
+    cursor = encode_cursor("-created_at", created_at, 17)
+    assert decode_cursor(cursor, "-created_at", datetime) == (created_at, 17)
+
+    with pytest.raises(HTTPException):
+        decode_cursor(cursor + "x", "-created_at", datetime)
+    with pytest.raises(HTTPException):
+        decode_cursor(cursor, "created_at", datetime)
+
+
+def test_keyset_page_compares_sort_value_and_id():
+    db = RecordingConnection([])
+    repo = NoteRepository(db)
+
+    asyncio.run(
+        repo.get_filtered_notes(NoteFilters(completed=True), "title", True, 11, after=("b", 5))
+    )
+
+    query, args = db.queries[0]
+    assert "(title, id) < ($4, $5)" in query
+    assert args == (11, 0, True, "b", 5)
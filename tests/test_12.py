@@ -0,0 +1,236 @@
+"""
+Query-plan regression suite: runs every repository query under EXPLAIN ANALYZE
+against a seeded Postgres and fails on sequential scans of the app tables or sorts
+spilling to disk.
+
+Needs a database migrated to head (`alembic upgrade head`) in EXPLAIN_DATABASE_URL.
+Seeding happens in a transaction that is rolled back, so the database is left unchanged.
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+import asyncpg
+import pytest
+
+from app.api.schemas.models import RoleEnum
+from app.database.repositories.note_repository import NoteFilters, NoteRepository
+from app.database.repositories.user_repository import UserRepository
+
+DATABASE_URL = os.getenv("EXPLAIN_DATABASE_URL")
+APP_TABLES = {"users", "user_info", "user_roles", "things_to_do"}
+SEED_USERS = 20_000
+SEED_NOTES = 300_000
+
+pytestmark = pytest.mark.skipif(
+    DATABASE_URL is None, reason="EXPLAIN_DATABASE_URL is not set"
+)
+
+
+class ExplainConnection:
+    """Runs repository statements under EXPLAIN and keeps their plans"""
+
+    def __init__(self, conn: asyncpg.Connection):
+        self.conn = conn
+        self.plans = []
+
+    async def _in_savepoint(self, call):
+        """Runs call in a savepoint that is always rolled back (EXPLAIN ANALYZE really runs DML)"""
+        result = None
+        try:
+            async with self.conn.transaction():
+                result = await call()
+                raise _Rollback()
+        except _Rollback:
+            return result
+
+    async def _run(self, method, query, *args):
+        plan = await self._in_savepoint(
+            lambda: self.conn.fetchval(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}", *args)
+        )
+        self.plans.append((query, json.loads(plan)[0]["Plan"]))
+        # Real result for repository code that reads it, from the same unchanged state
+        return await self._in_savepoint(
+            lambda: getattr(self.conn, method)(query, *args)
+        )
+
+    async def fetch(self, query, *args):
+        return await self._run("fetch", query, *args)
+
+    async def fetchrow(self, query, *args):
+        return await self._run("fetchrow", query, *args)
+
+    async def fetchval(self, query, *args):
+        return await self._run("fetchval", query, *args)
+
+    async def execute(self, query, *args):
+        return await self._run("execute", query, *args)
+
+    def transaction(self, **kwargs):
+        # A savepoint of the seeding transaction, which can't take isolation options
+        return self.conn.transaction()
+
+    async def cursor(self, query, *args, prefetch=None):
+        plan = await self.conn.fetchval(
+            f"EXPLAIN (ANALYZE, FORMAT JSON) {query}", *args
+        )
+        self.plans.append((query, json.loads(plan)[0]["Plan"]))
+        async for row in self.conn.cursor(query, *args, prefetch=prefetch):
+            yield row
+
+
+class _Rollback(Exception):
+    pass
+
+
+def plan_problems(plan: dict) -> list[str]:
+    problems = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in APP_TABLES:
+        problems.append(f"Seq Scan on {plan['Relation Name']}")
+    if plan.get("Sort Space Type") == "Disk":
+        problems.append(f"Sort spilled to disk ({plan.get('Sort Space Used')} kB)")
+    for child in plan.get("Plans", []):
+        problems.extend(plan_problems(child))
+    return problems
+
+
+SEED_SQL = f"""
+INSERT INTO users (id, username, hashed_password)
+SELECT 1000000 + i, 'explain_user_' || i, 'x' FROM generate_series(1, {SEED_USERS}) i;
+
+INSERT INTO user_info (user_id, full_name, email)
+SELECT 1000000 + i, 'Explain User ' || i, 'explain_' || i || '@example.com'
+FROM generate_series(1, {SEED_USERS}) i;
+
+INSERT INTO user_roles (user_id, user_role)
+SELECT 1000000 + i, CASE WHEN i % 100 = 0 THEN 'admin' ELSE 'user' END::role_enum
+FROM generate_series(1, {SEED_USERS}) i;
+
+INSERT INTO things_to_do (title, description, user_id, completed, created_at, completed_at)
+SELECT
+    'note ' || i || ' ' || md5(i::text),
+    'description of note ' || i,
+    1000000 + 1 + i % {SEED_USERS},
+    i % 3 = 0,
+    now() - (i || ' minutes')::interval,
+    CASE WHEN i % 3 = 0 THEN now() - (i || ' minutes')::interval + interval '5 hours' END
+FROM generate_series(1, {SEED_NOTES}) i;
+
+ANALYZE users, user_info, user_roles, things_to_do;
+"""
+
+USER_ID = 1000042
+
+
+async def drain(rows):
+    return [row async for row in rows]
+
+
+TREND_BOUNDS = [
+    (
+        datetime(2025, 1, 1) + timedelta(days=day),
+        datetime(2025, 1, 2) + timedelta(days=day),
+    )
+    for day in range(90)
+]
+NOTE_QUERIES = {
+    "create_note": lambda r: r.create_note("t", "d", USER_ID),
+    "get_user_notes_page": lambda r: r.get_user_notes_page(USER_ID, 101),
+    "get_user_notes_page older page": lambda r: r.get_user_notes_page(
+        USER_ID, 101, before=200_000
+    ),
+    "get_note_total": lambda r: r.get_note_total(USER_ID),
+    "get_filtered_notes by id": lambda r: r.get_filtered_notes(
+        NoteFilters(), "id", False, 10
+    ),
+    "get_filtered_notes newest first": lambda r: r.get_filtered_notes(
+        NoteFilters(), "created_at", True, 10
+    ),
+    "get_filtered_notes by user": lambda r: r.get_filtered_notes(
+        NoteFilters(user_id=USER_ID), "id", False, 10
+    ),
+    "get_filtered_notes keyset": lambda r: r.get_filtered_notes(
+        NoteFilters(), "created_at", True, 10, after=(datetime(2025, 1, 1), 500)
+    ),
+    "get_filtered_notes title_contains": lambda r: r.get_filtered_notes(
+        NoteFilters(title_contains="abc12"), "id", False, 10
+    ),
+    "iter_notes by user": lambda r: drain(r.iter_notes(NoteFilters(user_id=USER_ID))),
+    "iter_notes by user and date": lambda r: drain(
+        r.iter_notes(NoteFilters(user_id=USER_ID, created_after=datetime(2025, 1, 1)))
+    ),
+    "search_notes": lambda r: r.search_notes("note 42", USER_ID, 20),
+    "get_note_for_user": lambda r: r.get_note_for_user(42, USER_ID, False),
+    "delete_note_for_user": lambda r: r.delete_note_for_user(42, USER_ID, False),
+    "complete_note_for_user": lambda r: r.complete_note_for_user(42, USER_ID, False),
+    "update_note_for_user": lambda r: r.update_note_for_user(
+        42, USER_ID, False, "t", "d", True
+    ),
+    "bulk_complete": lambda r: r.bulk_complete([1, 2, 3], True),
+    "get_analytics": lambda r: r.get_analytics(),
+    "get_analytics by user": lambda r: r.get_analytics(USER_ID),
+    "get_completion_stats": lambda r: r.get_completion_stats(),
+    "get_completion_stats by user": lambda r: r.get_completion_stats(USER_ID),
+    "get_trend_counts": lambda r: r.get_trend_counts(TREND_BOUNDS),
+    "get_trend_counts by user": lambda r: r.get_trend_counts(TREND_BOUNDS, USER_ID),
+}
+USER_QUERIES = {
+    "create_user": lambda r: r.create_user("explain_new_user", "x"),
+    "get_user_by_username": lambda r: r.get_user_by_username("explain_user_42"),
+    "get_user_by_id": lambda r: r.get_user_by_id(USER_ID),
+    "get_user_roles_by_id": lambda r: r.get_user_roles_by_id(USER_ID),
+    "get_user_full_info": lambda r: r.get_user_full_info(USER_ID),
+    "get_users_full_info": lambda r: r.get_users_full_info([USER_ID, USER_ID + 1]),
+    "get_user_roles_by_ids": lambda r: r.get_user_roles_by_ids([USER_ID, USER_ID + 1]),
+    "get_users_page": lambda r: r.get_users_page(50),
+    "get_users_page after": lambda r: r.get_users_page(50, after=USER_ID),
+    "get_users_page by role": lambda r: r.get_users_page(50, role=RoleEnum.ADMIN),
+    "get_users_page search": lambda r: r.get_users_page(50, search="user_4242"),
+    "get_users_page search by role": lambda r: r.get_users_page(
+        50, search="Explain User 42", role=RoleEnum.ADMIN
+    ),
+    "delete_user_by_id": lambda r: r.delete_user_by_id(USER_ID),
+    "update_user_info": lambda r: r.update_user_info(
+        USER_ID, "Name", "new@example.com"
+    ),
+    "add_user_role": lambda r: r.add_user_role(USER_ID, "moderator"),
+    "remove_user_role": lambda r: r.remove_user_role(USER_ID, "user"),
+    "change_password": lambda r: r.change_password(USER_ID, "y"),
+}
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    loop = asyncio.new_event_loop()
+    conn = loop.run_until_complete(asyncpg.connect(DATABASE_URL))
+    transaction = conn.transaction()
+    loop.run_until_complete(transaction.start())
+    loop.run_until_complete(conn.execute(SEED_SQL))
+    yield loop, conn
+    loop.run_until_complete(transaction.rollback())
+    loop.run_until_complete(conn.close())
+    loop.close()
+
+
+def explain(seeded, repository_class, call) -> list[str]:
+    loop, conn = seeded
+    db = ExplainConnection(conn)
+    loop.run_until_complete(call(repository_class(db)))
+    assert db.plans, "repository method ran no query"
+    return [
+        f"{problem} in: {' '.join(query.split())[:120]}"
+        for query, plan in db.plans
+        for problem in plan_problems(plan)
+    ]
+
+
+@pytest.mark.parametrize("name", NOTE_QUERIES)
+def test_note_query_plans(seeded, name):
+    assert explain(seeded, NoteRepository, NOTE_QUERIES[name]) == []
+
+
+@pytest.mark.parametrize("name", USER_QUERIES)
+def test_user_query_plans(seeded, name):
+    assert explain(seeded, UserRepository, USER_QUERIES[name]) == []
@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes.notes import todo_router
+from app.database.database import get_db_connection
+from app.helpers.analytics import utc_hour_shift, weekday_distribution
+
+WINTER = datetime(2025, 1, 15, tzinfo=timezone.utc)
+SUMMER = datetime(2025, 7, 15, tzinfo=timezone.utc)
+SUNDAY_23 = 23  # Sunday 23:00 UTC
+MONDAY_02 = 24 + 2
+
+
+class RollupRows:
+    """Stands in for the DB connection with fixed rollup rows"""
+
+    def __init__(self, totals, hourly):
+        self.totals = totals
+        self.hourly = hourly
+        self.queries = []
+
+    async def fetchrow(self, query, *args):
+        self.queries.append(args)
+        return self.totals
+
+    async def fetch(self, query, *args):
+        self.queries.append(args)
+        return self.hourly
+
+
+def test_hour_shift_follows_dst_and_rounds_half_hours():
+    assert utc_hour_shift(ZoneInfo("Europe/Berlin"), WINTER) == 1
+    assert utc_hour_shift(ZoneInfo("Europe/Berlin"), SUMMER) == 2
+    assert utc_hour_shift(ZoneInfo("Asia/Kolkata"), WINTER) == 6  # +05:30
+    assert utc_hour_shift(ZoneInfo("America/St_Johns"), WINTER) == -3  # -03:30
+
+
+def test_weekday_distribution_shifts_buckets_across_days():
+    hourly = [(SUNDAY_23, 5), (MONDAY_02, 3)]
+
+    in_utc = weekday_distribution(hourly, ZoneInfo("UTC"), WINTER)
+    assert (in_utc["Sunday"], in_utc["Monday"]) == (5, 3)
+
+    in_moscow = weekday_distribution(hourly, ZoneInfo("Europe/Moscow"), WINTER)
+    assert (in_moscow["Sunday"], in_moscow["Monday"]) == (0, 8)
+
+    in_new_york = weekday_distribution(hourly, ZoneInfo("America/New_York"), WINTER)
+    assert (in_new_york["Sunday"], in_new_york["Monday"]) == (8, 0)
+    assert sum(in_new_york.values()) == 8
+
+
+def test_analytics_reads_rollups():
+    db = RollupRows(
+        {"total": 10, "completed": 4, "timed_completed": 4, "completion_seconds": 4 * 7200.0},
+        [{"hour_of_week": MONDAY_02, "created": 10}],
+    )
+    app = FastAPI()
+    app.include_router(todo_router)
+    app.dependency_overrides[get_db_connection] = lambda: db
+
+    response = TestClient(app).get("/notes/analytics", params={"timezone": "UTC"})
+
+    assert response.json() == {
+        "total": 10,
+        "completed_stats": {"true": 4, "false": 6},
+        "avg_completion_time_hours": 2.0,
+        "weekday_distribution": {
+            "Monday": 10,
+            "Tuesday": 0,
+            "Wednesday": 0,
+            "Thursday": 0,
+            "Friday": 0,
+            "Saturday": 0,
+            "Sunday": 0,
+        },
+    }
+    assert db.queries == [(0,), (0,)]
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes.notes import todo_router
+from app.common.invalidation import invalidate_table
+from app.database.database import get_db_connection
+from app.database.repositories.note_repository import COMPLETION_HISTOGRAM_EDGES
+
+
+class StatsRow:
+    """Stands in for the DB connection with a fixed completion stats row"""
+
+    def __init__(self, row):
+        self.row = row
+        self.queries = []
+
+    async def fetchrow(self, query, *args):
+        self.queries.append((query, args))
+        return self.row
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    # Cached responses are kept per process; start every test from a new version
+    asyncio.run(invalidate_table("things_to_do"))
+
+
+def make_client(db):
+    app = FastAPI()
+    app.include_router(todo_router)
+    app.dependency_overrides[get_db_connection] = lambda: db
+    return TestClient(app)
+
+
+def test_completion_stats_come_from_one_query():
+    buckets = {f"bucket_{bucket}": bucket for bucket in range(len(COMPLETION_HISTOGRAM_EDGES) + 1)}
+    db = StatsRow({"count": 21, "percentiles": [5.004, 13.3, 40.0], **buckets})
+
+    response = make_client(db).get("/notes/analytics/completion")
+
+    body = response.json()
+    assert (body["count"], body["p50_hours"], body["p90_hours"], body["p99_hours"]) == (
+        21,
+        5.0,
+        13.3,
+        40.0,
+    )
+    assert body["histogram"][0] == {"min_hours": 0.0, "max_hours": 1.0, "count": 0}
+    assert body["histogram"][-1] == {"min_hours": 168.0, "max_hours": None, "count": 6}
+    assert len(db.queries) == 1
+    query, args = db.queries[0]
+    assert "percentile_cont" in query and "width_bucket" in query
+    assert args[1] == list(COMPLETION_HISTOGRAM_EDGES)
+
+
+def test_no_completed_notes():
+    buckets = {f"bucket_{bucket}": 0 for bucket in range(len(COMPLETION_HISTOGRAM_EDGES) + 1)}
+    db = StatsRow({"count": 0, "percentiles": None, **buckets})
+
+    body = make_client(db).get("/notes/analytics/completion").json()
+
+    assert body["count"] == 0
+    assert body["p50_hours"] is None
+    assert sum(bucket["count"] for bucket in body["histogram"]) == 0
+
+
+def test_other_users_stats_need_admin():
+    db = StatsRow(None)
+
+    response = make_client(db).get("/notes/analytics/completion", params={"user_id": 7})
+
+    assert response.status_code == 403
+    assert db.queries == []
+
+
+def test_overall_stats_are_cached_until_a_note_changes():
+    buckets = {f"bucket_{bucket}": 0 for bucket in range(len(COMPLETION_HISTOGRAM_EDGES) + 1)}
+    db = StatsRow({"count": 0, "percentiles": None, **buckets})
+    client = make_client(db)
+
+    client.get("/notes/analytics/completion")
+    client.get("/notes/analytics/completion")
+    assert len(db.queries) == 1
+
+    asyncio.run(invalidate_table("things_to_do", [7]))
+    client.get("/notes/analytics/completion")
+    assert len(db.queries) == 2
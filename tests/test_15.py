@@ -0,0 +1,128 @@
+import asyncio
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.api.routes.notes as notes_routes
+from app.common.versions import cache_versions, trend_version
+from app.database.database import get_db_connection
+from app.database.repositories.note_repository import NoteRepository
+from app.helpers.trends import ClosedBucketCache, trend_buckets
+
+BERLIN = ZoneInfo("Europe/Berlin")
+
+
+class TrendCounts:
+    """Stands in for the DB connection, answering every bucket with (2, 1)"""
+
+    def __init__(self):
+        self.bucket_counts = []
+
+    async def fetch(self, query, *args):
+        starts = args[0]
+        self.bucket_counts.append(len(starts))
+        return [
+            {"bucket": position, "created": 2, "completed": 1}
+            for position in range(1, len(starts) + 1)
+        ]
+
+
+@pytest.fixture
+def trend_client(monkeypatch):
+    monkeypatch.setattr(notes_routes, "closed_buckets", ClosedBucketCache(100))
+    db = TrendCounts()
+    app = FastAPI()
+    app.include_router(notes_routes.todo_router)
+    app.dependency_overrides[get_db_connection] = lambda: db
+    return TestClient(app), db
+
+
+def test_day_buckets_follow_local_midnight_across_dst():
+    buckets = trend_buckets(date(2025, 3, 29), date(2025, 3, 31), "day", BERLIN)
+
+    assert [b.start for b in buckets] == [date(2025, 3, 29), date(2025, 3, 30), date(2025, 3, 31)]
+    assert buckets[0].utc_start == datetime(2025, 3, 28, 23)
+    assert buckets[1].utc_end - buckets[1].utc_start == timedelta(hours=23)
+    assert buckets[2].utc_start == datetime(2025, 3, 30, 22)
+
+
+def test_week_buckets_start_on_monday():
+    buckets = trend_buckets(date(2025, 1, 15), date(2025, 1, 27), "week", ZoneInfo("UTC"))
+
+    assert [b.start for b in buckets] == [date(2025, 1, 13), date(2025, 1, 20), date(2025, 1, 27)]
+
+
+def test_closed_buckets_are_queried_once(trend_client):
+    client, db = trend_client
+    params = {"timezone": "UTC"}
+
+    first = client.get("/notes/analytics/trend", params=params).json()
+    second = client.get("/notes/analytics/trend", params=params).json()
+
+    assert len(first["buckets"]) == 90
+    assert first == second
+    assert db.bucket_counts == [90, 1]  # Only today is recomputed
+
+
+def test_range_is_validated(trend_client):
+    client, db = trend_client
+
+    reversed_range = {"start": "2025-02-01", "end": "2025-01-01"}
+    too_long = {"start": "2020-01-01", "end": "2025-01-01"}
+
+    assert client.get("/notes/analytics/trend", params=reversed_range).status_code == 400
+    assert client.get("/notes/analytics/trend", params=too_long).status_code == 400
+    assert db.bucket_counts == []
+
+
+def test_redis_shares_buckets_between_workers(fake_redis):
+    redis = fake_redis
+    days = [date(2025, 1, 1), date(2025, 1, 2)]
+
+    asyncio.run(ClosedBucketCache(10).set_many(redis, "series", {days[0]: (3, 2)}))
+    found = asyncio.run(ClosedBucketCache(10).get_many(redis, "series", days))
+
+    assert found == {days[0]: (3, 2)}
+
+
+class DeletedNote:
+    """Stands in for the DB connection of a delete the user is allowed to make"""
+
+    async def fetchrow(self, query, *args):
+        return {"allowed": True, "owner_id": 7}
+
+
+def test_delete_makes_closed_buckets_recount(trend_client):
+    client, db = trend_client
+    params = {"timezone": "UTC"}
+
+    before = client.get("/notes/analytics/trend", params=params)
+    asyncio.run(NoteRepository(DeletedNote()).delete_note_for_user(5, 7, False))
+    after = client.get("/notes/analytics/trend", params=params)
+
+    assert before.status_code == after.status_code == 200
+    assert db.bucket_counts == [90, 90]  # The global series was orphaned as well
+
+
+def test_only_history_changing_writes_bump_the_trend_version():
+    async def versions_after(write):
+        names = [trend_version(None), trend_version(7)]
+        before = await cache_versions.get(names)
+        await write
+        return [old != new for old, new in zip(before, await cache_versions.get(names), strict=True)]
+
+    class UpdatedNote:
+        def __init__(self, completion_changed):
+            self.completion_changed = completion_changed
+
+        async def fetchrow(self, query, *args):
+            return {"allowed": True, "owner_id": 7, "completion_changed": self.completion_changed}
+
+    retitled = NoteRepository(UpdatedNote(False)).update_note_for_user(5, 7, False, "t", "d", True)
+    reopened = NoteRepository(UpdatedNote(True)).update_note_for_user(5, 7, False, "t", "d", False)
+
+    assert asyncio.run(versions_after(retitled)) == [False, False]
+    assert asyncio.run(versions_after(reopened)) == [True, True]
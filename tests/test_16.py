@@ -0,0 +1,105 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from redis.exceptions import RedisError
+
+from app.api.routes.notes import todo_router
+from app.api.schemas.models import RoleEnum, UserRole
+from app.common.invalidation import invalidate_table
+from app.common.versions import CacheVersions, user_version
+from app.database.database import get_db_connection
+from app.security.security import get_current_user_with_roles
+
+NOTE = {
+    "allowed": True,
+    "id": 5,
+    "title": "t",
+    "description": "d",
+    "user_id": 7,
+    "completed": False,
+    "created_at": "2025-01-01T00:00:00",
+    "completed_at": None,
+}
+
+
+class NoteRows:
+    """Stands in for the DB connection and counts queries"""
+
+    def __init__(self, row=None, rows=()):
+        self.row = row
+        self.rows = list(rows)
+        self.queries = 0
+
+    async def fetchrow(self, query, *args):
+        self.queries += 1
+        return self.row
+
+    async def fetch(self, query, *args):
+        self.queries += 1
+        return self.rows
+
+
+def make_client(db, user_id=7):
+    app = FastAPI()
+    app.include_router(todo_router)
+    app.dependency_overrides[get_db_connection] = lambda: db
+    app.dependency_overrides[get_current_user_with_roles] = lambda: UserRole(
+        user_id=user_id, roles=[RoleEnum.USER]
+    )
+    return TestClient(app)
+
+
+def test_cached_note_is_revalidated_with_etag():
+    db = NoteRows(row={**NOTE, "id": 1005})
+    client = make_client(db, user_id=1007)
+
+    first = client.get("/notes/get_note/1005")
+    second = client.get("/notes/get_note/1005")
+    etag = first.headers["etag"]
+    not_modified = client.get("/notes/get_note/1005", headers={"If-None-Match": etag})
+
+    assert first.json() == second.json()
+    assert second.headers["etag"] == etag
+    assert not_modified.status_code == 304
+    assert db.queries == 1
+
+
+def test_writes_of_the_owner_invalidate():
+    db = NoteRows(row={**NOTE, "id": 2005})
+    client = make_client(db, user_id=2007)
+    etag = client.get("/notes/get_note/2005").headers["etag"]
+
+    asyncio.run(invalidate_table("things_to_do", [2007]))
+    response = client.get("/notes/get_note/2005", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert db.queries == 2
+
+
+def test_responses_built_by_the_route_are_not_cached():
+    db = NoteRows(rows=[])
+    client = make_client(db)
+
+    assert client.get("/notes/get_notes", params={"title_contains": "nothing"}).status_code == 404
+    assert client.get("/notes/get_notes", params={"title_contains": "nothing"}).status_code == 404
+    assert db.queries == 2
+
+
+def test_request_injection_stays_out_of_openapi():
+    schema = make_client(NoteRows()).app.openapi()
+    params = schema["paths"]["/notes/analytics"]["get"]["parameters"]
+
+    assert [param["name"] for param in params] == ["timezone"]
+
+
+def test_versions_unreadable_means_no_cache():
+    class BrokenRedis:
+        async def mget(self, keys):
+            raise RedisError("down")
+
+    versions = CacheVersions()
+    versions.bind(BrokenRedis())
+
+    assert asyncio.run(versions.get([user_version("users", 1)])) is None
@@ -0,0 +1,207 @@
+import asyncio
+import json
+
+import pytest
+
+from app.common.read_cache import TwoTierCache
+from app.database.database import LazyConnection
+
+cache = TwoTierCache(maxsize=100)
+
+
+class ProfileRows:
+    """Stands in for the DB connection; fails like an unreachable Postgres when down"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.queries = 0
+        self.down = False
+
+    async def fetchrow(self, query, *args):
+        self.queries += 1
+        await asyncio.sleep(self.delay)
+        if self.down:
+            raise ConnectionRefusedError("postgres is down")
+        return {"user_id": args[0], "username": f"user{args[0]}"}
+
+
+class Repo:
+    def __init__(self, db):
+        self.db = db
+
+    @cache.cached(tags=lambda user_id: [f"users:user:{user_id}"])
+    async def profile(self, user_id: int):
+        return await self.db.fetchrow("SELECT", user_id)
+
+    @cache.cached(tags=lambda user_id: [f"users:user:{user_id}"], ttl=-1, serve_stale=True)
+    async def expiring_profile(self, user_id: int):
+        return await self.db.fetchrow("SELECT", user_id)
+
+
+def clean_cache():
+    cache._l1.clear()
+    cache._tag_keys.clear()
+    cache._redis = None
+    yield
+
+
+def test_l1_hit_and_tag_invalidation():
+    async def scenario(db):
+        repo = Repo(db)
+        first = await repo.profile(1)
+        second = await repo.profile(1)
+        await cache.invalidate("users:user:1")
+        await repo.profile(1)
+        return first, second
+
+    db = ProfileRows()
+    first, second = asyncio.run(scenario(db))
+
+    assert first == second == {"user_id": 1, "username": "user1"}
+    assert db.queries == 2
+
+
+def test_concurrent_misses_share_one_query():
+    async def scenario(db):
+        return await asyncio.gather(*(Repo(db).profile(2) for _ in range(10)))
+
+    db = ProfileRows(delay=0.01)
+    results = asyncio.run(scenario(db))
+
+    assert len({result["username"] for result in results}) == 1
+    assert db.queries == 1
+
+
+def test_serves_stale_only_when_database_is_down():
+    async def scenario(db):
+        repo = Repo(db)
+        await repo.expiring_profile(3)
+        db.down = True
+        stale = await repo.expiring_profile(3)
+        with pytest.raises(ConnectionRefusedError):
+            await repo.profile(4)  # No stale copy to fall back to
+        return stale
+
+    db = ProfileRows()
+    assert asyncio.run(scenario(db)) == {"user_id": 3, "username": "user3"}
+    assert db.queries == 3
+
+
+def test_invalidation_during_load_is_not_cached():
+    async def scenario(db):
+        repo = Repo(db)
+        load = asyncio.create_task(repo.profile(5))
+        await asyncio.sleep(0.005)  # Query in flight
+        await cache.invalidate("users:user:5")
+        await load
+        await repo.profile(5)
+
+    db = ProfileRows(delay=0.01)
+    asyncio.run(scenario(db))
+
+    assert db.queries == 2
+
+
+def test_redis_l2_is_shared_and_invalidation_is_published(fake_redis):
+    redis = fake_redis
+
+    async def scenario():
+        cache._redis = redis
+        await Repo(ProfileRows()).profile(6)
+        cache._l1.clear()  # Another worker: empty L1, same Redis
+        other_db = ProfileRows()
+        await Repo(other_db).profile(6)
+        await cache.invalidate("users:user:6")
+        return other_db
+
+    other_db = asyncio.run(scenario())
+
+    assert other_db.queries == 0
+    assert redis.data == {}
+    [(channel, message)] = redis.published
+    assert channel == "read_cache:invalidate"
+    assert json.loads(message) == ["users:user:6"]
+
+
+class Pool:
+    """Hands out ProfileRows connections and counts the ones checked out"""
+
+    def __init__(self, max_size=10):
+        self.max_size = max_size
+        self.checked_out = 0
+        self.most_checked_out = 0
+        self.db = ProfileRows(delay=0.01)
+
+    def get_size(self):
+        return self.checked_out
+
+    def get_max_size(self):
+        return self.max_size
+
+    def get_idle_size(self):
+        return 0
+
+    async def acquire(self, timeout=None):
+        self.checked_out += 1
+        self.most_checked_out = max(self.most_checked_out, self.checked_out)
+        return self.db
+
+    async def release(self, conn):
+        self.checked_out -= 1
+
+
+def test_shared_load_uses_a_connection_of_its_own():
+    pool = Pool()
+    request_db = LazyConnection(pool)
+
+    async def scenario():
+        first = asyncio.create_task(Repo(request_db).profile(7))
+        await asyncio.sleep(0.005)  # Query in flight
+        first.cancel()  # e.g. the client went away and its connection is released
+        await request_db.release()
+        return await Repo(LazyConnection(pool)).profile(7)
+
+    assert asyncio.run(scenario()) == {"user_id": 7, "username": "user7"}
+    assert pool.db.queries == 1
+    assert not request_db.acquired  # Not re-acquired by the load
+    assert pool.checked_out == 0
+
+
+def test_request_holding_a_connection_doesnt_wait_for_a_second_one():
+    pool = Pool(max_size=1)
+    request_db = LazyConnection(pool, timeout=5)
+
+    async def scenario():
+        await request_db.acquire()
+        return await Repo(request_db).profile(11)
+
+    assert asyncio.run(scenario()) == {"user_id": 11, "username": "user11"}
+    assert pool.most_checked_out == 1  # Read on the request's own connection
+    assert request_db.query_count == 1
+
+
+def test_spare_connection_queries_count_for_the_request():
+    pool = Pool(max_size=2)
+    request_db = LazyConnection(pool)
+
+    async def scenario():
+        await request_db.acquire()
+        return await Repo(request_db).profile(12)
+
+    asyncio.run(scenario())
+
+    assert pool.most_checked_out == 2
+    assert pool.checked_out == 1  # The spare one is given back
+    assert request_db.query_count == 1  # Reported in X-DB-Query-Count
+
+
+def test_keyword_arguments_share_the_key():
+    async def scenario(db):
+        repo = Repo(db)
+        return await repo.profile(8), await repo.profile(user_id=8)
+
+    db = ProfileRows()
+    first, second = asyncio.run(scenario(db))
+
+    assert first == second
+    assert db.queries == 1
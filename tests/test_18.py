@@ -0,0 +1,127 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes.notes import todo_router
+from app.api.schemas.models import RoleEnum, UserRole
+from app.helpers.export import EXPORT_CHUNK_ROWS, encode_export
+from app.security.security import get_current_user_with_roles
+
+NOTES = [
+    {
+        "id": i,
+        "title": f"note, {i}",
+        "description": 'says "hi"',
+        "user_id": 7,
+        "completed": i % 2 == 0,
+        "created_at": datetime(2025, 1, 1, 12, 0, i),
+        "completed_at": None,
+    }
+    for i in range(1, 4)
+]
+
+
+class CursorConnection:
+    """Stands in for a pooled asyncpg connection"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+        self.transactions = []
+
+    @asynccontextmanager
+    async def transaction(self, **kwargs):
+        self.transactions.append(kwargs)
+        yield
+
+    async def cursor(self, query, *args, prefetch=None):
+        self.queries.append((query, args))
+        for row in self.rows:
+            yield row
+
+
+class Pool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.acquired = 0
+
+    async def acquire(self, timeout=None):
+        self.acquired += 1
+        return self.conn
+
+    async def release(self, conn):
+        self.acquired -= 1
+
+
+def make_client(conn, roles=(RoleEnum.USER,)):
+    app = FastAPI()
+    app.include_router(todo_router)
+    app.state.db_pool = Pool(conn)
+    app.dependency_overrides[get_current_user_with_roles] = lambda: UserRole(
+        user_id=7, roles=list(roles)
+    )
+    return TestClient(app)
+
+
+def test_ndjson_export_is_scoped_to_the_user():
+    conn = CursorConnection(NOTES)
+    client = make_client(conn)
+
+    response = client.get("/notes/export", params={"user_id": 8, "completed": "false"})
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [line["id"] for line in lines] == [1, 2, 3]
+    assert lines[0]["created_at"] == "2025-01-01T12:00:01"
+    _, args = conn.queries[0]
+    assert args == (False, 7)  # user_id replaced with the caller's own
+    assert conn.transactions == [{"isolation": "repeatable_read", "readonly": True}]
+    assert client.app.state.db_pool.acquired == 0
+
+
+class BusyPool:
+    async def acquire(self, timeout=None):
+        raise asyncio.TimeoutError
+
+
+def test_busy_pool_is_a_503_before_streaming():
+    client = make_client(CursorConnection(NOTES))
+    client.app.state.db_pool = BusyPool()
+
+    response = client.get("/notes/export")
+
+    assert response.status_code == 503
+    assert "content-disposition" not in response.headers
+
+
+def test_gzipped_csv_export():
+    client = make_client(CursorConnection(NOTES), roles=(RoleEnum.ADMIN,))
+
+    response = client.get("/notes/export", params={"format": "csv", "gzip": "true"})
+
+    assert response.headers["content-type"] == "application/gzip"
+    assert 'filename="notes.csv.gz"' in response.headers["content-disposition"]
+    records = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode())))
+    assert [record["title"] for record in records] == ["note, 1", "note, 2", "note, 3"]
+    assert records[0]["description"] == 'says "hi"'
+
+
+def test_export_is_sent_in_chunks():
+    async def rows():
+        for i in range(EXPORT_CHUNK_ROWS * 2 + 1):
+            yield {"id": i}
+
+    async def collect():
+        return [chunk async for chunk in encode_export(rows(), ["id"], "ndjson")]
+
+    chunks = asyncio.run(collect())
+
+    assert len(chunks) == 3
+    assert b"".join(chunks).count(b"\n") == EXPORT_CHUNK_ROWS * 2 + 1
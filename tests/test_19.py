@@ -0,0 +1,102 @@
+import io
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes.notes import todo_router
+from app.api.schemas.models import RoleEnum, UserRole
+from app.database.database import get_db_connection
+from app.helpers.note_import import NoteImport
+from app.security.security import get_current_user_with_roles
+
+
+class CopyConnection:
+    """Stands in for the DB connection and keeps the COPYed batches"""
+
+    def __init__(self):
+        self.batches = []
+        self.in_transaction = False
+
+    @asynccontextmanager
+    async def transaction(self, **kwargs):
+        self.in_transaction = True
+        yield
+        self.in_transaction = False
+
+    async def copy_records_to_table(self, table_name, records, columns):
+        assert self.in_transaction
+        self.batches.append((table_name, list(records), columns))
+
+
+def make_client(db, roles=(RoleEnum.USER,)):
+    app = FastAPI()
+    app.include_router(todo_router)
+    app.dependency_overrides[get_db_connection] = lambda: db
+    app.dependency_overrides[get_current_user_with_roles] = lambda: UserRole(
+        user_id=7, roles=list(roles)
+    )
+    return TestClient(app)
+
+
+def read_all(note_import: NoteImport, size: int):
+    batches = []
+    while batch := note_import.next_batch(size):
+        batches.append(batch)
+    return batches
+
+
+def test_ndjson_rows_are_validated_and_batched():
+    lines = [
+        '{"title": "a", "description": "x", "id": 1}',
+        "",
+        "{not json",
+        '["a list"]',
+        '{"title": "' + "t" * 256 + '"}',
+        '{"title": "b"}',
+        '{"title": "c"}',
+    ]
+    note_import = NoteImport(io.BytesIO("\n".join(lines).encode()), "ndjson")
+
+    batches = read_all(note_import, size=2)
+
+    assert batches == [[("a", "x"), ("b", "")], [("c", "")]]
+    assert note_import.rejected == 3
+    assert [error.line for error in note_import.errors] == [3, 4, 5]
+    assert note_import.errors[0].error.startswith("invalid JSON")
+    assert note_import.errors[2].error.startswith("title: String should have at most 255")
+
+
+def test_csv_import_is_copied_for_the_caller():
+    db = CopyConnection()
+    client = make_client(db)
+    data = '\ufefftitle,description\n"multi\nline",d\nok,"' + "d" * 501 + '"\n'
+
+    response = client.post(
+        "/notes/import",
+        params={"user_id": 8},  # Ignored for non-admins
+        files={"file": ("notes.csv", data.encode(), "text/csv")},
+    )
+
+    assert response.json() == {
+        "imported": 1,
+        "rejected": 1,
+        "errors": [
+            {"line": 4, "error": "description: String should have at most 500 characters"}
+        ],
+    }
+    assert db.batches == [
+        ("things_to_do", [("multi\nline", "d", 7)], ["title", "description", "user_id"])
+    ]
+
+
+def test_invalid_encoding_is_rejected():
+    db = CopyConnection()
+    client = make_client(db, roles=(RoleEnum.ADMIN,))
+
+    response = client.post(
+        "/notes/import", files={"file": ("notes.ndjson", b'{"title": "\xff"}\n')}
+    )
+
+    assert response.status_code == 400
+    assert db.batches == []
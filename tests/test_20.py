@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from app.api.schemas.models import RoleEnum
+from app.database.repositories.user_repository import UserRepository
+
+
+class QueryLog:
+    """Stands in for the DB connection and keeps the statements it was given"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def fetch(self, query, *args):
+        self.calls.append((" ".join(query.split()), args))
+        return []
+
+
+def users_page(**kwargs):
+    db = QueryLog()
+    asyncio.run(UserRepository(db).get_users_page(51, **kwargs))
+    return db.calls[0]
+
+
+def test_first_page_is_an_id_range():
+    query, args = users_page()
+
+    assert args == (51, 0)
+    assert "WHERE users.id > $2 ORDER BY users.id LIMIT $1" in query
+
+
+def test_search_escapes_like_wildcards():
+    query, args = users_page(after=100, search="50%_off\\")
+
+    assert args == (51, 100, "%50\\%\\_off\\\\%")
+    assert "username ILIKE $3" in query
+    assert "email ILIKE $3 OR full_name ILIKE $3" in query
+
+
+def test_role_filter_reads_the_role_index_in_id_order():
+    query, args = users_page(after=7, role=RoleEnum.MODERATOR)
+
+    assert args == (51, 7, "moderator")
+    assert "WHERE user_role = $3::role_enum AND user_id > $2" in query
+
+
+def test_search_shorter_than_a_trigram_is_rejected():
+    with pytest.raises(ValueError):
+        users_page(search="ab")
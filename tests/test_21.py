@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.common.loader import DataLoader
+from app.database.database import QueryCountMiddleware, get_db_connection
+from app.database.loaders import RequestLoaders
+
+
+class RolesDB:
+    """Stands in for the DB connection; fails if two statements overlap"""
+
+    def __init__(self):
+        self.statements = []
+        self.busy = False
+
+    async def _run(self, kind, args):
+        assert not self.busy, "concurrent statements on one connection"
+        self.busy = True
+        self.statements.append((kind, args))
+        await asyncio.sleep(0)
+        self.busy = False
+
+    async def fetchrow(self, query, *args):
+        await self._run("fetchrow", args)
+        if "user_roles" in query:
+            return {"user_id": args[0], "roles": ["user"]}
+        return {"user_id": args[0], "username": f"user{args[0]}"}
+
+    async def fetch(self, query, *args):
+        await self._run("fetch", args)
+        if "user_roles" in query:
+            return [{"user_id": user_id, "roles": ["user"]} for user_id in args[0]]
+        return [{"user_id": user_id, "username": f"user{user_id}"} for user_id in args[0]]
+
+
+def test_loads_in_one_tick_are_batched_and_deduplicated():
+    batches = []
+
+    async def batch_load(keys):
+        batches.append(keys)
+        return {key: key * 10 for key in keys if key != 3}
+
+    async def scenario():
+        loader = DataLoader(batch_load)
+        first = await loader.load_many([1, 2, 2, 3])
+        again = await loader.load(2)
+        return first, again
+
+    first, again = asyncio.run(scenario())
+
+    assert first == [10, 20, 20, None]
+    assert again == 20
+    assert batches == [[1, 2, 3]]
+
+
+def test_failed_loads_are_not_memoized():
+    calls = 0
+
+    async def batch_load(keys):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise ConnectionError("db down")
+        return {key: "ok" for key in keys}
+
+    async def scenario():
+        loader = DataLoader(batch_load)
+        with pytest.raises(ConnectionError):
+            await loader.load("a")
+        return await loader.load("a")
+
+    assert asyncio.run(scenario()) == "ok"
+
+
+def test_request_loaders_share_the_connection_in_turn():
+    db = RolesDB()
+
+    async def scenario():
+        loaders = RequestLoaders(db)
+        return await asyncio.gather(
+            loaders.user_roles.load_many([101, 102, 101]),
+            loaders.user_profiles.load_many([201, 202]),
+            loaders.user_roles.load(101),
+        )
+
+    roles, profiles, same_roles = asyncio.run(scenario())
+
+    assert [role.user_id for role in roles] == [101, 102, 101]
+    assert same_roles is roles[0]
+    assert [profile["username"] for profile in profiles] == ["user201", "user202"]
+    assert sorted(db.statements) == [("fetch", ([101, 102],)), ("fetch", ([201, 202],))]
+
+
+def test_query_count_header():
+    class Pool:
+        async def acquire(self, timeout=None):
+            return RolesDB()
+
+        async def release(self, conn):
+            pass
+
+    app = FastAPI()
+    app.state.db_pool = Pool()
+    app.add_middleware(QueryCountMiddleware)
+
+    @app.get("/twice")
+    async def twice(db=Depends(get_db_connection)):
+        await db.fetchrow("SELECT user_roles", 1)
+        await db.fetch("SELECT user_roles", [1, 2])
+        return {}
+
+    @app.get("/none")
+    async def none(db=Depends(get_db_connection)):
+        return {}
+
+    client = TestClient(app)
+
+    assert client.get("/twice").headers["x-db-query-count"] == "2"
+    assert client.get("/none").headers["x-db-query-count"] == "0"
@@ -0,0 +1,136 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.database.database import LazyConnection, run_concurrently
+
+
+class SlowConnection:
+    """Stands in for a pooled asyncpg connection; every statement takes `delay`"""
+
+    def __init__(self, pool, delay):
+        self.pool = pool
+        self.delay = delay
+        self.statements = []
+        self.transactions = []
+
+    async def fetchval(self, query, *args):
+        self.statements.append(query)
+        await asyncio.sleep(self.delay)
+        if "1/0" in query:
+            raise ZeroDivisionError
+        if "pg_export_snapshot" in query:
+            return "00000003-0000001B-1"
+        return len(self.statements)
+
+    async def execute(self, query, *args):
+        self.statements.append(query)
+
+    @asynccontextmanager
+    async def transaction(self, **kwargs):
+        self.transactions.append(kwargs)
+        yield
+
+
+class Pool:
+    def __init__(self, delay=0.0, max_size=10):
+        self.delay = delay
+        self.max_size = max_size
+        self.connections = []
+        self.checked_out = 0
+
+    def get_size(self):
+        return self.checked_out
+
+    def get_max_size(self):
+        return self.max_size
+
+    def get_idle_size(self):
+        return 0
+
+    async def acquire(self, timeout=None):
+        self.checked_out += 1
+        conn = SlowConnection(self, self.delay)
+        self.connections.append(conn)
+        return conn
+
+    async def release(self, conn):
+        self.checked_out -= 1
+
+
+def test_reads_run_side_by_side_on_their_own_connections():
+    pool = Pool(delay=0.05)
+    db = LazyConnection(pool)
+
+    async def scenario():
+        started = time.perf_counter()
+        results = await run_concurrently(
+            db, *(lambda conn, i=i: conn.fetchval(f"SELECT {i}") for i in range(3))
+        )
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(scenario())
+
+    assert results == [1, 1, 1]
+    assert elapsed < 0.1
+    assert len(pool.connections) == 3
+    assert pool.checked_out == 1  # Only db itself, until the request ends
+    assert db.query_count == 3
+
+
+def test_failing_read_cancels_the_others():
+    pool = Pool(delay=0.05)
+    db = LazyConnection(pool)
+
+    async def scenario():
+        await run_concurrently(
+            db,
+            lambda conn: conn.fetchval("SELECT 1/0"),
+            lambda conn: asyncio.sleep(10),
+        )
+
+    started = time.perf_counter()
+    with pytest.raises(ZeroDivisionError):
+        asyncio.run(scenario())
+
+    assert time.perf_counter() - started < 1
+    assert pool.checked_out == 1
+
+
+def test_snapshot_is_shared():
+    pool = Pool()
+    db = LazyConnection(pool)
+
+    asyncio.run(
+        run_concurrently(
+            db,
+            lambda conn: conn.fetchval("SELECT 1"),
+            lambda conn: conn.fetchval("SELECT 2"),
+            snapshot=True,
+        )
+    )
+
+    own, other = pool.connections
+    read_only = {"isolation": "repeatable_read", "readonly": True}
+    assert own.transactions == other.transactions == [read_only]
+    assert own.statements == ["SELECT pg_export_snapshot()", "SELECT 1"]
+    assert other.statements == ["SET TRANSACTION SNAPSHOT '00000003-0000001B-1'", "SELECT 2"]
+
+
+def test_full_pool_runs_the_reads_on_db_instead_of_waiting():
+    pool = Pool(max_size=1)
+    db = LazyConnection(pool)
+
+    results = asyncio.run(
+        run_concurrently(
+            db,
+            lambda conn: conn.fetchval("SELECT 1"),
+            lambda conn: conn.fetchval("SELECT 2"),
+        )
+    )
+
+    assert results == [1, 2]
+    assert len(pool.connections) == 1  # db's own, the second read waited for it
+    assert pool.connections[0].statements == ["SELECT 1", "SELECT 2"]
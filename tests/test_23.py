@@ -0,0 +1,84 @@
+import re
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+from fastapi.testclient import TestClient
+
+from app.api.routes.notes import todo_router
+from app.api.schemas.models import RoleEnum, UserRole
+from app.common.templates import FRONTEND_DIR
+from app.database.database import get_db_connection
+from app.security.security import get_current_user_with_roles
+
+NOTES = [
+    {
+        "id": note_id,
+        "title": f"note {note_id}",
+        "description": "<b>d</b>",
+        "user_id": 7,
+        "completed": False,
+        "created_at": datetime(2025, 1, 1),
+        "completed_at": None,
+    }
+    for note_id in range(5, 0, -1)
+]
+
+
+class RequestDB:
+    """Stands in for the request-scoped connection: profile, rollup total and the page"""
+
+    def __init__(self, notes=NOTES):
+        self.notes = notes
+        self.page_args = []
+        self.released = False
+
+    async def fetchrow(self, query, *args):
+        return {"user_id": args[0], "username": "alice", "full_name": None, "email": None}
+
+    async def fetchval(self, query, *args):
+        return len(self.notes)
+
+    async def fetch(self, query, user_id, limit, before=None):
+        self.page_args.append((limit, before))
+        rows = [note for note in self.notes if before is None or note["id"] < before]
+        return rows[:limit]
+
+    async def release(self):
+        self.released = True
+
+
+def make_client(db):
+    app = FastAPI()
+    app.mount("/static", StaticFiles(directory=FRONTEND_DIR / "static"), name="static")
+    app.include_router(todo_router)
+    app.dependency_overrides[get_db_connection] = lambda: db
+    app.dependency_overrides[get_current_user_with_roles] = lambda: UserRole(
+        user_id=7, roles=[RoleEnum.USER]
+    )
+    return TestClient(app)
+
+
+def test_my_notes_pages_through_keyset():
+    db = RequestDB()
+    client = make_client(db)
+
+    first = client.get("/notes/my_notes", params={"limit": 2})
+    last = client.get("/notes/my_notes", params={"limit": 2, "before": 2})
+
+    assert 'alice (<span id="note-total">5</span>)' in first.text
+    assert "note 5" in first.text and "note 4" in first.text and "note 3" not in first.text
+    assert "&lt;b&gt;d&lt;/b&gt;" in first.text  # Still autoescaped
+    assert 'href="/notes/my_notes?before=4&limit=2"' in first.text
+    assert "note 1" in last.text and "Older notes" not in last.text
+    assert db.page_args == [(3, None), (3, 2)]
+    assert db.released  # Given back before the page is rendered
+
+
+def test_empty_list_keeps_the_create_form_and_a_table_for_htmx():
+    response = make_client(RequestDB(notes=[])).get("/notes/my_notes")
+
+    assert 'hx-post="/notes/create_note" hx-target="tbody" hx-swap="afterbegin"' in response.text
+    assert "<tbody>" in response.text
+    assert re.search(r'<p id="no-notes"[^>]*>\s*You don’t have any notes yet', response.text)
+    assert 'integrity="sha384-' in response.text
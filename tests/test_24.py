@@ -0,0 +1,120 @@
+import re
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes.notes import todo_router
+from app.api.schemas.models import RoleEnum, UserRole
+from app.database.database import get_db_connection
+from app.security.security import get_current_user_with_roles
+
+HTMX = {"HX-Request": "true"}
+
+
+def note_row(owner_id=7, **changes):
+    return {
+        "allowed": True,
+        "owner_id": owner_id,
+        "id": 5,
+        "title": "<i>t</i>",
+        "description": "d",
+        "user_id": owner_id,
+        "completed": False,
+        "created_at": datetime(2025, 1, 1, 12, 30),
+        "completed_at": None,
+        "was_completed": False,
+        "completion_changed": False,
+        **changes,
+    }
+
+
+class ActionDB:
+    """Stands in for the DB connection: one written row, and the owner's note total"""
+
+    def __init__(self, row, total=41):
+        self.row = row
+        self.total = total
+        self.queries = []
+
+    async def fetchrow(self, query, *args):
+        self.queries.append("fetchrow")
+        return self.row
+
+    async def fetchval(self, query, *args):
+        self.queries.append("fetchval")
+        return self.total
+
+
+def make_client(db, roles=(RoleEnum.USER,)):
+    app = FastAPI()
+    app.include_router(todo_router)
+    app.dependency_overrides[get_db_connection] = lambda: db
+    app.dependency_overrides[get_current_user_with_roles] = lambda: UserRole(
+        user_id=7, roles=list(roles)
+    )
+    return TestClient(app, follow_redirects=False)
+
+
+def test_complete_answers_htmx_with_the_row():
+    db = ActionDB(note_row(completed=True, completed_at=datetime(2025, 1, 2)))
+    client = make_client(db)
+
+    response = client.post("/notes/complete/5", headers=HTMX)
+
+    assert response.status_code == 200
+    assert response.headers["vary"] == "HX-Request"
+    assert response.text.strip().startswith('<tr id="note-5">')
+    assert "&lt;i&gt;t&lt;/i&gt;" in response.text
+    assert "disabled" in response.text
+    assert "note-total" not in response.text  # Completing doesn't change the count
+    assert db.queries == ["fetchrow"]
+
+
+def test_delete_answers_htmx_with_an_empty_row_and_the_new_total():
+    db = ActionDB(note_row())
+
+    response = make_client(db).post("/notes/delete/5", headers=HTMX)
+
+    assert "<tr" not in response.text
+    assert '<span id="note-total" hx-swap-oob="true">41</span>' in response.text
+    assert re.search(r'<p id="no-notes"[^>]*hx-swap-oob="true"\s+hidden', response.text)
+
+
+def test_deleting_the_last_note_shows_the_empty_state():
+    db = ActionDB(note_row(), total=0)
+
+    response = make_client(db).post("/notes/delete/5", headers=HTMX)
+
+    empty_state = re.search(r'<p id="no-notes"[^>]*>', response.text).group()
+    assert 'hx-swap-oob="true"' in empty_state and "hidden" not in empty_state
+
+
+def test_admin_deleting_someone_elses_note_leaves_their_own_total():
+    db = ActionDB(note_row(owner_id=8))
+
+    response = make_client(db, roles=[RoleEnum.ADMIN]).post("/notes/delete/5", headers=HTMX)
+
+    assert response.text.strip() == ""
+    assert db.queries == ["fetchrow"]
+
+
+def test_create_answers_htmx_with_the_new_row():
+    db = ActionDB(note_row(id=6))
+
+    response = make_client(db).post(
+        "/notes/create_note", data={"title": "t", "description": "d"}, headers=HTMX
+    )
+
+    assert '<tr id="note-6">' in response.text
+    assert 'hx-swap-oob="true">41<' in response.text
+    assert re.search(r'<p id="no-notes"[^>]*hidden', response.text)  # No longer empty
+
+
+def test_plain_form_posts_still_redirect():
+    client = make_client(ActionDB(note_row()))
+
+    for path in ("/notes/complete/5", "/notes/delete/5"):
+        response = client.post(path)
+        assert response.status_code == 302
+        assert response.headers["location"] == "/notes/my_notes"
@@ -0,0 +1,163 @@
+"""
+Owner-scoped note access: the `allowed` flag computed by NoteRepository.*_for_user and
+the 404/403 answers the note routes derive from it with check_note_access.
+
+The repository cases run the real statements against EXPLAIN_DATABASE_URL (see test_12)
+inside a transaction that is rolled back; without it only the route cases run.
+"""
+
+import asyncio
+import os
+from datetime import datetime
+
+import asyncpg
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes.notes import todo_router
+from app.api.schemas.models import RoleEnum, UserRole
+from app.common.invalidation import invalidate_table
+from app.database.database import get_db_connection
+from app.database.repositories.note_repository import NoteRepository
+from app.security.security import get_current_user_with_roles
+
+DATABASE_URL = os.getenv("EXPLAIN_DATABASE_URL")
+OWNER, OTHER = 2_000_001, 2_000_002
+
+# name: (repository call, whether the note was changed by it)
+ACTIONS = {
+    "get": (lambda repo, note_id, user_id, admin: repo.get_note_for_user(note_id, user_id, admin), None),
+    "update": (
+        lambda repo, note_id, user_id, admin: repo.update_note_for_user(
+            note_id, user_id, admin, "renamed", "d", False
+        ),
+        "SELECT title = 'renamed' FROM things_to_do WHERE id = $1",
+    ),
+    "complete": (
+        lambda repo, note_id, user_id, admin: repo.complete_note_for_user(note_id, user_id, admin),
+        "SELECT completed FROM things_to_do WHERE id = $1",
+    ),
+    "delete": (
+        lambda repo, note_id, user_id, admin: repo.delete_note_for_user(note_id, user_id, admin),
+        "SELECT NOT EXISTS (SELECT FROM things_to_do WHERE id = $1)",
+    ),
+}
+PRINCIPALS = {"owner": (OWNER, False), "non-owner": (OTHER, False), "admin": (OTHER, True)}
+
+
+def run_against_seeded_note(scenario):
+    async def run():
+        conn = await asyncpg.connect(DATABASE_URL)
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            await conn.execute(
+                "INSERT INTO users (id, username, hashed_password) VALUES ($1, 'acl_owner', 'x'), ($2, 'acl_other', 'x')",
+                OWNER,
+                OTHER,
+            )
+            note_id = await conn.fetchval(
+                "INSERT INTO things_to_do (title, description, user_id) VALUES ('t', 'd', $1) RETURNING id",
+                OWNER,
+            )
+            return await scenario(conn, note_id)
+        finally:
+            await transaction.rollback()
+            await conn.close()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.skipif(DATABASE_URL is None, reason="EXPLAIN_DATABASE_URL is not set")
+@pytest.mark.parametrize("principal", PRINCIPALS)
+@pytest.mark.parametrize("action", ACTIONS)
+def test_statement_applies_only_when_allowed(action, principal):
+    call, changed_query = ACTIONS[action]
+    user_id, admin = PRINCIPALS[principal]
+
+    async def scenario(conn, note_id):
+        row = await call(NoteRepository(conn), note_id, user_id, admin)
+        changed = await conn.fetchval(changed_query, note_id) if changed_query else None
+        return row, changed
+
+    row, changed = run_against_seeded_note(scenario)
+
+    allowed = principal != "non-owner"
+    assert row["allowed"] is allowed
+    if changed_query:
+        assert changed is allowed
+
+
+@pytest.mark.skipif(DATABASE_URL is None, reason="EXPLAIN_DATABASE_URL is not set")
+@pytest.mark.parametrize("action", ACTIONS)
+def test_missing_note_is_none(action):
+    call, _ = ACTIONS[action]
+
+    async def scenario(conn, note_id):
+        return await call(NoteRepository(conn), note_id + 1_000_000, OWNER, True)
+
+    assert run_against_seeded_note(scenario) is None
+
+
+class OwnedNotes:
+    """Stands in for the DB connection, answering *_for_user calls like their SQL does"""
+
+    def __init__(self):
+        self.notes = {5: 7}  # note id: owner id
+
+    async def fetchrow(self, query, note_id, user_id, any_owner, *args):
+        owner_id = self.notes.get(note_id)
+        if owner_id is None:
+            return None
+        return {
+            "allowed": owner_id == user_id or any_owner,
+            "owner_id": owner_id,
+            "id": note_id,
+            "title": "t",
+            "description": "d",
+            "user_id": owner_id,
+            "completed": False,
+            "created_at": datetime(2025, 1, 1),
+            "completed_at": None,
+            "was_completed": False,
+            "completion_changed": False,
+        }
+
+
+ROUTES = {
+    "get": ("GET", "/notes/get_note/{note_id}", 200),
+    "update": ("PUT", "/notes/update_note/{note_id}", 200),
+    "complete": ("POST", "/notes/complete/{note_id}", 302),
+    "delete": ("POST", "/notes/delete/{note_id}", 302),
+}
+ROUTE_USERS = {
+    "owner": UserRole(user_id=7, roles=[RoleEnum.USER]),
+    "non-owner": UserRole(user_id=8, roles=[RoleEnum.USER]),
+    "admin": UserRole(user_id=8, roles=[RoleEnum.ADMIN]),
+}
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    # /notes/get_note responses are cached per process
+    asyncio.run(invalidate_table("things_to_do", [7, 8]))
+
+
+@pytest.mark.parametrize(
+    "principal, note_id, expected",
+    [("owner", 5, None), ("non-owner", 5, 403), ("admin", 5, None), ("owner", 6, 404)],
+)
+@pytest.mark.parametrize("action", ROUTES)
+def test_route_answers(action, principal, note_id, expected):
+    method, path, success = ROUTES[action]
+    app = FastAPI()
+    app.include_router(todo_router)
+    app.dependency_overrides[get_db_connection] = OwnedNotes
+    app.dependency_overrides[get_current_user_with_roles] = lambda: ROUTE_USERS[principal]
+    client = TestClient(app, follow_redirects=False)
+
+    body = {"title": "t", "description": "d", "completed": False} if method == "PUT" else None
+    response = client.request(method, path.format(note_id=note_id), json=body)
+
+    assert response.status_code == (expected or success)
@@ -0,0 +1,67 @@
+"""
+NoteRepository.search_notes against the real statement: ordering by ts_rank_cd plus
+title similarity before LIMIT, and HTML-safe snippets.
+
+Runs against EXPLAIN_DATABASE_URL (see test_12) inside a transaction that is rolled back.
+"""
+
+import asyncio
+import os
+
+import asyncpg
+import pytest
+
+from app.database.repositories.note_repository import NoteRepository
+
+DATABASE_URL = os.getenv("EXPLAIN_DATABASE_URL")
+OWNER = 2_000_011
+
+pytestmark = pytest.mark.skipif(DATABASE_URL is None, reason="EXPLAIN_DATABASE_URL is not set")
+
+
+def search_seeded_notes(notes, text, limit, needs_trigrams=False):
+    async def run():
+        conn = await asyncpg.connect(DATABASE_URL)
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            if needs_trigrams and not await conn.fetchval(
+                "SELECT EXISTS (SELECT FROM pg_extension WHERE extname = 'pg_trgm')"
+            ):
+                pytest.skip("pg_trgm is not installed")
+            await conn.execute(
+                "INSERT INTO users (id, username, hashed_password) VALUES ($1, 'search_owner', 'x')",
+                OWNER,
+            )
+            await conn.executemany(
+                "INSERT INTO things_to_do (title, description, user_id) VALUES ($1, $2, $3)",
+                [(title, description, OWNER) for title, description in notes],
+            )
+            return await NoteRepository(conn).search_notes(text, OWNER, limit)
+        finally:
+            await transaction.rollback()
+            await conn.close()
+
+    return asyncio.run(run())
+
+
+def test_close_title_outranks_more_description_matches_before_the_limit():
+    notes = [
+        ("weekly groceries", "apple, more apple and apple pie"),
+        ("apple", "something else"),
+    ]
+
+    rows = search_seeded_notes(notes, "apple", limit=1, needs_trigrams=True)
+
+    assert [row["title"] for row in rows] == ["apple"]
+
+
+def test_snippet_escapes_the_description():
+    notes = [("fruit", """apple <script>alert('x')</script> & "pear" apple""")]
+
+    [row] = search_seeded_notes(notes, "apple", limit=5)
+
+    assert "<mark>apple</mark>" in row["snippet"]
+    assert "&lt;script&gt;" in row["snippet"]
+    assert "<script>" not in row["snippet"]
+    assert row["snippet"].replace("<mark>", "").replace("</mark>", "").count("<") == 0
@@ -0,0 +1,92 @@
+"""
+Sharded global rollups: note writes spread the user_id 0 rows of note_rollups and
+note_hourly_rollups over slots, NoteRepository.get_analytics sums them back.
+
+Runs against EXPLAIN_DATABASE_URL (see test_12) inside a transaction that is rolled back.
+"""
+
+import asyncio
+import os
+
+import asyncpg
+import pytest
+
+from app.database.repositories.note_repository import NoteRepository
+
+DATABASE_URL = os.getenv("EXPLAIN_DATABASE_URL")
+OWNER = 2_000_021
+
+pytestmark = pytest.mark.skipif(DATABASE_URL is None, reason="EXPLAIN_DATABASE_URL is not set")
+
+
+def in_rolled_back_transaction(scenario):
+    async def run():
+        conn = await asyncpg.connect(DATABASE_URL)
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            return await scenario(conn)
+        finally:
+            await transaction.rollback()
+            await conn.close()
+
+    return asyncio.run(run())
+
+
+def test_global_analytics_sum_every_slot():
+    async def scenario(conn):
+        repo = NoteRepository(conn)
+        before, _ = await repo.get_analytics()
+        # Rows another writer left in other slots, on top of whatever is there already
+        await conn.execute(
+            """
+            INSERT INTO note_rollups AS r (user_id, slot, total, completed)
+            SELECT 0, slot, 2, 1 FROM generate_series(0, 15) AS slot
+            ON CONFLICT (user_id, slot) DO UPDATE SET
+                total = r.total + 2, completed = r.completed + 1
+            """
+        )
+        after, _ = await repo.get_analytics()
+        return before, after
+
+    before, after = in_rolled_back_transaction(scenario)
+
+    before_total = before["total"] if before else 0
+    before_completed = before["completed"] if before else 0
+    assert after["total"] == before_total + 32
+    assert after["completed"] == before_completed + 16
+
+
+def test_note_writes_reach_the_global_and_user_rollups():
+    async def scenario(conn):
+        repo = NoteRepository(conn)
+        before, before_hourly = await repo.get_analytics()
+        await conn.execute(
+            "INSERT INTO users (id, username, hashed_password) VALUES ($1, 'rollup_owner', 'x')",
+            OWNER,
+        )
+        await conn.execute(
+            """
+            INSERT INTO things_to_do (title, description, user_id, created_at)
+            VALUES ('a', 'b', $1, '2025-01-05 10:00'), ('c', 'd', $1, '2025-01-05 10:30')
+            """,
+            OWNER,
+        )
+        after, after_hourly = await repo.get_analytics()
+        return (
+            (before["total"] if before else 0, dict(before_hourly)),
+            (after["total"], dict(after_hourly)),
+            await repo.get_analytics(OWNER),
+            await repo.get_note_total(OWNER),
+        )
+
+    (before_total, before_hourly), (after_total, after_hourly), own, own_total = (
+        in_rolled_back_transaction(scenario)
+    )
+
+    sunday_10 = 10  # 2025-01-05 is a Sunday
+    assert after_total == before_total + 2
+    assert after_hourly[sunday_10] == before_hourly.get(sunday_10, 0) + 2
+    totals, hourly = own
+    assert totals["total"] == own_total == 2
+    assert [tuple(row) for row in hourly] == [(sunday_10, 2)]
@@ -0,0 +1,43 @@
+import asyncio
+
+from app.database.database import LazyConnection
+
+
+class FakePool:
+    def __init__(self):
+        self.acquired = 0
+        self.released = 0
+
+    async def acquire(self, timeout=None):
+        self.acquired += 1
+        return FakeConnection()
+
+    async def release(self, conn):
+        self.released += 1
+
+
+class FakeConnection:
+    async def fetchval(self, query, *args):
+        return 1
+
+
+def test_lazy_connection_without_queries_never_acquires():
+    pool = FakePool()
+    db = LazyConnection(pool)
+    asyncio.run(db.release())
+    assert pool.acquired == 0
+    assert pool.released == 0
+
+
+def test_lazy_connection_acquires_once_and_releases():
+    pool = FakePool()
+    db = LazyConnection(pool)
+
+    async def run():
+        assert await db.fetchval("SELECT 1") == 1
+        assert await db.fetchval("SELECT 1") == 1
+        await db.release()
+
+    asyncio.run(run())
+    assert pool.acquired == 1
+    assert pool.released == 1
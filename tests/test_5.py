@@ -0,0 +1,47 @@
+import asyncio
+import threading
+from contextlib import suppress
+
+import pytest
+from fastapi import HTTPException
+
+from app.security import security
+
+
+def test_password_hash_roundtrip_in_pool():
+    async def run():
+        hashed = await security.get_password_hash_async("sokol")
+        return await security.verify_password_async("sokol", hashed)
+
+    assert asyncio.run(run()) is True
+
+
+def test_hashing_pool_rejects_when_saturated(monkeypatch):
+    monkeypatch.setattr(security, "_hashing_in_flight", 10**6)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(security.verify_password_async("sokol", "hash"))
+    assert exc_info.value.status_code == 503
+
+
+def test_cancelled_caller_keeps_the_slot_until_the_hash_is_done():
+    started, finish = threading.Event(), threading.Event()
+
+    def slow_hash():
+        started.set()
+        finish.wait(5)
+
+    async def run():
+        task = asyncio.ensure_future(security._run_hashing(slow_hash))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()  # E.g. the client disconnected
+        with suppress(asyncio.CancelledError):
+            await task
+        while_running = security._hashing_in_flight
+        finish.set()
+        for _ in range(100):
+            if security._hashing_in_flight == 0:
+                break
+            await asyncio.sleep(0.01)
+        return while_running, security._hashing_in_flight
+
+    assert asyncio.run(run()) == (1, 0)
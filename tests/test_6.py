@@ -0,0 +1,109 @@
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from redis.exceptions import RedisError
+
+from app.api.routes.users import users_router
+from app.api.schemas.models import RoleEnum, UserRole
+from app.database.database import get_db_connection
+from app.security.role_epochs import ROLE_EPOCH_KEY
+from app.security.security import (
+    create_jwt_token,
+    get_current_user_with_roles,
+    get_password_hash,
+)
+
+
+class RolesFromDB:
+    """Stands in for the DB connection and counts role lookups"""
+
+    def __init__(self):
+        self.queries = 0
+
+    async def fetchrow(self, query, *args):
+        self.queries += 1
+        return {"user_id": args[0], "roles": ["user"]}
+
+
+def make_client(redis, db):
+    app = FastAPI()
+    app.state.redis = redis
+
+    @app.get("/me")
+    async def me(current_user: UserRole = Depends(get_current_user_with_roles)):
+        return current_user
+
+    app.dependency_overrides[get_db_connection] = lambda: db
+    return TestClient(app)
+
+
+def test_token_roles_trusted_while_epoch_is_current(fake_redis):
+    redis, db = fake_redis, RolesFromDB()
+    redis.data[ROLE_EPOCH_KEY.format(user_id=7)] = "e1"
+    token = create_jwt_token({"sub": "7"}, roles=[RoleEnum.ADMIN], epoch="e1")
+
+    response = make_client(redis, db).get("/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["roles"] == ["admin"]
+    assert db.queries == 0
+
+
+def test_role_change_falls_back_to_db(fake_redis):
+    redis, db = fake_redis, RolesFromDB()
+    redis.data[ROLE_EPOCH_KEY.format(user_id=7)] = "e2"  # bumped after the token was issued
+    token = create_jwt_token({"sub": "7"}, roles=[RoleEnum.ADMIN], epoch="e1")
+
+    response = make_client(redis, db).get("/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["roles"] == ["user"]
+    assert db.queries == 1
+
+
+class DemotedDuringLogin:
+    """Stands in for the DB connection; an admin demotes the user right after log_in reads the roles"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.roles = ["admin"]
+
+    async def fetchrow(self, query, *args):
+        if "hashed_password" in query:
+            return {"id": 7, "hashed_password": get_password_hash("secret")}
+        roles, self.roles = self.roles, ["user"]
+        self.redis.data[ROLE_EPOCH_KEY.format(user_id=7)] = "after-demotion"
+        return {"user_id": args[0], "roles": roles}
+
+
+def test_role_change_during_login_makes_the_new_token_stale(fake_redis):
+    db = DemotedDuringLogin(fake_redis)
+    client = make_client(fake_redis, db)
+    client.app.include_router(users_router)
+
+    login = client.post(
+        "/users/log_in", data={"username": "u", "password": "secret"}, follow_redirects=False
+    )
+    token = login.cookies["access_token"]
+
+    response = client.get("/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["roles"] == ["user"]
+
+
+class RedisDown:
+    async def set(self, *args, **kwargs):
+        raise RedisError("connection refused")
+
+
+class RemovesRole:
+    async def execute(self, query, *args):
+        return "DELETE 1"
+
+
+def test_role_removal_fails_loudly_when_the_epoch_cannot_be_bumped():
+    client = make_client(RedisDown(), RemovesRole())
+    client.app.include_router(users_router)
+    client.app.dependency_overrides[get_current_user_with_roles] = lambda: UserRole(
+        user_id=1, roles=[RoleEnum.ADMIN]
+    )
+
+    response = client.post(
+        "/users/7/roles/remove", data={"role": "admin"}, follow_redirects=False
+    )
+
+    assert response.status_code == 503
@@ -0,0 +1,181 @@
+import asyncio
+import datetime
+
+import jwt
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes.users import users_router
+from app.api.schemas.models import RoleEnum, UserRole
+from app.database.database import get_db_connection
+from app.security.app_cookies import AuthCookieMiddleware
+from app.security.refresh_tokens import (
+    REVOKE_USER_SCRIPT,
+    ROTATE_SCRIPT,
+    issue_refresh_token,
+    revoke_user_refresh_tokens,
+    rotate_refresh_token,
+)
+from app.security.role_epochs import ROLE_EPOCH_KEY
+from app.security.security import (
+    ALGORITHM,
+    SECRET_KEY,
+    create_jwt_token,
+    get_current_user_with_roles,
+    get_password_hash,
+)
+
+
+async def fake_rotate_script(redis, keys, args):
+    """Mimics ROTATE_SCRIPT (the fake runs it in one step, like Redis would)"""
+    token_key, rotated_key, new_key = keys
+    digest, new_digest, ttl, grace, sealed, user_prefix, rotated_user_prefix = args
+    user_id = redis.data.pop(token_key, None)
+    if user_id is None:
+        rotated = redis.data.get(rotated_key)
+        return None if rotated is None else [0, rotated]
+    await redis.srem(user_prefix + user_id, digest)
+    await redis.set(new_key, user_id, ex=ttl)
+    await redis.sadd(user_prefix + user_id, new_digest)
+    await redis.set(rotated_key, f"{user_id}:{sealed}", ex=grace)
+    await redis.sadd(rotated_user_prefix + user_id, digest)
+    return [1, user_id]
+
+
+async def fake_revoke_user_script(redis, keys, args):
+    """Mimics REVOKE_USER_SCRIPT"""
+    for user_key, prefix in zip(keys, args, strict=True):
+        await redis.delete(*(prefix + digest for digest in await redis.smembers(user_key)))
+    return await redis.delete(*keys)
+
+
+@pytest.fixture
+def redis(fake_redis):
+    fake_redis.scripts[ROTATE_SCRIPT] = fake_rotate_script
+    fake_redis.scripts[REVOKE_USER_SCRIPT] = fake_revoke_user_script
+    return fake_redis
+
+
+class RolesFromDB:
+    async def fetchrow(self, query, *args):
+        return {"user_id": args[0], "roles": ["user"]}
+
+
+class DemotedWhileReadingRoles:
+    """Stands in for the DB connection; an admin demotes the user right after the roles are read"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.roles = ["admin"]
+
+    async def fetchrow(self, query, *args):
+        if "hashed_password" in query:
+            return {"username": "u", "hashed_password": get_password_hash("old-secret")}
+        roles, self.roles = self.roles, ["user"]
+        self.redis.data[ROLE_EPOCH_KEY.format(user_id=7)] = "after-demotion"
+        return {"user_id": args[0], "roles": roles}
+
+    async def execute(self, query, *args):
+        return "UPDATE 1"
+
+
+def make_client(redis, db):
+    app = FastAPI()
+    app.state.redis = redis
+    app.add_middleware(AuthCookieMiddleware)
+    app.dependency_overrides[get_db_connection] = lambda: db
+
+    @app.get("/me")
+    async def me(current_user: UserRole = Depends(get_current_user_with_roles)):
+        return current_user
+
+    return TestClient(app)
+
+
+def roles_of(client, access_token):
+    """Roles the app grants a request carrying access_token"""
+    client.cookies.clear()
+    response = client.get("/me", headers={"Authorization": f"Bearer {access_token}"})
+    return response.json()["roles"]
+
+
+def test_refresh_token_is_single_use(redis):
+    async def run():
+        token = await issue_refresh_token(redis, 7)
+        user_id, new_token = await rotate_refresh_token(redis, token)
+        redis.data = {k: v for k, v in redis.data.items() if "rotated" not in k}  # grace period is over
+        return user_id, new_token, await rotate_refresh_token(redis, token)
+
+    user_id, new_token, reused = asyncio.run(run())
+    assert user_id == 7
+    assert new_token
+    assert reused is None
+
+
+def test_racing_rotation_gets_the_same_sealed_replacement(redis):
+    async def run():
+        token = await issue_refresh_token(redis, 7)
+        return await rotate_refresh_token(redis, token), await rotate_refresh_token(redis, token)
+
+    winner, loser = asyncio.run(run())
+
+    assert winner == loser
+    assert not any(winner[1] in str(value) for value in redis.data.values())
+
+
+def test_revoking_a_user_also_drops_tokens_in_their_grace_period(redis):
+    async def run():
+        token = await issue_refresh_token(redis, 7)
+        _, new_token = await rotate_refresh_token(redis, token)
+        await revoke_user_refresh_tokens(redis, 7)
+        return await rotate_refresh_token(redis, token), await rotate_refresh_token(redis, new_token)
+
+    assert asyncio.run(run()) == (None, None)
+    assert redis.data == {}
+
+
+def test_expired_access_token_is_reissued_from_refresh_token(redis):
+    refresh_token = asyncio.run(issue_refresh_token(redis, 7))
+    expired = jwt.encode(
+        {"sub": "7", "exp": datetime.datetime.now(datetime.UTC) - datetime.timedelta(minutes=1)},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+
+    client = make_client(redis, RolesFromDB())
+    client.cookies.update({"access_token": expired, "refresh_token": refresh_token})
+    response = client.get("/me")
+
+    assert response.json()["user_id"] == 7
+    set_cookies = response.headers.get_list("set-cookie")
+    assert any(cookie.startswith("access_token=") for cookie in set_cookies)
+    assert any(cookie.startswith("refresh_token=") for cookie in set_cookies)
+
+
+def test_role_change_during_refresh_makes_the_new_token_stale(redis):
+    refresh_token = asyncio.run(issue_refresh_token(redis, 7))
+    client = make_client(redis, DemotedWhileReadingRoles(redis))
+
+    client.cookies.update({"refresh_token": refresh_token})
+    refreshed = client.get("/me")
+    assert refreshed.json()["roles"] == ["admin"]  # Read before the demotion
+
+    assert roles_of(client, refreshed.cookies["access_token"]) == ["user"]
+
+
+def test_role_change_during_password_change_makes_the_new_token_stale(redis):
+    client = make_client(redis, DemotedWhileReadingRoles(redis))
+    client.app.include_router(users_router)
+    redis.data[ROLE_EPOCH_KEY.format(user_id=7)] = "before-demotion"
+    token = create_jwt_token({"sub": "7"}, roles=[RoleEnum.ADMIN], epoch="before-demotion")
+
+    changed = client.post(
+        "/users/change_password",
+        data={"old_password": "old-secret", "new_password": "new-secret"},
+        headers={"Authorization": f"Bearer {token}"},
+        follow_redirects=False,
+    )
+
+    assert changed.status_code == 302
+    assert roles_of(client, changed.cookies["access_token"]) == ["user"]
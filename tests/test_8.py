@@ -0,0 +1,44 @@
+import jwt
+import pytest
+
+from app.common import lru
+from app.common.lru import TTLCache
+from app.security import security
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_entry_expires(monkeypatch):
+    cache = TTLCache(maxsize=10)
+    cache.set("a", 1, expires_at=1000)
+    monkeypatch.setattr(lru.time, "time", lambda: 999)
+    assert cache.get("a") == 1
+    monkeypatch.setattr(lru.time, "time", lambda: 1000)
+    assert cache.get("a") is None
+
+
+def test_decoded_token_is_cached_until_expiry():
+    security.token_cache.clear()
+    token = security.create_jwt_token({"sub": "7"})
+    hits = security.token_cache.hits
+
+    assert security.decode_jwt_token(token)["sub"] == "7"
+    assert security.decode_jwt_token(token)["sub"] == "7"
+    assert security.token_cache.hits == hits + 1
+
+
+def test_expired_token_is_rejected_and_not_cached():
+    security.token_cache.clear()
+    token = jwt.encode({"sub": "7", "exp": 1000}, security.SECRET_KEY, algorithm=security.ALGORITHM)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        security.decode_jwt_token(token)
+    assert len(security.token_cache) == 0
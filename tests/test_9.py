@@ -0,0 +1,59 @@
+import asyncio
+
+from starlette.requests import Request
+
+from app.security.client_ip import get_client_ip
+from app.security.login_throttle import (
+    IP_FAILURES_KEY,
+    LOGIN_FAILURE_WINDOW_SECONDS,
+    MAX_FAILURES_PER_USERNAME,
+    claim_login_attempt,
+    reset_login_failures,
+)
+
+
+def test_login_is_throttled_after_repeated_failures(fake_redis):
+    redis = fake_redis
+
+    async def run():
+        for _ in range(MAX_FAILURES_PER_USERNAME):
+            assert await claim_login_attempt(redis, "admin", "10.0.0.1") is None
+        at_limit = await claim_login_attempt(redis, "admin", "10.0.0.2")
+        await reset_login_failures(redis, "admin", "10.0.0.2")
+        after_reset = await claim_login_attempt(redis, "admin", "10.0.0.2")
+        return at_limit, after_reset
+
+    at_limit, after_reset = asyncio.run(run())
+    assert at_limit == LOGIN_FAILURE_WINDOW_SECONDS  # The fake has no expiry
+    assert after_reset is None
+    assert redis.data[IP_FAILURES_KEY.format(ip="10.0.0.1")] == str(MAX_FAILURES_PER_USERNAME)
+    # The successful attempt was taken back, the one after the reset still counts
+    assert redis.data[IP_FAILURES_KEY.format(ip="10.0.0.2")] == "1"
+
+
+def test_concurrent_attempts_cannot_all_pass_the_check(fake_redis):
+    async def attempt():
+        retry_after = await claim_login_attempt(fake_redis, "admin", "10.0.0.1")
+        await asyncio.sleep(0)  # Password hash in the executor
+        return retry_after is None
+
+    async def run():
+        return await asyncio.gather(*(attempt() for _ in range(3 * MAX_FAILURES_PER_USERNAME)))
+
+    assert sum(asyncio.run(run())) == MAX_FAILURES_PER_USERNAME
+
+
+def test_login_throttle_fails_open_without_redis():
+    assert asyncio.run(claim_login_attempt(None, "admin", "10.0.0.1")) is None
+
+
+def test_client_ip_ignores_forwarded_for():
+    request = Request(
+        {
+            "type": "http",
+            "headers": [(b"x-forwarded-for", b"1.2.3.4")],
+            "client": ("10.0.0.9", 5000),
+        }
+    )
+
+    assert get_client_ip(request) == "10.0.0.9"